@@ -1,27 +1,95 @@
 import json
 import os
-from typing import Generator, List, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterable, Callable, Generator, List, Optional, Tuple
 
-import faiss
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+from models.adaptiveAnswer import astream_adaptive_answer
+from models.answerCache import AnswerCache, answer_scope
+from models.contextBuilder import build_context
+from models.concurrency import InflightLimiter, MicroBatcher, run_blocking
+from models.courseRegistry import DEFAULT_COURSE, check_course_id, course_topic, get_course_registry
+from models.feedbackQueue import FeedbackWorkers, get_feedback_queue
+from models.integrityGuard import get_integrity_guard, integrity_response
+from models.llm import LLMUnavailable, get_async_client, provider, token_stats
+from models.metrics import MetricsMiddleware, annotate, metrics, span
+from models.profiler import PROFILE_TOKEN, ProfilingMiddleware, check_token, get_profiler, profiling_enabled
+from models.studentModel import get_misconceptions_async
+from models.teacherAnalytics import STATUSES, get_topic_summary, query_at_risk
+from models.startup import WARMUP_ENABLED, Warmup
+from models.topicMapper import TOPIC_FALLBACK
+from models.llm_model import embed_queries, get_model, query_cache
+from models.retrieval import RETRIEVAL_MODES, retrieve_ids_batch
+
+# Backpressure: beyond MAX_INFLIGHT_LLM concurrent generations a request waits
+# up to LLM_QUEUE_TIMEOUT seconds for a slot, then gets a 503.
+MAX_INFLIGHT_LLM = int(os.getenv("MAX_INFLIGHT_LLM", 32))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 5))
+
+# Concurrent /chat queries arriving within MICRO_BATCH_WAIT_MS of each other
+# are embedded and searched as one batch (at most MICRO_BATCH_MAX queries).
+MICRO_BATCH_MAX = int(os.getenv("MICRO_BATCH_MAX", 32))
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", 2))
+
+# Upper bound on queries per /retrieve call
+RETRIEVE_MAX_QUERIES = int(os.getenv("RETRIEVE_MAX_QUERIES", 256))
+
+llm_limiter = InflightLimiter(MAX_INFLIGHT_LLM, LLM_QUEUE_TIMEOUT)
+answer_cache = AnswerCache()
+courses = get_course_registry()
+integrity_guard = get_integrity_guard()
+
+
+def warm_vector_db():
+    # Only the default course; the others load on their first request
+    if courses.get(DEFAULT_COURSE) is None:
+        raise RuntimeError("Vector DB not found. Run ingestion.py first.")
+
+
+def warm_integrity_policy():
+    # Builds the default course's phrase automaton, and embeds its intent
+    # examples when INTEGRITY_INTENT is on
+    integrity_guard.policy(DEFAULT_COURSE)
+
+
+def warm_embedding_model():
+    # A throwaway encode pages in the weights and tokenizer; it bypasses the
+    # query cache so no fake entry is kept.
+    get_model().encode(["warmup"], normalize_embeddings=True)
+
+
+warmup = Warmup(
+    [
+        ("embedding_model", warm_embedding_model),
+        ("vector_db", warm_vector_db),
+        ("integrity_policy", warm_integrity_policy),
+        ("llm_client", get_async_client),
+    ]
+    if WARMUP_ENABLED
+    else []
+)
+
 
-from models.adaptiveAnswer import generate_adaptive_answer
-from models.integrityGuard import integrity_response, violates_integrity
-from models.studentModel import get_misconceptions
-from models.topicMapper import extract_topic
-from models.llm_model import get_model
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background so the port opens (and /health answers)
+    # right away instead of after the model load.
+    warmup.start()
+    feedback_workers.start()
+    courses.start_watching()
+    yield
+    await run_blocking(courses.stop_watching)
+    await run_blocking(feedback_workers.stop)
+    await warmup.stop()
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-VECTOR_DB_PATH = os.path.join(BASE_DIR, "vector_db")
-INDEX_PATH = os.path.join(VECTOR_DB_PATH, "index.faiss")
-DOC_PATH = os.path.join(VECTOR_DB_PATH, "documents.pkl")
 
-app = FastAPI(title="Academic Agent API")
+app = FastAPI(title="Academic Agent API", lifespan=lifespan)
 
 # Configure CORS for development and production
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "").split(",") if os.getenv("CORS_ORIGINS") else [
@@ -38,6 +106,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if profiling_enabled():
+    # Inside MetricsMiddleware, so the profile id lands in the trace log
+    app.add_middleware(ProfilingMiddleware)
+    if PROFILE_TOKEN is None:
+        print("PROFILE_SAMPLE_RATE is set without PROFILE_TOKEN: requests are sampled, "
+              "but /admin/profiles refuses every request until PROFILE_TOKEN is set.")
+app.add_middleware(MetricsMiddleware)
 
 
 class Message(BaseModel):
@@ -48,52 +123,224 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[Message]
     mode: Optional[str] = None
+    student_id: str = Field("web", min_length=1, max_length=128)
+    course_id: Optional[str] = None
 
 
-def load_vector_db():
-    if not os.path.exists(INDEX_PATH) or not os.path.exists(DOC_PATH):
-        return None, None
-
-    index = faiss.read_index(INDEX_PATH)
-
-    with open(DOC_PATH, "rb") as f:
-        documents = json.load(f) if DOC_PATH.endswith(".json") else None
-
-    if documents is None:
-        import pickle
-
-        with open(DOC_PATH, "rb") as f:
-            documents = pickle.load(f)
-
-    return index, documents
-
-
-_index = None
-_documents = None
+class FeedbackRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    answer: str = Field(..., min_length=1)
+    understood: bool
+    student_id: str = Field("web", min_length=1, max_length=128)
+    course_id: Optional[str] = None
+    topic: Optional[str] = None
+    # Idempotency key; defaults to a hash of student, question, answer and verdict
+    feedback_id: Optional[str] = Field(None, max_length=128)
 
-def get_vector_db():
-    global _index, _documents
-    if _index is None or _documents is None:
-        _index, _documents = load_vector_db()
-    return _index, _documents
 
-def retrieve_context(query: str, top_k: int = 3) -> List[str]:
-    index, documents = get_vector_db()
-    model = get_model()
-    
-    if index is None or documents is None:
-        return []
-
-    query_embedding = model.encode([query], normalize_embeddings=True)
-    query_embedding = np.array(query_embedding).astype("float32")
-
-    distances, indices = index.search(query_embedding, top_k)
+class RetrieveRequest(BaseModel):
+    queries: List[str]
+    top_k: int = Field(3, ge=1, le=50)
+    mode: Optional[str] = None
+    course_id: Optional[str] = None
+
+
+@asynccontextmanager
+async def using_course(course_id: Optional[str]):
+    # Holds the course's current snapshot for the block; a snapshot swapped
+    # out meanwhile is closed only after the block ends. A loaded course is
+    # handed out without a hop to the CPU pool.
+    course_id = course_id or DEFAULT_COURSE
+    try:
+        course = await courses.acquire_async(course_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    if course is None:
+        if course_id == DEFAULT_COURSE:
+            raise HTTPException(status_code=400, detail="Vector DB not found. Run ingestion.py first.")
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown course {course_id!r}. Run ingestion.py --course {course_id} first.",
+        )
+    try:
+        yield course
+    finally:
+        course.release()
+
+
+def retrieve_chunks_batch(
+    queries: List[str],
+    top_k: int = 3,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    query_embeddings: Optional[np.ndarray] = None,
+    mode: Optional[str] = None,
+    course=None,
+) -> List[List[Tuple[int, str]]]:
+    if course is None:
+        # The default course, held for the search and the text lookups so a
+        # swap can't close its chunk store underneath them
+        course = courses.acquire(DEFAULT_COURSE)
+        if course is None:
+            return [[] for _ in queries]
+        try:
+            return retrieve_chunks_batch(queries, top_k, nprobe, ef_search, query_embeddings, mode, course)
+        finally:
+            course.release()
+
+    if query_embeddings is None:
+        query_embeddings = embed_queries(queries)
+
+    documents = course.documents
+    batch_ids = retrieve_ids_batch(
+        course.index, documents, course.keywords, queries, query_embeddings, top_k, nprobe, ef_search, mode
+    )
+
+    return [[(chunk_id, documents.text(chunk_id)) for chunk_id in ids] for ids in batch_ids]
+
+
+def retrieve_chunks(
+    query: str,
+    top_k: int = 3,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    query_embedding: Optional[np.ndarray] = None,
+    course=None,
+) -> List[Tuple[int, str]]:
+    return retrieve_chunks_batch([query], top_k, nprobe, ef_search, query_embedding, course=course)[0]
+
+
+def retrieve_context(query: str, top_k: int = 3, **kwargs) -> List[str]:
+    return [text for _, text in retrieve_chunks(query, top_k, **kwargs)]
+
+
+def embed_and_retrieve(items: List[Tuple[object, str]]) -> List[Tuple[np.ndarray, List[Tuple[int, str]], str]]:
+    # Batch function behind retrieval_batcher, over (course, query) items:
+    # one encode of the cache misses for the whole batch, then one index
+    # search and one topic matmul per course in it.
+    query_embeddings = embed_queries([query for _, query in items])
+
+    rows_by_course = {}
+    for row, (course, _) in enumerate(items):
+        rows_by_course.setdefault(course, []).append(row)
+
+    results = [None] * len(items)
+    for course, rows in rows_by_course.items():
+        embeddings = query_embeddings[rows]
+        batch = retrieve_chunks_batch(
+            [items[row][1] for row in rows], query_embeddings=embeddings, course=course
+        )
+        with span("topic_classify"):
+            topics = course.topics.classify(embeddings, top_k=1)
+        for row, chunks, match in zip(rows, batch, topics):
+            results[row] = (query_embeddings[row:row + 1], chunks, course.topic(match.topic))
+    return results
 
-    results = []
-    for idx in indices[0]:
-        results.append(documents[idx]["text"])
 
-    return results
+retrieval_batcher = MicroBatcher(embed_and_retrieve, MICRO_BATCH_MAX, MICRO_BATCH_WAIT_MS / 1000)
+
+
+def resolve_feedback(items: List[Tuple[Optional[str], str]]) -> List[Tuple[str, List[str]]]:
+    # Topic and context for queued (course_id, question) feedback, looked up
+    # by the workers rather than while the student waits
+    resolved = [None] * len(items)
+    found, rows = [], []
+    held = {}
+    try:
+        for row, (course_id, question) in enumerate(items):
+            course_id = course_id or DEFAULT_COURSE
+            if course_id not in held:
+                held[course_id] = courses.acquire(course_id)
+            course = held[course_id]
+            if course is None:
+                # The course's vector DB is gone; the feedback still counts
+                resolved[row] = (course_topic(course_id, TOPIC_FALLBACK), [])
+            else:
+                found.append((course, question))
+                rows.append(row)
+
+        for row, (_, chunks, topic) in zip(rows, embed_and_retrieve(found) if found else []):
+            resolved[row] = (topic, [text for _, text in chunks])
+    finally:
+        for course in held.values():
+            if course is not None:
+                course.release()
+    return resolved
+
+
+feedback_workers = FeedbackWorkers(get_feedback_queue(), resolve_feedback)
+
+
+for name, kind, help_text in (
+    ("chat_total", "counter", "Chat requests by outcome: answered, cached, integrity, busy or llm_unavailable."),
+    ("integrity_flagged_total", "counter", "Chat requests refused by the integrity check, by phrase or by intent."),
+    ("cache_hits_total", "counter", "Cache hits by cache."),
+    ("cache_misses_total", "counter", "Cache misses by cache."),
+    ("llm_inflight", "gauge", "Generations holding an LLM slot."),
+    ("llm_waiting", "gauge", "Requests waiting for an LLM slot."),
+    ("llm_rejected_total", "counter", "Requests turned away with a 503 because no LLM slot freed up."),
+    ("llm_first_token_seconds", "histogram", "Time to the first streamed token, per model and attempt."),
+    ("llm_duration_seconds", "histogram", "Time from request to the end of the stream, per model."),
+    ("llm_attempts_total", "counter", "Completion attempts per model."),
+    ("llm_failures_total", "counter", "Failed completion attempts per model and kind."),
+    ("llm_breaker_open", "gauge", "1 while a model's circuit breaker is open."),
+    ("llm_unavailable_total", "counter", "Calls that no model answered."),
+    ("retrieval_batches_total", "counter", "Micro-batches of /chat retrievals."),
+    ("retrieval_batch_items_total", "counter", "Queries in those micro-batches."),
+    ("courses_loaded", "gauge", "Course vector DBs in memory."),
+    ("courses_loaded_bytes", "gauge", "On-disk footprint of the loaded course vector DBs."),
+    ("course_loads_total", "counter", "Course vector DB loads."),
+    ("course_evictions_total", "counter", "Course vector DBs evicted from the LRU."),
+    ("course_reloads_total", "counter", "Newly published snapshots swapped in."),
+    ("feedback_jobs_total", "counter", "Feedback jobs processed by this process's workers."),
+    ("feedback_errors_total", "counter", "Feedback batches that failed."),
+    ("feedback_lag_seconds", "histogram", "Time from enqueueing feedback to applying it."),
+    ("feedback_queue_depth", "gauge", "Feedback jobs pending or running, across processes."),
+):
+    metrics.describe(name, kind, help_text)
+
+
+def collect_service_metrics():
+    # Read when /metrics is scraped, from the counters each component keeps
+    for cache, stats in (("answer", answer_cache.stats()), ("embedding", query_cache.stats())):
+        yield "cache_hits_total", {"cache": cache}, stats["hits"]
+        yield "cache_misses_total", {"cache": cache}, stats["misses"]
+
+    yield "llm_inflight", {}, llm_limiter.inflight
+    yield "llm_waiting", {}, llm_limiter.waiting
+    yield "llm_rejected_total", {}, llm_limiter.rejected
+
+    yield "llm_unavailable_total", {}, provider.unavailable
+    for model, breaker in list(provider.breakers.items()):
+        yield "llm_breaker_open", {"model": model}, int(breaker.state == "open")
+    for model, stats in list(provider.model_stats.items()):
+        yield "llm_first_token_seconds", {"model": model}, stats.first_token
+        yield "llm_duration_seconds", {"model": model}, stats.duration
+        yield "llm_attempts_total", {"model": model}, stats.attempts
+        for kind, count in list(stats.failures.items()):
+            yield "llm_failures_total", {"model": model, "kind": kind}, count
+
+    yield "retrieval_batches_total", {}, retrieval_batcher.batches
+    yield "retrieval_batch_items_total", {}, retrieval_batcher.items
+
+    loaded = courses.stats()
+    yield "courses_loaded", {}, loaded["loaded"]
+    yield "courses_loaded_bytes", {}, int(loaded["mb"] * 2**20)
+    yield "course_loads_total", {}, loaded["loads"]
+    yield "course_evictions_total", {}, loaded["evictions"]
+    yield "course_reloads_total", {}, loaded["reloads"]
+
+    for check, count in integrity_guard.stats()["flagged"].items():
+        yield "integrity_flagged_total", {"check": check}, count
+
+    yield "feedback_jobs_total", {}, feedback_workers.jobs
+    yield "feedback_errors_total", {}, feedback_workers.errors
+    yield "feedback_lag_seconds", {}, feedback_workers.lag
+    yield "feedback_queue_depth", {}, feedback_workers.queue.stats()["depth"]
+
+
+metrics.add_collector(collect_service_metrics)
 
 
 def iter_chunks(text: str, size: int = 80) -> Generator[str, None, None]:
@@ -104,47 +351,319 @@ def iter_chunks(text: str, size: int = 80) -> Generator[str, None, None]:
         start += size
 
 
-def sse_stream(text: str) -> Generator[str, None, None]:
+async def aiter_chunks(text: str) -> AsyncGenerator[str, None]:
     for chunk in iter_chunks(text):
-        payload = {"choices": [{"delta": {"content": chunk}}]}
-        yield f"data: {json.dumps(payload)}\n\n"
-    yield "data: [DONE]\n\n"
+        yield chunk
+
+
+async def record_answer(deltas: AsyncIterable[str], on_complete: Callable[[str], None]) -> AsyncGenerator[str, None]:
+    # Only a fully streamed answer is handed to on_complete; one cut short by
+    # a disconnect or an upstream error is never cached.
+    parts = []
+    try:
+        async for chunk in deltas:
+            parts.append(chunk)
+            yield chunk
+    finally:
+        aclose = getattr(deltas, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    on_complete("".join(parts))
+
+
+async def sse_stream(deltas: AsyncIterable[str], slot=None) -> AsyncGenerator[str, None]:
+    # Starlette cancels this generator when the client disconnects; closing
+    # the source then aborts the upstream LLM request instead of draining it.
+    try:
+        with span("stream"):
+            async for chunk in deltas:
+                payload = {"choices": [{"delta": {"content": chunk}}]}
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+    finally:
+        aclose = getattr(deltas, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if slot is not None:
+            slot.release()
 
 
 @app.get("/health")
-def health():
-    index, documents = get_vector_db()
+async def health():
+    # Liveness only: never triggers a load, so it answers during warmup.
     return {
         "ok": True,
-        "vector_db_ready": bool(index and documents),
+        "vector_db_ready": courses.peek(DEFAULT_COURSE) is not None,
+        "llm": llm_limiter.stats(),
+        "embedding_cache": query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "retrieval_batcher": retrieval_batcher.stats(),
+        "prompt_tokens": token_stats.stats(),
+        "llm_provider": provider.stats(),
+        "courses": courses.stats(),
+        "integrity": integrity_guard.stats(),
+        "feedback": {
+            "queue": await run_blocking(feedback_workers.queue.stats),
+            "workers": feedback_workers.stats(),
+        },
     }
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text format; rendered off the event loop because the
+    # feedback queue depth is a database query
+    return PlainTextResponse(
+        await run_blocking(metrics.render),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def require_profile_token(token: Optional[str]):
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is off. Set PROFILE_TOKEN to enable it.")
+    if not check_token(token):
+        raise HTTPException(status_code=403, detail="Missing or wrong X-Profile-Token.")
+
+
+@app.get("/admin/profiles")
+async def list_profiles(limit: int = Query(20, ge=1, le=200), x_profile_token: Optional[str] = Header(None)):
+    require_profile_token(x_profile_token)
+    return {"profiles": await run_blocking(get_profiler().recent, limit)}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("folded", pattern="^(folded|summary)$"),
+    x_profile_token: Optional[str] = Header(None),
+):
+    # folded: collapsed stacks for flamegraph.pl / speedscope; summary: top functions
+    require_profile_token(x_profile_token)
+    path = get_profiler().path(profile_id, ".folded" if format == "folded" else ".json")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Unknown profile id.")
+    with open(path, "r") as f:
+        content = f.read()
+    if format == "summary":
+        return JSONResponse(json.loads(content))
+    return PlainTextResponse(content)
+
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.report())
+
+
+@app.get("/teacher/at-risk")
+async def teacher_at_risk(
+    topic: Optional[str] = None,
+    status: Optional[str] = None,
+    min_severity: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {sorted(STATUSES)}")
+
+    try:
+        return await run_blocking(query_at_risk, topic, status, min_severity, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+@app.get("/teacher/topics")
+async def teacher_topics():
+    return await run_blocking(get_topic_summary)
+
+
+@app.get("/topics")
+async def topics(course_id: Optional[str] = None):
+    async with using_course(course_id) as course:
+        classifier = course.topics
+    return {
+        "course_id": course.course_id,
+        "origin": classifier.taxonomy.meta.get("origin"),
+        "topics": [
+            {key: topic.get(key) for key in ("id", "name", "parent", "source", "keywords", "size", "pages")}
+            for topic in classifier.taxonomy.topics
+        ],
+    }
+
+
+@app.post("/feedback", status_code=202)
+async def feedback(req: FeedbackRequest):
+    # Misconception detection and the mastery update run on the feedback
+    # workers; this only records the job.
+    course_id = req.course_id or DEFAULT_COURSE
+    try:
+        check_course_id(course_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    key, created = await run_blocking(
+        feedback_workers.queue.enqueue,
+        req.student_id,
+        req.question,
+        req.answer,
+        req.understood,
+        # Ids from GET /topics are the course's own; stored course-scoped
+        topic=course_topic(course_id, req.topic),
+        key=req.feedback_id,
+        course_id=course_id,
+    )
+    if created:
+        feedback_workers.notify()
+    return {"id": key, "status": "queued" if created else "duplicate"}
+
+
+@app.get("/feedback/{feedback_id}")
+async def feedback_status(feedback_id: str):
+    job = await run_blocking(feedback_workers.queue.get, feedback_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown feedback id.")
+    return job.to_dict()
+
+
+@app.post("/retrieve")
+async def retrieve(req: RetrieveRequest):
+    # Batch retrieval for offline evaluation and analytics; no LLM involved.
+    if len(req.queries) > RETRIEVE_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {RETRIEVE_MAX_QUERIES} queries per request.")
+    if req.mode is not None and req.mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(RETRIEVAL_MODES)}")
+
+    async with using_course(req.course_id) as course:
+        if not req.queries:
+            return {"results": []}
+
+        documents = course.documents
+        batch = await run_blocking(retrieve_chunks_batch, req.queries, req.top_k, mode=req.mode, course=course)
+        return {
+            "results": [
+                {
+                    "query": query,
+                    "chunks": [
+                        {
+                            "id": chunk_id,
+                            "source": documents.source(chunk_id),
+                            "page": documents.page(chunk_id),
+                            "text": text,
+                        }
+                        for chunk_id, text in chunks
+                    ],
+                }
+                for query, chunks in zip(req.queries, batch)
+            ]
+        }
+
+
 @app.post("/chat")
-def chat(req: ChatRequest):
-    index, documents = get_vector_db()
-    if index is None or documents is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Vector DB not found. Run ingestion.py first.",
-        )
+async def chat(req: ChatRequest):
+    # The snapshot is only read before the answer starts streaming, so it
+    # is released as soon as the response is returned
+    async with using_course(req.course_id) as course:
+        return await answer_chat(req, course)
 
+
+def chat_outcome(outcome):
+    metrics.inc("chat_total", outcome=outcome)
+    annotate(outcome=outcome)
+
+
+def refuse_for_integrity(check):
+    integrity_guard.record(check)
+    chat_outcome("integrity")
+    annotate(integrity=check)
+    return StreamingResponse(
+        sse_stream(aiter_chunks(integrity_response())),
+        media_type="text/event-stream",
+    )
+
+
+async def answer_chat(req: ChatRequest, course):
     user_message = next((m.content for m in reversed(req.messages) if m.role == "user"), "")
     if not user_message:
         raise HTTPException(status_code=400, detail="No user message provided.")
-
-    if violates_integrity(user_message):
-        return StreamingResponse(
-            sse_stream(integrity_response()),
-            media_type="text/event-stream",
+    annotate(course_id=course.course_id)
+
+    # Phrases first, in one pass over the question; the intent check needs
+    # the query embedding, so it waits for retrieval
+    policy = await integrity_guard.policy_async(course.course_id)
+    with span("integrity"):
+        phrase = policy.match(user_message)
+    if phrase is not None:
+        return refuse_for_integrity("pattern")
+
+    # Embedded, searched and mapped to a topic in one batch with concurrent
+    # requests
+    with span("retrieve"):
+        query_embedding, chunks, topic = await retrieval_batcher.submit((course, user_message))
+    with span("integrity_intent"):
+        intent = policy.intent_score(query_embedding)
+    if intent is not None:
+        annotate(intent_score=round(intent, 4))
+        return refuse_for_integrity("intent")
+    with span("misconceptions"):
+        misconceptions = await get_misconceptions_async(req.student_id, topic)
+    context_ids = [chunk_id for chunk_id, _ in chunks]
+    annotate(topic=topic)
+
+    scope = (course.course_id, course.version, answer_scope(req.student_id, misconceptions))
+    with span("answer_cache"):
+        cached = answer_cache.lookup(query_embedding, context_ids, scope)
+    if cached is not None:
+        chat_outcome("cached")
+        return StreamingResponse(sse_stream(aiter_chunks(cached)), media_type="text/event-stream")
+
+    with span("llm_queue"):
+        slot = await llm_limiter.acquire()
+    if slot is None:
+        chat_outcome("busy")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Tutor is busy, please retry shortly."},
+            headers={"Retry-After": "2"},
         )
 
-    topic = extract_topic(user_message)
-    misconceptions = get_misconceptions("web", topic)
-    context = retrieve_context(user_message)
-    answer = generate_adaptive_answer(context, user_message, misconceptions)
-
-    return StreamingResponse(sse_stream(answer), media_type="text/event-stream")
+    # Merged, deduplicated and cut to the token budgets
+    with span("context"):
+        assembled = build_context(chunks, course.documents, misconceptions)
+
+    try:
+        # The provider returns once the first token is in
+        with span("llm_first_token"):
+            answer = await astream_adaptive_answer(assembled.passages, user_message, assembled.misconceptions)
+    except LLMUnavailable as exc:
+        slot.release()
+        chat_outcome("llm_unavailable")
+        # Into the request's trace line rather than stdout, which an outage
+        # with the breaker open would flood
+        annotate(llm_error=str(exc))
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Tutor is unavailable right now, please retry shortly."},
+            headers={"Retry-After": "5"},
+        )
+    except BaseException:
+        slot.release()
+        raise
+    prompt_tokens = answer.prompt_tokens
+    chat_outcome("answered")
+    annotate(prompt_tokens=prompt_tokens)
+
+    # The background task only matters if the stream never starts (client
+    # gone before the first byte); release() is idempotent otherwise.
+    answer = record_answer(
+        answer,
+        lambda text: answer_cache.store(query_embedding, context_ids, scope, text),
+    )
+    return StreamingResponse(
+        sse_stream(answer, slot),
+        media_type="text/event-stream",
+        headers={"X-Prompt-Tokens": str(prompt_tokens)},
+        background=BackgroundTask(slot.release),
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,105 @@
+"""Recall@k versus latency of the ANN index types against exact search.
+
+Builds every index type from models/vectorIndex.py over synthetic clustered,
+L2-normalised corpora and sweeps the query-time knobs:
+
+    python benchmarks/bench_ann.py --sizes 20000 100000 --dim 256
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.vectorIndex import INDEX_TYPES, build_index, search
+
+
+def synthetic_corpus(n_vectors, dimension, n_queries, seed=0):
+    # Topic-like clusters make the problem realistic for IVF/HNSW
+    rng = np.random.default_rng(seed)
+    n_clusters = max(8, int(np.sqrt(n_vectors)))
+    centers = rng.standard_normal((n_clusters, dimension)).astype("float32")
+    assignment = rng.integers(0, n_clusters, n_vectors)
+    corpus = centers[assignment] + 0.6 * rng.standard_normal((n_vectors, dimension)).astype("float32")
+    faiss.normalize_L2(corpus)
+
+    picks = rng.integers(0, n_vectors, n_queries)
+    queries = corpus[picks] + 0.2 * rng.standard_normal((n_queries, dimension)).astype("float32")
+    faiss.normalize_L2(queries)
+    return corpus, queries
+
+
+def recall_at_k(truth, found):
+    hits = sum(len(set(t) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def time_queries(index, queries, top_k, **knobs):
+    latencies = []
+    found = []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = search(index, q[None, :], top_k, **knobs)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    return np.array(found), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall@k vs latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20_000, 100_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+
+    build_threads = faiss.omp_get_max_threads()
+
+    print(f"{'n':>8} {'type':>7} {'knob':>14} {'build s':>8} {'MB':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+
+    for n_vectors in args.sizes:
+        corpus, queries = synthetic_corpus(n_vectors, args.dim, args.queries)
+
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(corpus)
+        _, truth = exact.search(queries, args.k)
+
+        for index_type in args.types:
+            faiss.omp_set_num_threads(build_threads)
+            start = time.perf_counter()
+            index = build_index(corpus, index_type)
+            build_s = time.perf_counter() - start
+            # Time queries single-threaded to isolate per-request cost
+            faiss.omp_set_num_threads(1)
+            size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+            if index_type in ("ivf", "ivfpq"):
+                sweeps = [("nprobe", v) for v in args.nprobe]
+            elif index_type in ("hnsw", "hnswpq"):
+                sweeps = [("ef_search", v) for v in args.ef_search]
+            else:
+                sweeps = [(None, None)]
+
+            for knob, value in sweeps:
+                knobs = {knob: value} if knob else {}
+                found, latencies = time_queries(index, queries, args.k, **knobs)
+                latencies.sort()
+                label = f"{knob}={value}" if knob else "-"
+                print(
+                    f"{n_vectors:>8} {index_type:>7} {label:>14} {build_s:>8.2f} {size_mb:>8.1f} "
+                    f"{recall_at_k(truth, found):>9.3f} {statistics.median(latencies) * 1000:>8.3f} "
+                    f"{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>8.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Startup time, RSS and lookup latency: documents.pkl versus the mmap chunk store.
+
+Writes a synthetic corpus in both formats, then measures each in a fresh
+subprocess (so RSS reflects only that format) and, optionally, with several
+concurrent reader processes to show mmap page sharing:
+
+    python benchmarks/bench_chunk_store.py --chunks 200000 --readers 4
+"""
+
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+WORDS = (
+    "disk sector track cylinder platter head seek latency block address "
+    "controller cache buffer scheduling rotation transfer logical physical"
+).split()
+
+
+def synthetic_chunks(n_chunks, seed=0):
+    rng = random.Random(seed)
+    for i in range(n_chunks):
+        yield i, {
+            "text": " ".join(rng.choice(WORDS) for _ in range(60)),
+            "source": f"course/unit{i % 50}.pdf",
+            "page": 1 + i % 30,
+        }
+
+
+def rss_mb(field="VmRSS"):
+    # RssAnon is private memory; mmap'd pages show up in RssFile and are
+    # shared between every worker mapping the same store.
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def reader(fmt, path, n_lookups):
+    # Runs in a subprocess: load, then do random id lookups like retrieve_context
+    from models.chunkStore import ChunkStore
+
+    base_rss = rss_mb()
+    base_anon = rss_mb("RssAnon")
+    start = time.perf_counter()
+
+    if fmt == "pickle":
+        with open(path, "rb") as f:
+            documents = pickle.load(f)
+        lookup = lambda i: documents[i]["text"]
+        n = len(documents)
+    else:
+        documents = ChunkStore(path)
+        lookup = documents.text
+        n = len(documents)
+
+    load_s = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    rng = random.Random(1)
+    ids = [rng.randrange(n) for _ in range(n_lookups)]
+    start = time.perf_counter()
+    for i in ids:
+        lookup(i)
+    lookup_us = (time.perf_counter() - start) / n_lookups * 1e6
+
+    print(json.dumps({
+        "load_ms": round(load_s * 1000, 1),
+        "rss_delta_mb": round(loaded_rss - base_rss, 1),
+        "rss_after_lookups_mb": round(rss_mb() - base_rss, 1),
+        "private_mb": round(rss_mb("RssAnon") - base_anon, 1),
+        "lookup_us": round(lookup_us, 2),
+    }))
+
+
+def run_readers(fmt, path, n_readers, n_lookups):
+    procs = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--reader", fmt, path, str(n_lookups)],
+            stdout=subprocess.PIPE,
+            cwd=BASE_DIR,
+        )
+        for _ in range(n_readers)
+    ]
+    return [json.loads(p.communicate()[0]) for p in procs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="documents.pkl vs mmap chunk store")
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--readers", type=int, default=1, help="concurrent reader processes")
+    parser.add_argument("--lookups", type=int, default=3_000)
+    parser.add_argument("--reader", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.reader:
+        fmt, path, n_lookups = args.reader
+        reader(fmt, path, int(n_lookups))
+        return
+
+    from models.chunkStore import write_chunk_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pkl_path = os.path.join(tmp, "documents.pkl")
+        store_path = os.path.join(tmp, "chunks")
+
+        chunks = dict(synthetic_chunks(args.chunks))
+        with open(pkl_path, "wb") as f:
+            pickle.dump([chunks[i] for i in range(args.chunks)], f)
+        write_chunk_store(store_path, upserts=chunks).close()
+        del chunks
+
+        store_mb = sum(os.path.getsize(os.path.join(store_path, f)) for f in os.listdir(store_path)) / 1e6
+        print(f"{args.chunks} chunks: pickle {os.path.getsize(pkl_path) / 1e6:.1f} MB, chunk store {store_mb:.1f} MB on disk")
+        print(
+            f"{'format':>8} {'load ms':>9} {'RSS MB':>8} {'RSS+lookups':>12} {'private MB':>11} {'lookup us':>10}"
+            f"   ({args.readers} reader(s), mean)"
+        )
+
+        for fmt, path in (("pickle", pkl_path), ("mmap", store_path)):
+            results = run_readers(fmt, path, args.readers, args.lookups)
+            mean = {k: sum(r[k] for r in results) / len(results) for k in results[0]}
+            print(
+                f"{fmt:>8} {mean['load_ms']:>9.1f} {mean['rss_delta_mb']:>8.1f} "
+                f"{mean['rss_after_lookups_mb']:>12.1f} {mean['private_mb']:>11.1f} {mean['lookup_us']:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
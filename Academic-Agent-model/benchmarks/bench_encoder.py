@@ -0,0 +1,95 @@
+"""Import/load time, RSS and encode latency of each EMBED_BACKEND.
+
+Each backend runs in a fresh subprocess so import cost and RSS are its own:
+
+    python tools/export_static_encoder.py     # once
+    python benchmarks/bench_encoder.py --queries 2000 --batch 256
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+QUERIES = [
+    "What is a disk cylinder?",
+    "How are sectors numbered on a disk?",
+    "Explain logical block addressing.",
+    "Why does seek time matter for disk scheduling?",
+]
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def worker(n_queries, batch):
+    # Runs in a subprocess with EMBED_BACKEND already set
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    from models.llm_model import get_model
+
+    model = get_model()
+    model.encode(["warmup"], normalize_embeddings=True)
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(n_queries):
+        t = time.perf_counter()
+        model.encode([QUERIES[i % len(QUERIES)] + f" {i}"], normalize_embeddings=True)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+
+    texts = [" ".join(QUERIES) * 8] * batch
+    t = time.perf_counter()
+    model.encode(texts, batch_size=64, normalize_embeddings=True)
+    batch_s = time.perf_counter() - t
+
+    print(json.dumps({
+        "load_s": round(load_s, 3),
+        "rss_mb": round(rss_mb() - base_rss, 1),
+        "query_p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "query_p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        "batch_texts_per_s": round(batch / batch_s, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.queries, args.batch)
+        return
+
+    print(f"{'backend':>22} {'load s':>8} {'RSS MB':>8} {'p50 us':>9} {'p99 us':>9} {'batch texts/s':>14}")
+    for backend in ("sentence-transformers", "static"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", "--queries", str(args.queries), "--batch", str(args.batch)],
+            cwd=BASE_DIR,
+            env=dict(os.environ, EMBED_BACKEND=backend),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"{backend:>22} {r['load_s']:>8.2f} {r['rss_mb']:>8.1f} {r['query_p50_us']:>9.1f} "
+            f"{r['query_p99_us']:>9.1f} {r['batch_texts_per_s']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
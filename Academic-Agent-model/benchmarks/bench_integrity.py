@@ -0,0 +1,154 @@
+"""Integrity screening: what it flags on labelled questions, and what it costs.
+
+Flags: each question in benchmarks/data/integrity_questions.jsonl
+("question", "cheating") plus the retrieval questions (all honest ones)
+goes through the phrase check and the intent check of the default policy,
+the intent check even when INTEGRITY_INTENT is off. The cheating
+scores and margins are printed for calibrating INTEGRITY_INTENT_MIN_SCORE
+and INTEGRITY_INTENT_MARGIN. Exits with status 1 if any honest question
+is refused, so the current thresholds can be checked before turning
+INTEGRITY_INTENT on.
+
+Cost: the phrase automaton against the old loop of substring checks, for
+thousands of synthetic phrases, and the intent check for one query.
+
+    python benchmarks/bench_integrity.py --phrases 10 1000 5000 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.eval_retrieval import QUESTIONS_PATH, load_questions
+from benchmarks.synthetic_corpus import COMMON_WORDS, make_term
+from models.integrityGuard import (
+    CHEAT_KEYWORDS,
+    IntentClassifier,
+    PhraseMatcher,
+    load_policy,
+)
+from models.llm_model import encode_texts
+from models.topicTaxonomy import normalize
+
+LABELLED_PATH = os.path.join(BASE_DIR, "benchmarks", "data", "integrity_questions.jsonl")
+
+
+def flags(labelled):
+    """Print what each check flags; returns the number of honest questions refused."""
+
+    policy = load_policy("default", intent=True)
+    questions = [item["question"] for item in labelled]
+    embeddings = encode_texts(questions)
+    scores = policy.intent.scores(embeddings) if policy.intent is not None else None
+
+    counts = {True: [0, 0, 0], False: [0, 0, 0]}
+    print(f"{len(labelled)} questions, {len(policy.matcher)} phrases, "
+          f"{len(policy.intent) if policy.intent is not None else 0} intent examples")
+    print("  label    pattern intent  cheat  margin  question")
+    for row, item in enumerate(labelled):
+        phrase = policy.match(item["question"])
+        intent = policy.intent_score(embeddings[row:row + 1]) is not None
+        cheating = item["cheating"]
+        counts[cheating][0] += 1
+        counts[cheating][1] += phrase is not None
+        counts[cheating][2] += phrase is None and intent
+        cheat, margin = (scores[row, 0], scores[row, 0] - scores[row, 1]) if scores is not None else (0.0, 0.0)
+        print(f"  {'cheat' if cheating else 'honest':<8} {'yes' if phrase else '-':<7} {'yes' if intent else '-':<6} "
+              f"{cheat:6.3f} {margin:+7.3f}  {item['question']}")
+
+    for cheating, (total, by_phrase, by_intent) in counts.items():
+        if total:
+            print(f"{'cheating' if cheating else 'honest'}: {by_phrase + by_intent}/{total} flagged "
+                  f"({by_phrase} by phrase, {by_intent} more by intent)")
+    return counts[False][1] + counts[False][2]
+
+
+def synthetic_phrases(count, seed=0):
+    rng = random.Random(seed)
+    phrases = set()
+    while len(phrases) < count:
+        words = [make_term(rng)] + rng.sample(COMMON_WORDS, rng.randint(1, 3))
+        rng.shuffle(words)
+        phrases.add(" ".join(words))
+    return list(phrases)
+
+
+def substring_loop(phrases):
+    # What violates_integrity did before the automaton
+    keywords = [phrase.lower() for phrase in phrases]
+
+    def find(text):
+        q = text.lower()
+        for k in keywords:
+            if k in q:
+                return k
+        return None
+
+    return find
+
+
+def per_call(fn, items, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) / (repeats * len(items))
+
+
+def phrase_cost(sizes, questions, repeats):
+    print(f"Phrase check, us per question ({len(questions)} honest questions, nothing matches):")
+    print(f"  {'phrases':>7}  {'build ms':>8}  {'automaton':>9}  {'substrings':>10}")
+    for size in sizes:
+        phrases = CHEAT_KEYWORDS[:size] if size <= len(CHEAT_KEYWORDS) else CHEAT_KEYWORDS + synthetic_phrases(size)
+        start = time.perf_counter()
+        matcher = PhraseMatcher(phrases)
+        build = time.perf_counter() - start
+        loop = substring_loop(phrases)
+        automaton_us = per_call(matcher.find, questions, repeats) * 1e6
+        loop_us = per_call(loop, questions, max(1, repeats // 10)) * 1e6
+        print(f"  {len(phrases):>7}  {build * 1e3:8.1f}  {automaton_us:9.1f}  {loop_us:10.1f}")
+
+
+def intent_cost(sizes, dim, repeats=2000):
+    rng = np.random.default_rng(0)
+    query = normalize(rng.standard_normal((1, dim)))
+    print(f"Intent check, us per question (dim {dim}):")
+    for size in sizes:
+        vectors = normalize(rng.standard_normal((size, dim)))
+        classifier = IntentClassifier(vectors[: size // 2], vectors[size // 2:])
+        classifier.flags(query)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            classifier.flags(query)
+        print(f"  {size:>5} examples: {(time.perf_counter() - start) / repeats * 1e6:7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Integrity screening flags and cost")
+    parser.add_argument("--labelled", default=LABELLED_PATH)
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--phrases", type=int, nargs="+", default=[10, 1000, 5000, 20000])
+    parser.add_argument("--examples", type=int, nargs="+", default=[22, 200, 1000])
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    honest = [{"question": q["question"], "cheating": False} for q in load_questions(args.questions)]
+    refused = flags(load_questions(args.labelled) + honest)
+    print()
+    phrase_cost(args.phrases, [item["question"] for item in honest], args.repeats)
+    print()
+    intent_cost(args.examples, encode_texts(["dimension probe"]).shape[1])
+
+    if refused:
+        sys.exit(f"{refused} honest questions were refused; raise the intent thresholds or fix the phrases.")
+
+
+if __name__ == "__main__":
+    main()
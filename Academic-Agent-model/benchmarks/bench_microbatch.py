@@ -0,0 +1,113 @@
+"""Throughput vs added latency of micro-batched query embedding + search.
+
+Drives the same batch function /chat uses (api_server.embed_and_retrieve)
+from many concurrent in-process clients, with no HTTP and no LLM, so only
+the encode + search cost is measured:
+
+    python ingestion.py
+    python benchmarks/bench_microbatch.py --requests 2000 --concurrency 1 8 32 --waits 0 1 2 5
+
+Every query is unique so the embedding cache never answers. "unbatched"
+(max batch 1) is the pre-batching behaviour: one encode and one search per
+request.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.chdir(BASE_DIR)
+
+import api_server
+from models.concurrency import MicroBatcher
+
+WORDS = (
+    "disk sector track cylinder platter head seek latency block address "
+    "controller cache buffer scheduling rotation transfer logical physical"
+).split()
+
+
+def vocabulary(documents):
+    words = set()
+    for chunk_id in documents.ids[:2000]:
+        words.update(re.findall(r"[a-z]{3,}", documents.text(int(chunk_id)).lower()))
+    return sorted(words) or WORDS
+
+
+async def run(batcher, course, queries, concurrency):
+    queries = iter(queries)
+    latencies = []
+
+    async def client():
+        for query in queries:
+            start = time.perf_counter()
+            await batcher.submit((course, query))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "qps": len(latencies) / wall,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def compare(args, course):
+    index, documents = course.index, course.documents
+    rng = random.Random(0)
+    vocab = vocabulary(documents)
+    counter = iter(range(10**9))
+
+    def queries(n):
+        return [
+            " ".join(rng.choice(vocab) for _ in range(rng.randint(4, 12))) + f" q{next(counter)}"
+            for _ in range(n)
+        ]
+
+    configs = [("unbatched", 1, 0.0)] + [
+        (f"wait {wait:g}ms", args.max_batch, wait / 1000) for wait in args.waits
+    ]
+
+    print(f"{len(documents)} chunks, index d={index.d}, {args.requests} unique queries per run")
+    print(f"{'conc':>5} {'config':>12} {'qps':>9} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11}")
+    for concurrency in args.concurrency:
+        for name, max_batch, max_wait in configs:
+            batcher = MicroBatcher(api_server.embed_and_retrieve, max_batch, max_wait)
+            r = asyncio.run(run(batcher, course, queries(args.requests), concurrency))
+            print(
+                f"{concurrency:>5} {name:>12} {r['qps']:>9.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                f"{batcher.stats()['mean_batch']:>11.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching throughput and latency")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--waits", type=float, nargs="+", default=[0, 1, 2, 5], help="max wait in ms")
+    parser.add_argument("--max-batch", type=int, default=32)
+    args = parser.parse_args()
+
+    # Held for the whole run, as /chat holds it for a request
+    course = api_server.courses.acquire(api_server.DEFAULT_COURSE)
+    if course is None:
+        sys.exit("No vector DB found; run ingestion.py first.")
+    api_server.warm_embedding_model()
+    try:
+        compare(args, course)
+    finally:
+        course.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Prompt size before and after context assembly.
+
+For each labelled question (benchmarks/data/retrieval_questions.jsonl) this
+retrieves top_k chunks and compares the estimated prompt tokens of:
+
+  * before: the adaptive prompt wrapped in llm.build_prompt, which sent the
+    context twice, with every misconception on record;
+  * after:  build_context (merged, deduplicated, budgeted) in the adaptive
+    prompt alone.
+
+    python benchmarks/bench_prompt_tokens.py --top-k 5 --misconceptions 40
+"""
+
+import argparse
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.chdir(BASE_DIR)
+
+import api_server
+from models.adaptiveAnswer import build_adaptive_prompt
+from models.contextBuilder import build_context
+from models.llm import build_prompt, estimate_tokens
+
+QUESTIONS_PATH = os.path.join(BASE_DIR, "benchmarks", "data", "retrieval_questions.jsonl")
+
+
+def compare(args, questions, course):
+    # A long history with repeats, as accumulates for a struggling student
+    history = [
+        f"Confuses {term} with {other}."
+        for term, other in [("seek time", "rotational latency"), ("track", "cylinder"), ("sector", "block")]
+    ] * (args.misconceptions // 3 + 1)
+    history = history[:args.misconceptions]
+
+    budget = {} if args.budget is None else {"budget": args.budget}
+    before, after, merged, dropped = [], [], 0, 0
+    for question in questions:
+        chunks = api_server.retrieve_chunks(question, args.top_k, course=course)
+        texts = [text for _, text in chunks]
+        before.append(estimate_tokens(build_prompt(texts, build_adaptive_prompt(texts, question, history))))
+
+        assembled = build_context(chunks, course.documents, history, **budget)
+        after.append(estimate_tokens(build_adaptive_prompt(assembled.passages, question, assembled.misconceptions)))
+        merged += len(assembled.chunk_ids) - len(assembled.passages)
+        dropped += assembled.dropped
+
+    n = len(questions)
+    print(f"{n} questions, top_k={args.top_k}, {args.misconceptions} misconceptions on record")
+    print(f"  before: mean {sum(before) / n:7.1f} tokens, max {max(before)}")
+    print(f"  after:  mean {sum(after) / n:7.1f} tokens, max {max(after)}  ({1 - sum(after) / sum(before):.0%} fewer)")
+    print(f"  adjacent chunks merged: {merged / n:.2f}/question, chunks dropped: {dropped / n:.2f}/question")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimated prompt tokens before/after context assembly")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--misconceptions", type=int, default=40, help="misconceptions on record per student")
+    parser.add_argument("--budget", type=int, default=None, help="context token budget (default: CONTEXT_TOKEN_BUDGET)")
+    args = parser.parse_args()
+
+    with open(args.questions, "r") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+
+    course = api_server.courses.acquire(api_server.DEFAULT_COURSE)
+    if course is None:
+        sys.exit("No vector DB found; run ingestion.py first.")
+    try:
+        compare(args, questions, course)
+    finally:
+        course.release()
+
+
+if __name__ == "__main__":
+    main()
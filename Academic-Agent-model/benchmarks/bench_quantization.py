@@ -0,0 +1,125 @@
+"""Index size, query latency and recall of truncated / quantized vectors.
+
+Embeds a corpus once at full width with the configured model, then for each
+Matryoshka width and VECTOR_QUANTIZATION builds an index and compares its
+top-k against exact full-width search:
+
+    python benchmarks/bench_quantization.py --chunks 20000 --dims 1024 256 128
+
+Corpus texts are random word sequences drawn from the ingested chunks (or a
+built-in word list when there is no vector DB). "rescored" rows re-rank
+top_k * RESCORE_FACTOR candidates with the stored float vectors, as
+retrieve_context does.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import faiss
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from models.chunkStore import open_chunk_store
+from models.llm_model import get_model, truncate_embeddings
+from models.vectorIndex import QUANTIZATIONS, build_index, is_binary, search
+from models.vectorSnapshot import snapshot_path
+
+WORDS = (
+    "disk sector track cylinder platter head seek latency block address "
+    "controller cache buffer scheduling rotation transfer logical physical"
+).split()
+
+
+def vocabulary():
+    store = open_chunk_store(os.path.join(snapshot_path(os.path.join(BASE_DIR, "vector_db")), "chunks"))
+    if store is None or not len(store):
+        return WORDS
+    words = set()
+    for chunk_id in store.ids[:2000]:
+        words.update(re.findall(r"[a-z]{3,}", store.text(int(chunk_id)).lower()))
+    return sorted(words) or WORDS
+
+
+def random_texts(n, vocab, rng, length=(8, 60)):
+    return [" ".join(rng.choice(vocab) for _ in range(rng.randint(*length))) for _ in range(n)]
+
+
+def index_bytes(index):
+    if is_binary(index):
+        return faiss.serialize_index_binary(index).nbytes
+    return faiss.serialize_index(index).nbytes
+
+
+def evaluate(index, store_vectors, queries, exact_scores, kth_scores, top_k, rescore):
+    lookup = (lambda ids: store_vectors[ids]) if rescore else None
+    latencies, hits = [], 0
+    for row, q in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = search(index, q[None, :], top_k, rescore=lookup)
+        latencies.append(time.perf_counter() - start)
+        # Tie-aware: any result scoring at least the true k-th best counts
+        found = ids[0][ids[0] >= 0]
+        hits += int((exact_scores[row, found] >= kth_scores[row] - 1e-5).sum())
+    latencies.sort()
+    return hits / (len(queries) * top_k), latencies[len(latencies) // 2] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matryoshka truncation and quantization: size, latency, recall")
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dims", type=int, nargs="+", default=[1024, 512, 256, 128])
+    parser.add_argument("--quantizations", nargs="+", default=list(QUANTIZATIONS), choices=QUANTIZATIONS)
+    parser.add_argument("--index-type", default="flat", choices=("flat", "ivf", "hnsw"))
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vocab = vocabulary()
+    model = get_model()
+
+    start = time.perf_counter()
+    corpus = model.encode(random_texts(args.chunks, vocab, rng), batch_size=256, normalize_embeddings=True)
+    queries_full = model.encode(random_texts(args.queries, vocab, rng, (3, 12)), normalize_embeddings=True)
+    corpus = np.asarray(corpus, dtype="float32")
+    queries_full = np.asarray(queries_full, dtype="float32")
+    print(f"Embedded {args.chunks} chunks + {args.queries} queries at {corpus.shape[1]} dims in {time.perf_counter() - start:.1f}s")
+
+    # Ground truth: exact search on full-width vectors
+    exact_scores = queries_full @ corpus.T
+    kth_scores = -np.partition(-exact_scores, args.top_k - 1, axis=1)[:, args.top_k - 1]
+
+    print(
+        f"{'dims':>5} {'quant':>7} {'mode':>9} {'index MB':>9} {'floats MB':>10} "
+        f"{'recall@' + str(args.top_k):>10} {'p50 us':>8}"
+    )
+    for dim in args.dims:
+        vectors = truncate_embeddings(corpus, dim)
+        queries = truncate_embeddings(queries_full, dim)
+        floats_mb = vectors.nbytes / 1e6
+
+        for quantization in args.quantizations:
+            index = build_index(vectors, args.index_type, quantization=quantization)
+            size_mb = index_bytes(index) / 1e6
+            modes = ("raw",) if quantization == "none" else ("raw", "rescored")
+            for mode in modes:
+                recall, p50 = evaluate(
+                    index, vectors, queries, exact_scores, kth_scores, args.top_k, mode == "rescored"
+                )
+                # Rescoring reads the float vectors from the mmap'd chunk store,
+                # so they cost disk/page cache, not index RAM.
+                extra = f"{floats_mb:>10.1f}" if mode == "rescored" else f"{'-':>10}"
+                print(
+                    f"{vectors.shape[1]:>5} {quantization:>7} {mode:>9} {size_mb:>9.2f} {extra} "
+                    f"{recall:>10.3f} {p50:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Cold-start benchmark for api_server.
+
+Measures, each in a fresh process:
+
+* ``import api_server`` time (what uvicorn pays before the port opens)
+* time until /health answers (liveness) and until /ready answers 200
+* latency of the first /chat request, with and without background warmup
+
+    python benchmarks/bench_startup.py --runs 3
+
+A stub LLM (tools/fake_openai_server.py) answers instantly, so the numbers
+are the server's own startup cost. The vector DB must already exist.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from tools.fake_openai_server import make_server
+
+QUESTION = "What is a disk cylinder?"
+
+
+def import_time(env):
+    code = "import time; t = time.perf_counter(); import api_server; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def poll(url, deadline, want=200):
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == want:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not return {want}")
+
+
+def first_chat(url):
+    start = time.perf_counter()
+    first_byte = None
+    with httpx.stream("POST", url, json={"messages": [{"role": "user", "content": QUESTION}]}, timeout=120) as resp:
+        resp.raise_for_status()
+        for _ in resp.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return first_byte, time.perf_counter() - start
+
+
+def server_run(env, port, warmup):
+    env = dict(env, WARMUP="1" if warmup else "0")
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + 180
+        live = poll(f"{base}/health", deadline) - start
+        ready = poll(f"{base}/ready", deadline) - start
+        ttfb, total = first_chat(f"{base}/chat")
+    finally:
+        server.terminate()
+        server.wait()
+    return {"live_s": live, "ready_s": ready, "chat_ttfb_s": ttfb, "chat_total_s": total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="api_server import, readiness and first-request latency")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--stub-port", type=int, default=9799)
+    args = parser.parse_args()
+
+    stub = make_server(port=args.stub_port, token_delay=0.0)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    env = dict(
+        os.environ,
+        OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+        OPENROUTER_API_KEY=os.environ.get("OPENROUTER_API_KEY", "stub"),
+    )
+
+    try:
+        imports = [import_time(env) for _ in range(args.runs)]
+        print(f"import api_server: median {statistics.median(imports) * 1000:.0f} ms over {args.runs} runs")
+
+        print(f"{'warmup':>7} {'live s':>8} {'ready s':>8} {'1st chat ttfb s':>16} {'1st chat total s':>17}")
+        for warmup in (False, True):
+            runs = [server_run(env, args.port, warmup) for _ in range(args.runs)]
+            med = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+            print(
+                f"{'on' if warmup else 'off':>7} {med['live_s']:>8.2f} {med['ready_s']:>8.2f} "
+                f"{med['chat_ttfb_s']:>16.3f} {med['chat_total_s']:>17.3f}"
+            )
+    finally:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
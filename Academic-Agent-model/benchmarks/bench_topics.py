@@ -0,0 +1,97 @@
+"""Topic classifier: agreement on labelled questions and classification cost.
+
+Agreement: each labelled question (benchmarks/data/retrieval_questions.jsonl)
+should land in the same topic as the chunk that answers it. Cost: one
+classify() call over synthetic taxonomies with hundreds of topics.
+
+    python ingestion.py
+    python benchmarks/bench_topics.py --topics 100 500 1000 --batch 1 32
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.eval_retrieval import QUESTIONS_PATH, load_questions, relevant_ids
+from models.chunkStore import open_chunk_store
+from models.llm_model import encode_texts
+from models.topicMapper import TopicClassifier, load_topic_classifier
+from models.topicTaxonomy import TopicTaxonomy, normalize
+from models.vectorSnapshot import snapshot_path
+
+SNAPSHOT_PATH = snapshot_path(os.path.join(BASE_DIR, "vector_db"))
+
+
+def agreement(classifier, questions, documents):
+    embeddings = encode_texts([q["question"] for q in questions])
+    matches = classifier.classify(embeddings)
+
+    agree, levels, topics = 0, Counter(), Counter()
+    for question, match in zip(questions, matches):
+        gold_ids = sorted(relevant_ids(documents, question))
+        gold = {m.topic for m in classifier.classify(documents.vectors_for(gold_ids))} if gold_ids else set()
+        agree += match.topic in gold
+        levels[match.level] += 1
+        topics[match.topic] += 1
+
+    n = len(questions)
+    print(f"{n} questions, {len(classifier)} scored topics ({classifier.taxonomy.meta.get('origin')})")
+    print(f"  same topic as the answering chunk: {agree}/{n} ({agree / n:.0%})")
+    print(f"  filed at: {dict(levels)}")
+    for topic, count in topics.most_common():
+        print(f"    {count:>3}  {topic}")
+
+
+def synthetic_classifier(n_topics, dim, per_topic=3, seed=0):
+    rng = np.random.default_rng(seed)
+    prototypes = normalize(rng.standard_normal((n_topics * per_topic, dim)))
+    topics = [
+        {"id": f"t{n}", "parent": None, "prototypes": [n * per_topic, (n + 1) * per_topic]}
+        for n in range(n_topics)
+    ]
+    return TopicClassifier(TopicTaxonomy(topics, prototypes, {"origin": "synthetic"}, np.zeros(dim, "float32")))
+
+
+def timing(sizes, batches, dim, repeats=200):
+    rng = np.random.default_rng(1)
+    print(f"classify() cost, dim {dim}, 3 prototypes per topic:")
+    for n_topics in sizes:
+        classifier = synthetic_classifier(n_topics, dim)
+        for batch in batches:
+            queries = normalize(rng.standard_normal((batch, dim)))
+            classifier.classify(queries)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                classifier.classify(queries)
+            per_call = (time.perf_counter() - start) / repeats
+            print(f"  {n_topics:>5} topics, batch {batch:>3}: {per_call * 1e3:7.3f} ms/call, "
+                  f"{per_call / batch * 1e6:8.1f} us/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Topic classifier agreement and cost")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--topics", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 32])
+    args = parser.parse_args()
+
+    documents = open_chunk_store(os.path.join(SNAPSHOT_PATH, "chunks"))
+    topic_path = os.path.join(SNAPSHOT_PATH, "topics")
+    if documents is None or not os.path.exists(os.path.join(topic_path, "topics.json")):
+        sys.exit("No vector DB or topic taxonomy found; run ingestion.py first.")
+
+    agreement(load_topic_classifier(topic_path), load_questions(args.questions), documents)
+    print()
+    timing(args.topics, args.batch, documents.vectors.shape[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Offline retrieval quality: hit rate and MRR of each RETRIEVAL_MODE.
+
+Runs a labelled question set against the ingested vector DB:
+
+    python ingestion.py
+    python benchmarks/eval_retrieval.py --top-k 3
+
+Each line of the question file is a JSON object with "question", "source"
+(path relative to data/raw_pdfs) and at least one of "contains" (a phrase
+from the relevant chunk, whitespace-insensitive) or "pages". A question is
+a hit when any of its top-k chunks is relevant. Labels use text and pages
+rather than chunk ids, so they survive re-ingestion.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from models.chunkStore import open_chunk_store
+from models.keywordIndex import open_keyword_index
+from models.llm_model import encode_texts
+from models.retrieval import RETRIEVAL_MODES, retrieve_ids
+from models.vectorIndex import configure_search, read_index
+from models.vectorSnapshot import snapshot_path
+
+VECTOR_DB_PATH = os.path.join(BASE_DIR, "vector_db")
+QUESTIONS_PATH = os.path.join(BASE_DIR, "benchmarks", "data", "retrieval_questions.jsonl")
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def load_questions(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def relevant_ids(documents, label):
+    phrase = normalize(label["contains"]) if label.get("contains") else None
+    pages = set(label.get("pages") or ())
+
+    ids = set()
+    for chunk_id in documents.ids:
+        chunk_id = int(chunk_id)
+        if documents.source(chunk_id) != label["source"]:
+            continue
+        if pages and documents.page(chunk_id) not in pages:
+            continue
+        if phrase and phrase not in normalize(documents.text(chunk_id)):
+            continue
+        ids.add(chunk_id)
+    return ids
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def evaluate(mode, index, documents, keywords, questions, embeddings, relevant, top_k, repeat):
+    hits_1 = hits_k = 0
+    reciprocal_ranks = []
+    latencies = []
+    misses = []
+
+    for row, label in enumerate(questions):
+        query_embedding = embeddings[row:row + 1]
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ids = retrieve_ids(index, documents, keywords, label["question"], query_embedding, top_k, mode=mode)
+            latencies.append(time.perf_counter() - start)
+
+        ranks = [rank for rank, chunk_id in enumerate(ids, start=1) if chunk_id in relevant[row]]
+        hits_1 += int(bool(ranks) and ranks[0] == 1)
+        hits_k += int(bool(ranks))
+        reciprocal_ranks.append(1.0 / ranks[0] if ranks else 0.0)
+        if not ranks:
+            misses.append(label["question"])
+
+    latencies.sort()
+    n = len(questions)
+    return {
+        "mode": mode,
+        "hit@1": hits_1 / n,
+        f"hit@{top_k}": hits_k / n,
+        "mrr": sum(reciprocal_ranks) / n,
+        "p50_us": percentile(latencies, 0.5) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "misses": misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hit rate / MRR of dense, keyword and hybrid retrieval")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20, help="timed searches per question")
+    parser.add_argument("--modes", nargs="+", default=list(RETRIEVAL_MODES), choices=RETRIEVAL_MODES)
+    parser.add_argument("--show-misses", action="store_true")
+    args = parser.parse_args()
+
+    current = snapshot_path(VECTOR_DB_PATH)
+    index = configure_search(read_index(os.path.join(current, "index.faiss")))
+    documents = open_chunk_store(os.path.join(current, "chunks"))
+    keywords = open_keyword_index(os.path.join(current, "bm25"))
+    if keywords is None:
+        sys.exit("No keyword index found; run ingestion.py first.")
+
+    questions = load_questions(args.questions)
+    relevant = [relevant_ids(documents, label) for label in questions]
+    unlabelled = [label["question"] for label, ids in zip(questions, relevant) if not ids]
+    if unlabelled:
+        sys.exit(f"No chunk matches the labels of: {unlabelled}")
+
+    # Query embedding is shared by every mode and excluded from the timings
+    embeddings = encode_texts([label["question"] for label in questions])
+
+    print(f"{len(questions)} questions, {len(documents)} chunks, {len(keywords.terms)} terms")
+    print(f"{'mode':>8} {'hit@1':>7} {'hit@' + str(args.top_k):>7} {'MRR':>7} {'p50 us':>8} {'p99 us':>8}")
+    for mode in args.modes:
+        r = evaluate(mode, index, documents, keywords, questions, embeddings, relevant, args.top_k, args.repeat)
+        print(
+            f"{mode:>8} {r['hit@1']:>7.3f} {r['hit@' + str(args.top_k)]:>7.3f} {r['mrr']:>7.3f} "
+            f"{r['p50_us']:>8.1f} {r['p99_us']:>8.1f}"
+        )
+        if args.show_misses:
+            for question in r["misses"]:
+                print(f"{'':>10}miss: {question}")
+
+
+if __name__ == "__main__":
+    main()
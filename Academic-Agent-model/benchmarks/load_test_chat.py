@@ -0,0 +1,151 @@
+"""Concurrent /chat load test against a stub LLM.
+
+Starts tools/fake_openai_server.py in-process, optionally spawns api_server
+pointed at it, then fires waves of concurrent /chat requests and reports
+throughput, time-to-first-byte and total latency per concurrency level:
+
+    python benchmarks/load_test_chat.py --spawn-server --concurrency 1 8 32
+
+Because the stub LLM sleeps between tokens, a blocking server plateaus at
+its worker count while the async pipeline keeps scaling with concurrency.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from tools.fake_openai_server import make_server
+
+QUESTIONS = [
+    "What is a disk cylinder?",
+    "How are sectors numbered on a disk?",
+    "Explain logical block addressing.",
+    "Why does seek time matter for disk scheduling?",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+async def one_chat(client, url, question, course_id=None):
+    start = time.perf_counter()
+    first_byte = None
+    body = {"messages": [{"role": "user", "content": question}]}
+    if course_id is not None:
+        body["course_id"] = course_id
+    async with client.stream("POST", url, json=body) as resp:
+        if resp.status_code != 200:
+            await resp.aread()
+            return resp.status_code, None, time.perf_counter() - start
+        async for _ in resp.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return 200, first_byte, time.perf_counter() - start
+
+
+async def run_level(url, concurrency, requests_per_level, questions=QUESTIONS, course_id=None):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(i):
+            async with semaphore:
+                return await one_chat(client, url, questions[i % len(questions)], course_id)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(requests_per_level)))
+        elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r[0] == 200]
+    ttfb = [r[1] for r in ok if r[1] is not None]
+    totals = [r[2] for r in ok]
+    return {
+        "concurrency": concurrency,
+        "requests": requests_per_level,
+        "ok": len(ok),
+        "rejected_503": sum(1 for r in results if r[0] == 503),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "ttfb_p50_ms": round(statistics.median(ttfb) * 1000, 1) if ttfb else None,
+        "ttfb_p95_ms": round(percentile(ttfb, 95) * 1000, 1) if ttfb else None,
+        "total_p50_ms": round(statistics.median(totals) * 1000, 1) if totals else None,
+        "total_p95_ms": round(percentile(totals, 95) * 1000, 1) if totals else None,
+        "total_p99_ms": round(percentile(totals, 99) * 1000, 1) if totals else None,
+    }
+
+
+def wait_for_server(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /chat load test against a stub LLM")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--spawn-server", action="store_true", help="start api_server with the stub LLM")
+    parser.add_argument("--stub-port", type=int, default=9765)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    args = parser.parse_args()
+
+    stub = make_server(
+        port=args.stub_port,
+        token_delay=args.token_delay,
+        first_token_delay=args.first_token_delay,
+    )
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    server = None
+    if args.spawn_server:
+        port = args.url.rsplit(":", 1)[1]
+        env = dict(
+            os.environ,
+            OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+            OPENROUTER_API_KEY=os.environ.get("OPENROUTER_API_KEY", "stub"),
+            MAX_INFLIGHT_LLM=os.environ.get("MAX_INFLIGHT_LLM", str(max(args.concurrency))),
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api_server:app", "--port", port, "--log-level", "warning"],
+            cwd=BASE_DIR,
+            env=env,
+        )
+
+    try:
+        wait_for_server(f"{args.url}/ready")
+        print(f"{'conc':>5} {'ok':>5} {'503':>5} {'rps':>8} {'ttfb p50':>10} {'p50':>10} {'p95':>10}")
+        for concurrency in args.concurrency:
+            r = asyncio.run(run_level(f"{args.url}/chat", concurrency, args.requests))
+            print(
+                f"{r['concurrency']:>5} {r['ok']:>5} {r['rejected_503']:>5} {r['throughput_rps']:>8} "
+                f"{r['ttfb_p50_ms']!s:>10} {r['total_p50_ms']!s:>10} {r['total_p95_ms']!s:>10}"
+            )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""End-to-end benchmark suite on a synthetic course; needs no network.
+
+Synthetic PDFs (benchmarks/synthetic_corpus.py) are written into a
+throwaway course, data/courses/bench-synthetic, and measured stage by stage:
+
+    ingest    ingestion of the course: a full build, then a run with nothing to do
+    retrieve  embed + hybrid search + chunk texts per question, cold and cached
+    chat      /chat p50/p95/p99 under concurrent load, against the stub LLM
+    store     student store write and read rates, on a scratch SQLite file
+
+Results are saved as JSON (benchmarks/results/ by default). --baseline
+compares them with an earlier run and exits with status 1 when any latency
+or rate is worse by more than --threshold:
+
+    python benchmarks/run_suite.py --pdfs 50 --pages 10
+    python benchmarks/run_suite.py --baseline benchmarks/results/baseline.json --threshold 0.2
+    python benchmarks/run_suite.py --compare new.json --baseline old.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.load_test_chat import percentile, run_level, wait_for_server
+from benchmarks.synthetic_corpus import make_corpus
+from models.courseRegistry import course_paths
+from tools.fake_openai_server import make_server
+
+BENCH_COURSE = "bench-synthetic"
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+STAGES = ("ingest", "retrieve", "chat", "store")
+
+# Latency changes smaller than this are noise, whatever their ratio
+NOISE_FLOOR_MS = 1.0
+
+
+def latency_summary(seconds):
+    return {
+        "p50_ms": round(statistics.median(seconds) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+    }
+
+
+def course_dirs():
+    return course_paths(BENCH_COURSE, os.path.join(BASE_DIR, "vector_db"), os.path.join(BASE_DIR, "data"))
+
+
+def remove_course():
+    for path in course_dirs():
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def run_ingestion(ingestion):
+    # In-process, so the embedding model loaded once up front isn't timed;
+    # its output is only shown when the run fails
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            ingestion.main()
+    except BaseException:
+        print(log.getvalue()[-4000:])
+        raise
+    return time.perf_counter() - start
+
+
+def bench_ingest(args):
+    remove_course()
+    _, pdf_dir = course_dirs()
+    start = time.perf_counter()
+    pages, questions = make_corpus(pdf_dir, args.pdfs, args.pages, args.words, args.questions, args.seed)
+    generated = time.perf_counter() - start
+
+    # ingestion.py works on paths relative to the backend directory
+    os.chdir(BASE_DIR)
+    import ingestion
+    from models.courseRegistry import load_course
+    from models.llm_model import get_model
+
+    start = time.perf_counter()
+    get_model()
+    model_seconds = time.perf_counter() - start
+
+    ingestion.use_course(BENCH_COURSE)
+    seconds = run_ingestion(ingestion)
+    # Only scans and finds nothing to do
+    noop_seconds = run_ingestion(ingestion)
+
+    course = load_course(BENCH_COURSE)
+    chunks = len(course.documents)
+    result = {
+        "pdfs": args.pdfs,
+        "pages": pages,
+        "chunks": chunks,
+        "generate_seconds": round(generated, 3),
+        "model_load_seconds": round(model_seconds, 3),
+        "ingest_seconds": round(seconds, 3),
+        "noop_seconds": round(noop_seconds, 3),
+        "pages_per_second": round(pages / seconds, 1),
+        "chunks_per_second": round(chunks / seconds, 1),
+    }
+    return result, course, questions
+
+
+def bench_retrieve(course, questions, top_k):
+    from models.llm_model import embed_queries, get_model
+    from models.retrieval import retrieve_ids_batch
+
+    questions = list(dict.fromkeys(questions))
+    get_model().encode(["warmup"], normalize_embeddings=True)
+
+    def retrieve_context(question):
+        # What /chat does per question, minus the micro-batching
+        embedding = embed_queries([question])
+        ids = retrieve_ids_batch(course.index, course.documents, course.keywords, [question], embedding, top_k)[0]
+        return [course.documents.text(chunk_id) for chunk_id in ids]
+
+    result = {"questions": len(questions), "top_k": top_k}
+    # The first pass encodes every question; the second finds them in the query cache
+    for name in ("cold", "cached"):
+        seconds = []
+        for question in questions:
+            start = time.perf_counter()
+            retrieve_context(question)
+            seconds.append(time.perf_counter() - start)
+        result[name] = {**latency_summary(seconds), "queries_per_second": round(len(seconds) / sum(seconds), 1)}
+    return result
+
+
+def bench_chat(args, questions):
+    stub = make_server(port=args.stub_port, token_delay=args.token_delay, first_token_delay=args.first_token_delay)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{args.port}"
+    env = dict(
+        os.environ,
+        OPENROUTER_BASE_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+        OPENROUTER_API_KEY="stub",
+        MAX_INFLIGHT_LLM=str(max(args.concurrency)),
+        # Every request runs the whole pipeline unless asked otherwise
+        ANSWER_CACHE_SIZE=os.environ.get("ANSWER_CACHE_SIZE", "2000" if args.answer_cache else "0"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env,
+    )
+    try:
+        wait_for_server(f"{url}/ready")
+        # Loads the course, so the first level doesn't pay for it
+        asyncio.run(run_level(f"{url}/chat", 1, 1, questions, BENCH_COURSE))
+        levels = {}
+        for concurrency in args.concurrency:
+            level = asyncio.run(run_level(f"{url}/chat", concurrency, args.requests, questions, BENCH_COURSE))
+            levels[str(concurrency)] = level
+            print(f"  chat c={concurrency}: {level['throughput_rps']} rps, p50 {level['total_p50_ms']} ms, "
+                  f"p95 {level['total_p95_ms']} ms, p99 {level['total_p99_ms']} ms, {level['rejected_503']} rejected")
+    finally:
+        server.terminate()
+        server.wait()
+        stub.shutdown()
+
+    return {
+        "token_delay": args.token_delay,
+        "first_token_delay": args.first_token_delay,
+        "answer_cache": args.answer_cache,
+        "levels": levels,
+    }
+
+
+def bench_store(operations, students=200, topics=50):
+    from models.studentModel import next_mastery
+    from models.studentStore import SQLiteStudentStore
+
+    keys = [(f"student-{n % students}", f"topic-{(n * 7) % topics}") for n in range(operations)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStudentStore(os.path.join(tmp, "students.sqlite3"))
+
+        def timed(fn):
+            seconds = []
+            for student_id, topic in keys:
+                start = time.perf_counter()
+                fn(student_id, topic)
+                seconds.append(time.perf_counter() - start)
+            return {**latency_summary(seconds), "per_second": round(len(seconds) / sum(seconds), 1)}
+
+        result = {
+            "operations": operations,
+            "mastery_writes": timed(lambda s, t: store.update_mastery(s, t, lambda score: next_mastery(score, 1.0))),
+            "misconception_writes": timed(lambda s, t: store.add_misconception(s, t, "confuses seek time with latency")),
+            "misconception_reads": timed(store.get_misconceptions),
+            "mastery_reads": timed(store.get_mastery),
+        }
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    results = {}
+    course = questions = None
+    try:
+        if {"ingest", "retrieve", "chat"} & set(args.stages):
+            # The other stages need the synthetic course, so it is always built
+            print(f"ingest: {args.pdfs} PDFs x {args.pages} pages...")
+            results["ingest"], course, questions = bench_ingest(args)
+            print(f"  {results['ingest']}")
+        if "retrieve" in args.stages:
+            print("retrieve...")
+            results["retrieve"] = bench_retrieve(course, questions, args.top_k)
+            print(f"  cold {results['retrieve']['cold']}\n  cached {results['retrieve']['cached']}")
+        if "chat" in args.stages:
+            print("chat...")
+            results["chat"] = bench_chat(args, questions)
+        if "store" in args.stages:
+            print("store...")
+            results["store"] = bench_store(args.store_ops)
+            for name, value in results["store"].items():
+                if isinstance(value, dict):
+                    print(f"  {name}: {value}")
+    finally:
+        if course is not None:
+            course.retire()
+        if not args.keep:
+            remove_course()
+
+    return {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(args.started)),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("baseline", "compare", "output", "started")},
+        },
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def better(metric):
+    # "lower" for times, "higher" for rates, None for counts and settings
+    if metric.endswith(("_ms", "_seconds")) and not metric.endswith(("generate_seconds", "model_load_seconds")):
+        return "lower"
+    if metric.endswith(("per_second", "_rps")):
+        return "higher"
+    return None
+
+
+def compare(current, baseline, threshold):
+    """Print every comparable metric; returns the ones that regressed past ``threshold``."""
+
+    if current["meta"]["config"] != baseline["meta"]["config"]:
+        print("Warning: the runs used different settings; differences may not be regressions.")
+
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    regressions = []
+    print(f"{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for metric, value in now.items():
+        direction = better(metric)
+        old = before.get(metric)
+        if direction is None or not old:
+            continue
+        change = (value - old) / old
+        worse = change > threshold if direction == "lower" else change < -threshold
+        if worse and metric.endswith("_ms") and abs(value - old) < NOISE_FLOOR_MS:
+            worse = False
+        if worse:
+            regressions.append(metric)
+        print(f"{metric:<48} {old:>12} {value:>12} {change:>+8.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks on a synthetic course")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="/chat requests per concurrency level")
+    parser.add_argument("--port", type=int, default=8797)
+    parser.add_argument("--stub-port", type=int, default=9797)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--first-token-delay", type=float, default=0.1)
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on for /chat")
+    parser.add_argument("--store-ops", type=int, default=2000)
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic course afterwards")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/suite-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (default: 0.2)")
+    parser.add_argument("--compare", help="compare this results file with --baseline instead of running")
+    args = parser.parse_args()
+    args.started = time.time()
+
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare needs --baseline")
+        with open(args.compare, "r") as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args)
+        output = args.output or os.path.join(
+            RESULTS_DIR, time.strftime("suite-%Y%m%dT%H%M%S.json", time.localtime(args.started))
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
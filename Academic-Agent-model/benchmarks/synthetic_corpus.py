@@ -0,0 +1,162 @@
+"""Synthetic course PDFs and questions for the benchmark suite.
+
+Each PDF covers one made-up topic: its pages are sentences mixing the
+topic's own terms with shared course vocabulary, so keyword and vector
+search have something to tell apart. Questions ask about one topic's terms.
+Output is deterministic for a given seed.
+
+    python benchmarks/synthetic_corpus.py /tmp/corpus --pdfs 20 --pages 10
+"""
+
+import argparse
+import os
+import random
+
+COMMON_WORDS = (
+    "data system process memory disk block file request time value table address operation "
+    "example state level order number page device queue cache buffer record index pointer "
+    "sector track segment frame register thread lock signal message channel counter"
+).split()
+
+SYLLABLES = "ka lo mi ne ru sa ti vo xe zu ba de fi go hu ja ke la mo nu pi qua re si to".split()
+
+TEMPLATES = (
+    "{a} is used to manage {b} when the {c} is busy.",
+    "Each {a} keeps a {b} so that {c} can be found quickly.",
+    "A {a} maps every {b} to a {c} in the same {d}.",
+    "When a {a} fails the {b} falls back to the {c}.",
+    "The {a} stores the {b} next to its {c} and {d}.",
+    "Reading a {a} costs one {b} plus the {c} of the {d}.",
+    "A {a} differs from a {b} because it never moves the {c}.",
+)
+
+QUESTIONS = (
+    "What is a {a} used for?",
+    "How does a {a} relate to the {b}?",
+    "Why would the {a} fall back to the {b}?",
+    "Explain how a {a} finds a {b}.",
+)
+
+CHARS_PER_LINE = 95
+LINES_PER_PAGE = 60
+
+
+def make_term(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_topic(rng, terms=12):
+    return [make_term(rng) for _ in range(terms)]
+
+
+def sentence(rng, topic):
+    # Two of the topic's terms, the rest shared vocabulary
+    words = rng.sample(topic, 2) + rng.sample(COMMON_WORDS, 2)
+    rng.shuffle(words)
+    text = rng.choice(TEMPLATES).format(a=words[0], b=words[1], c=words[2], d=words[3])
+    return text[0].upper() + text[1:]
+
+
+def page_text(rng, topic, words):
+    sentences, count = [], 0
+    while count < words:
+        text = sentence(rng, topic)
+        sentences.append(text)
+        count += len(text.split())
+    return " ".join(sentences)
+
+
+def wrap(text, width=CHARS_PER_LINE):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def write_pdf(path, pages):
+    """A minimal PDF with one Helvetica text stream per page, enough for pypdf."""
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        lines = wrap(text)[:LINES_PER_PAGE]
+        body = "BT /F1 10 Tf 12 TL 40 760 Td " + " ".join(f"{pdf_string(line)} Tj T*" for line in lines) + " ET"
+        stream = body.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_corpus(directory, pdfs=20, pages=10, words=400, questions=200, seed=0):
+    """Write ``pdfs`` PDFs into ``directory``; returns (page count, questions)."""
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    # Words past what fits on a page would be cut off
+    words = min(words, LINES_PER_PAGE * CHARS_PER_LINE // 7)
+
+    topics = []
+    for n in range(pdfs):
+        topic = make_topic(rng)
+        topics.append(topic)
+        write_pdf(
+            os.path.join(directory, f"topic-{n:04d}.pdf"),
+            [page_text(rng, topic, words) for _ in range(pages)],
+        )
+
+    asked = []
+    for n in range(questions):
+        a, b = rng.sample(topics[n % len(topics)], 2)
+        asked.append(rng.choice(QUESTIONS).format(a=a, b=b))
+    return pdfs * pages, asked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic course PDFs")
+    parser.add_argument("directory")
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages, _ = make_corpus(args.directory, args.pdfs, args.pages, args.words, seed=args.seed)
+    print(f"Wrote {args.pdfs} PDFs, {pages} pages to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
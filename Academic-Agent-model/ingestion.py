@@ -1,135 +1,561 @@
+import argparse
+import hashlib
+import json
 import os
-import pickle
+import shutil
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 
+from models.chunkStore import StoreRows, StoreTexts, open_chunk_store, write_chunk_store
+from models.courseRegistry import DEFAULT_COURSE, course_paths
+from models.keywordIndex import open_keyword_index, write_keyword_index
+from models.llm_model import embedding_config, encode_texts
+from models.topicTaxonomy import TOPIC_TAXONOMY_PATH, build_taxonomy, open_taxonomy, write_taxonomy
+from models.vectorSnapshot import link_parts, new_snapshot, publish_snapshot, snapshot_path
+from models.vectorIndex import (
+    INDEX_TYPE,
+    REMOVABLE_TYPES,
+    add_vectors,
+    build_index,
+    choose_index_type,
+    effective_quantization,
+    index_type_of,
+    new_index,
+    quantization_of,
+    read_index,
+    write_index,
+)
+
 DATA_PATH = "data/raw_pdfs"
+# Each run that changes anything writes a new snapshot under VECTOR_DB_PATH
+# and publishes it atomically (see models/vectorSnapshot.py)
 VECTOR_DB_PATH = "vector_db"
-INDEX_PATH = os.path.join(VECTOR_DB_PATH, "index.faiss")
-DOC_PATH = os.path.join(VECTOR_DB_PATH, "documents.pkl")
-
-
-def extract_text_from_pdf(pdf_path):
+TOPIC_CONFIG_PATH = TOPIC_TAXONOMY_PATH
+MANIFEST_VERSION = 1
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 256))
+# Embedded chunks are spilled to a scratch chunk store every this many, so
+# their texts and vectors aren't all held in memory until the snapshot is
+# written
+INGEST_SPILL_CHUNKS = int(os.getenv("INGEST_SPILL_CHUNKS", 50_000))
+
+_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=400,
+    chunk_overlap=50
+)
+
+
+class StageStats:
+    """Per-stage item counts and busy time for the throughput report."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts = {}
+        self.seconds = {}
+
+    def add(self, stage, count, seconds):
+        self.counts[stage] = self.counts.get(stage, 0) + count
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self):
+        wall = time.perf_counter() - self.started
+        print(f"Ingestion finished in {wall:.1f}s")
+        for stage, count in self.counts.items():
+            busy = self.seconds[stage]
+            busy_rate = count / busy if busy else float("inf")
+            print(f"  {stage:>8}: {count:>8} total, {count / wall:>9.1f}/s wall, {busy_rate:>9.1f}/s busy")
+
+
+def extract_pages(pdf_path):
+    # Runs in a worker process; returns page texts rather than one
+    # concatenated string so no page is copied more than once.
+    start = time.perf_counter()
     reader = PdfReader(pdf_path)
-    text = ""
+    pages = []
 
-    for page in reader.pages:
+    for page_no, page in enumerate(reader.pages, start=1):
         page_text = page.extract_text()
         if page_text:
-            text += page_text
+            pages.append((page_no, page_text))
 
-    return text
+    return pdf_path, pages, time.perf_counter() - start
 
 
 def chunk_text(text):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=400,
-        chunk_overlap=50
-    )
-    return splitter.split_text(text)
+    return _splitter.split_text(text)
+
+
+def use_course(course_id):
+    """Point every path at ``course_id``'s PDFs and vector DB."""
+
+    global DATA_PATH, VECTOR_DB_PATH, TOPIC_CONFIG_PATH
+
+    VECTOR_DB_PATH, DATA_PATH = course_paths(course_id, "vector_db", "data")
+    # A course's hand-written taxonomy sits next to its PDFs
+    TOPIC_CONFIG_PATH = TOPIC_TAXONOMY_PATH if course_id == DEFAULT_COURSE else os.path.join(DATA_PATH, "topics.json")
+
+
+def file_sha256(path):
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def scan_sources():
+    """{source: (path, size, mtime)} keyed by path relative to DATA_PATH."""
+
+    sources = {}
+    for root, dirs, files in os.walk(DATA_PATH):
+        for file in sorted(files):
+            if file.lower().endswith(".pdf"):
+                path = os.path.join(root, file)
+                st = os.stat(path)
+                sources[os.path.relpath(path, DATA_PATH)] = (path, st.st_size, st.st_mtime_ns)
+    return sources
+
+
+def diff_sources(manifest, on_disk):
+    """Split sources into (changed, deleted).
+
+    Size and mtime short-circuit hashing; a touched but identical file only
+    has its manifest stat refreshed.
+    """
+
+    changed = {}
+    for source, (path, size, mtime) in on_disk.items():
+        entry = manifest["sources"].get(source)
+        if entry and entry["size"] == size and entry["mtime"] == mtime:
+            continue
+
+        digest = file_sha256(path)
+        if entry and entry["sha256"] == digest:
+            entry["size"], entry["mtime"] = size, mtime
+            continue
+
+        changed[source] = {"sha256": digest, "size": size, "mtime": mtime, "chunks": []}
+
+    deleted = [source for source in manifest["sources"] if source not in on_disk]
+
+    return changed, deleted
+
+
+def parse_pdfs(paths, stats, workers=INGEST_WORKERS):
+    """Yield (path, page_no, text) as worker processes finish each PDF.
+
+    Only ``2 * workers`` PDFs are in flight at once, so parsed pages never
+    pile up faster than the embedding stage consumes them.
+    """
+
+    paths = iter(paths)
+    window = max(1, workers) * 2
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = set()
+        for path in paths:
+            pending.add(pool.submit(extract_pages, path))
+            if len(pending) < window:
+                continue
+            yield from _drain_one(pending, stats)
+
+        while pending:
+            yield from _drain_one(pending, stats)
+
+
+def _drain_one(pending, stats):
+    # Whichever PDF finished first, so one slow file doesn't hold back the
+    # pages of those done after it
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    future = done.pop()
+    pending.remove(future)
+
+    path, pages, seconds = future.result()
+    print(f"Processing changed file: {path}")
+
+    if sum(len(text.strip()) for _, text in pages) < 50:
+        print("Skipping empty or scanned document.")
+        return
+
+    stats.add("pages", len(pages), seconds)
+
+    for page_no, text in pages:
+        yield path, page_no, text
+
+
+def chunk_pages(pages, stats):
+
+    for path, page_no, text in pages:
+        start = time.perf_counter()
+        chunks = chunk_text(text)
+        stats.add("chunks", len(chunks), time.perf_counter() - start)
+
+        for chunk in chunks:
+            yield {
+                "text": chunk,
+                "source": os.path.relpath(path, DATA_PATH),
+                "page": page_no
+            }
+
+
+def assign_ids(chunks, manifest, changed, upserts, stale_ids):
+    """Give each chunk an id and yield only the ones that need embedding.
+
+    A chunk whose text hash existed in the previous version of its file
+    keeps its old id and vector; whatever old ids are left unclaimed end up
+    in ``stale_ids``.
+    """
+
+    reusable = {}
+    for source in changed:
+        old = manifest["sources"].get(source)
+        for chunk_id, digest in (old["chunks"] if old else []):
+            reusable.setdefault((source, digest), []).append(chunk_id)
+
+    for doc in chunks:
+        digest = chunk_hash(doc["text"])
+        previous = reusable.get((doc["source"], digest))
+        reused = bool(previous)
+
+        if reused:
+            chunk_id = previous.pop()
+        else:
+            chunk_id = manifest["next_id"]
+            manifest["next_id"] += 1
+
+        # Reused chunks still refresh their metadata (e.g. a shifted page)
+        upserts[chunk_id] = doc
+        changed[doc["source"]]["chunks"].append([chunk_id, digest])
+
+        if not reused:
+            yield chunk_id, doc
+
+    for ids in reusable.values():
+        stale_ids.extend(ids)
+
+
+def batched(items, size):
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_texts(texts):
+
+    return encode_texts(texts, batch_size=64)
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "next_id": 0, "sources": {}, "embedding": embedding_config()}
 
 
 def load_existing_data():
+    """(index, store, manifest, path) of the current snapshot.
 
-    if os.path.exists(INDEX_PATH) and os.path.exists(DOC_PATH):
-        print("Loading existing vector database...")
+    ``path`` is None when there is nothing to build on and every PDF gets
+    (re-)ingested.
+    """
 
-        index = faiss.read_index(INDEX_PATH)
+    current = snapshot_path(VECTOR_DB_PATH)
+    index_path = os.path.join(current, "index.faiss")
+    manifest_path = os.path.join(current, "manifest.json")
+    store = open_chunk_store(os.path.join(current, "chunks"))
 
-        with open(DOC_PATH, "rb") as f:
-            documents = pickle.load(f)
+    if os.path.exists(index_path) and store is not None and os.path.exists(manifest_path):
+        print(f"Loading existing vector database from {current}...")
 
-        existing_sources = set(doc["source"] for doc in documents)
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
 
-        return index, documents, existing_sources
+        if manifest.get("embedding") == embedding_config() and (store.vectors is not None or not len(store)):
+            return read_index(index_path), store, manifest, current
 
-    print("No existing vector DB found. Creating new one.")
+        # Vectors of a different model or EMBED_DIM can't be mixed with new
+        # ones, and stores without a vector column can't be rescored.
+        print(f"Embedding settings changed to {embedding_config()}. Re-ingesting all PDFs.")
+        store.close()
+        return None, None, empty_manifest(), None
 
-    return None, [], set()
+    if os.path.exists(index_path):
+        print("Existing vector DB predates the manifest and chunk store. Rebuilding it from scratch.")
+    else:
+        print("No existing vector DB found. Creating new one.")
 
+    return None, None, empty_manifest(), None
 
-def ingest_new_documents(existing_sources):
 
-    documents = []
+def save_manifest(manifest, path):
 
-    for root, dirs, files in os.walk(DATA_PATH):
-        for file in files:
-            if file.lower().endswith(".pdf") and file not in existing_sources:
+    manifest_path = os.path.join(path, "manifest.json")
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
 
-                full_path = os.path.join(root, file)
-                print(f"Processing NEW file: {full_path}")
 
-                text = extract_text_from_pdf(full_path)
+def save_data(index, manifest, path):
 
-                if len(text.strip()) < 50:
-                    print("Skipping empty or scanned document.")
-                    continue
+    write_index(index, os.path.join(path, "index.faiss"))
 
-                chunks = chunk_text(text)
+    save_manifest(manifest, path)
 
-                for chunk in chunks:
-                    documents.append({
-                        "text": chunk,
-                        "source": file
-                    })
 
-    return documents
+@contextmanager
+def staged_snapshot():
+    """Directory of a new snapshot: published if the block completes, discarded if it fails."""
 
+    name, path = new_snapshot(VECTOR_DB_PATH)
+    try:
+        yield path
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    publish_snapshot(VECTOR_DB_PATH, name)
+    print(f"Published snapshot {name}")
 
-def save_data(index, documents):
 
-    os.makedirs(VECTOR_DB_PATH, exist_ok=True)
+def rebuild_index(store, index_type):
 
-    faiss.write_index(index, INDEX_PATH)
+    if store.vectors is not None:
+        # The chunk store keeps every float vector, so changing index type or
+        # quantization never needs the model.
+        ids, vectors = np.asarray(store.ids), store.vectors
+    else:
+        ids = np.asarray(store.ids)
+        vectors = np.vstack([
+            embed_texts([store.text(chunk_id) for chunk_id in batch])
+            for batch in batched(ids, EMBED_BATCH_SIZE)
+        ])
 
-    with open(DOC_PATH, "wb") as f:
-        pickle.dump(documents, f)
+    return build_index(vectors, index_type, ids)
 
 
-def main():
+def spill_chunks(path, spilled, upserts, base):
+    """Merge ``upserts`` into the scratch chunk store at ``path`` and return it.
+
+    Reused chunks carry no vector; theirs is copied from ``base``, so the
+    scratch store keeps a vector for every row.
+    """
+
+    if base is not None and base.vectors is not None:
+        for chunk_id, doc in upserts.items():
+            if "vector" not in doc and chunk_id in base:
+                doc["vector"] = base.vectors_for([chunk_id])[0]
+    merged = write_chunk_store(path, spilled, upserts)
+    if spilled is not None:
+        spilled.close()
+    return merged
+
+
+def update_keyword_index(store, path, base_path=None, added=None, removed=()):
+    """Write the BM25 index for ``store`` into snapshot ``path``.
 
-    model = SentenceTransformer(
-        "sentence-transformers/static-retrieval-mrl-en-v1",
-        device="cpu"
+    Incremental when ``base_path`` has a keyword index: only ``added``
+    texts are tokenized. Otherwise (first run, a re-ingest, or a DB
+    ingested before keyword search existed) every chunk in the store is
+    indexed.
+    """
+
+    base = open_keyword_index(os.path.join(base_path, "bm25")) if base_path else None
+    if base is None:
+        added = StoreTexts(store)
+        removed = ()
+
+    start = time.perf_counter()
+    keywords = write_keyword_index(os.path.join(path, "bm25"), base, added, removed)
+    print(f"Keyword index: {len(keywords)} chunks, {len(keywords.terms)} terms ({time.perf_counter() - start:.2f}s)")
+
+
+def build_topics(store, manifest, base_path=None):
+    """(taxonomy, changed): only sources that changed since ``base_path``'s taxonomy are re-clustered."""
+
+    base = open_taxonomy(os.path.join(base_path, "topics")) if base_path else None
+    start = time.perf_counter()
+    taxonomy, rebuilt = build_taxonomy(store, manifest, base, encode=embed_texts, config_path=TOPIC_CONFIG_PATH)
+    print(
+        f"Topics: {len(taxonomy)} {taxonomy.meta['origin']} topics, {len(taxonomy.prototypes)} prototypes, "
+        f"{rebuilt} rebuilt ({time.perf_counter() - start:.2f}s)"
     )
+    return taxonomy, base is None or rebuilt > 0
+
 
-    index, existing_docs, existing_sources = load_existing_data()
+def target_index(n_chunks):
+    """(index_type, quantization) the current settings call for."""
 
-    new_docs = ingest_new_documents(existing_sources)
+    index_type = INDEX_TYPE
+    if index_type == "auto":
+        index_type = choose_index_type(n_chunks)
+    return index_type, effective_quantization(index_type)
 
-    if not new_docs:
-        print("No new PDFs found.")
+
+def index_matches(index, n_chunks):
+    return (index_type_of(index), quantization_of(index)) == target_index(n_chunks)
+
+
+def refresh_snapshot(index, store, manifest, current):
+    """With no PDF changes, publish a new snapshot only if something else calls for one.
+
+    That is a missing keyword index, a new or edited topics.json, or index
+    settings that no longer match; unchanged parts are hard-linked from
+    the current snapshot.
+    """
+
+    missing_keywords = open_keyword_index(os.path.join(current, "bm25")) is None
+    taxonomy, topics_changed = build_topics(store, manifest, current)
+    reindex = index is not None and len(store) and not index_matches(index, len(store))
+
+    if not (missing_keywords or topics_changed or reindex):
+        # At most the stat cache changed; what the server reads is the same
+        save_manifest(manifest, current)
         return
 
-    texts = [doc["text"] for doc in new_docs]
+    with staged_snapshot() as snapshot:
+        link_parts(current, snapshot, [
+            part for part, rewritten in (
+                ("chunks", False), ("bm25", missing_keywords), ("topics", topics_changed), ("index.faiss", reindex)
+            ) if not rewritten
+        ])
+        if missing_keywords:
+            update_keyword_index(store, snapshot)
+        if topics_changed:
+            write_taxonomy(os.path.join(snapshot, "topics"), taxonomy)
+        if reindex:
+            index_type, quantization = target_index(len(store))
+            print(f"Rebuilding vector DB as {index_type} index ({quantization} quantization) for {len(store)} chunks...")
+            write_index(rebuild_index(store, index_type), os.path.join(snapshot, "index.faiss"))
+        save_manifest(manifest, snapshot)
 
-    print("Embedding new chunks...")
 
-    embeddings = model.encode(
-        texts,
-        batch_size=64,
-        normalize_embeddings=True,
-        show_progress_bar=True
-    )
+def main():
 
-    embeddings = np.array(embeddings).astype("float32")
+    index, store, manifest, current = load_existing_data()
 
-    if index is None:
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
+    changed, deleted = diff_sources(manifest, scan_sources())
+
+    if not changed and not deleted:
+        print("No new, changed or deleted PDFs found.")
+        if store is not None:
+            refresh_snapshot(index, store, manifest, current)
+        return
+
+    stale_ids = []
+    for source in deleted:
+        print(f"Removing deleted file: {source}")
+        stale_ids.extend(chunk_id for chunk_id, _ in manifest["sources"].pop(source)["chunks"])
 
-    index.add(embeddings)
+    spill_path = os.path.join(VECTOR_DB_PATH, "spill", "chunks")
+    try:
+        ingest_changed(index, store, manifest, current, changed, stale_ids, spill_path)
+    finally:
+        shutil.rmtree(os.path.dirname(spill_path), ignore_errors=True)
 
-    all_documents = existing_docs + new_docs
 
-    save_data(index, all_documents)
+def ingest_changed(index, store, manifest, current, changed, stale_ids, spill_path):
 
+    stats = StageStats()
+    pages = parse_pdfs([os.path.join(DATA_PATH, source) for source in changed], stats)
+    upserts = {}
+    spilled = None
+    added_ids = []
+    to_embed = assign_ids(chunk_pages(pages, stats), manifest, changed, upserts, stale_ids)
+
+    for batch in batched(to_embed, EMBED_BATCH_SIZE):
+        start = time.perf_counter()
+        ids = np.array([chunk_id for chunk_id, _ in batch], dtype="int64")
+        embeddings = embed_texts([doc["text"] for _, doc in batch])
+        for (chunk_id, doc), vector in zip(batch, embeddings):
+            doc["vector"] = vector
+        added_ids.extend(ids.tolist())
+
+        if index is None:
+            # Stage into an exact index; trained index types are built from
+            # it once the final corpus size is known.
+            index = new_index("flat", embeddings.shape[1], quantization="none")
+
+        add_vectors(index, embeddings, ids)
+        stats.add("vectors", len(batch), time.perf_counter() - start)
+
+        # Every chunk in upserts has been embedded by now
+        if len(upserts) >= INGEST_SPILL_CHUNKS:
+            spilled = spill_chunks(spill_path, spilled, upserts, store)
+            upserts.clear()
+
+    if spilled is not None:
+        if upserts:
+            spilled = spill_chunks(spill_path, spilled, upserts, store)
+        upserts = StoreRows(spilled)
+
+    manifest["sources"].update(changed)
+
+    if index is None:
+        print("No indexable text found in the changed PDFs.")
+        return
+
+    needs_rebuild = False
+    if stale_ids:
+        if index_type_of(index) in REMOVABLE_TYPES:
+            index.remove_ids(np.array(stale_ids, dtype="int64"))
+        else:
+            needs_rebuild = True
+        print(f"Removed {len(stale_ids)} stale chunks")
+
+    with staged_snapshot() as snapshot:
+        new_store = write_chunk_store(os.path.join(snapshot, "chunks"), store, upserts, stale_ids)
+        if store is not None:
+            store.close()
+        if spilled is not None:
+            spilled.close()
+
+        # Without a base store this is a full (re-)ingest; the old keyword
+        # index and taxonomy, if any, describe chunks that no longer exist.
+        update_keyword_index(new_store, snapshot, current, StoreTexts(new_store, added_ids), stale_ids)
+        taxonomy, _ = build_topics(new_store, manifest, current)
+        write_taxonomy(os.path.join(snapshot, "topics"), taxonomy)
+
+        index_type, quantization = target_index(len(new_store))
+
+        if not len(new_store):
+            index = new_index("flat", index.d)
+        elif needs_rebuild or not index_matches(index, len(new_store)):
+            print(f"Rebuilding vector DB as {index_type} index ({quantization} quantization) for {len(new_store)} chunks...")
+            index = rebuild_index(new_store, index_type)
+
+        save_data(index, manifest, snapshot)
+
+    stats.report()
     print("Vector DB updated!")
-    print(f"Total chunks stored: {len(all_documents)}")
+    print(f"Total chunks stored: {len(new_store)}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a course's PDFs into its vector DB")
+    parser.add_argument(
+        "--course",
+        default=DEFAULT_COURSE,
+        help=f"course id; PDFs are read from data/courses/<id> (default: {DEFAULT_COURSE}, from data/raw_pdfs)",
+    )
+    args = parser.parse_args()
+
+    try:
+        use_course(args.course)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if not os.path.isdir(DATA_PATH):
+        raise SystemExit(f"No PDF directory {DATA_PATH} for course {args.course!r}.")
     main()
@@ -1,28 +1,21 @@
-import faiss
-import pickle
 import os
-import numpy as np
-from sentence_transformers import SentenceTransformer
 
-VECTOR_DB_PATH = "vector_db"
-INDEX_PATH = os.path.join(VECTOR_DB_PATH, "index.faiss")
-DOC_PATH = os.path.join(VECTOR_DB_PATH, "documents.pkl")
-
-os.makedirs(VECTOR_DB_PATH, exist_ok=True)
+from models.chunkStore import write_chunk_store
+from models.llm_model import encode_texts
+from models.vectorIndex import build_index, write_index
+from models.vectorSnapshot import new_snapshot, publish_snapshot
 
-model = SentenceTransformer("sentence-transformers/static-retrieval-mrl-en-v1", device="cpu")
+VECTOR_DB_PATH = "vector_db"
 
 text = "Welcome to the Academic Agent! This is a sample context for testing."
-embedding = model.encode([text], normalize_embeddings=True)
-embedding = np.array(embedding).astype("float32")
-
-index = faiss.IndexFlatL2(embedding.shape[1])
-index.add(embedding)
+embedding = encode_texts([text])
 
-documents = [{"text": text, "source": "welcome.txt"}]
+index = build_index(embedding, "flat")
 
-faiss.write_index(index, INDEX_PATH)
-with open(DOC_PATH, "wb") as f:
-    pickle.dump(documents, f)
+# Written as a new snapshot, so a running server swaps to it like to any ingestion
+name, snapshot = new_snapshot(VECTOR_DB_PATH)
+write_index(index, os.path.join(snapshot, "index.faiss"))
+write_chunk_store(os.path.join(snapshot, "chunks"), upserts={0: {"text": text, "source": "welcome.txt", "vector": embedding[0]}})
+publish_snapshot(VECTOR_DB_PATH, name)
 
 print("Vector DB initialized with sample data!")
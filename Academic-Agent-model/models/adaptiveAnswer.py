@@ -1,6 +1,7 @@
-from models.llm import generate_answer
+from models.llm import astream_prompt, complete, stream_prompt
 
-def generate_adaptive_answer(context_chunks, question, misconceptions):
+
+def build_adaptive_prompt(context_chunks, question, misconceptions):
 
     context = "\n\n".join(context_chunks)
 
@@ -13,11 +14,18 @@ def generate_adaptive_answer(context_chunks, question, misconceptions):
             + "\n\nPlease simplify and explicitly correct these misunderstandings.\n"
         )
 
-    prompt = f"""
+    # The context appears here only; the prompt is sent as is rather than
+    # being wrapped in llm.build_prompt, which would add it a second time.
+    return f"""
 You are an expert university tutor.
 
-{misconception_text}
+Answer using the provided context. If the answer is not in it, say:
+"I don't find this in the provided academic material."
+
+Context:
+{context}
 
+{misconception_text}
 Student question:
 {question}
 
@@ -25,9 +33,25 @@ Explain clearly with:
 - simple language
 - one example
 - step by step reasoning
-
-Context:
-{context}
 """
 
-    return generate_answer(context_chunks, prompt)
+
+def generate_adaptive_answer(context_chunks, question, misconceptions):
+
+    prompt = build_adaptive_prompt(context_chunks, question, misconceptions)
+
+    return complete(prompt)
+
+
+def stream_adaptive_answer(context_chunks, question, misconceptions):
+
+    prompt = build_adaptive_prompt(context_chunks, question, misconceptions)
+
+    return stream_prompt(prompt)
+
+
+async def astream_adaptive_answer(context_chunks, question, misconceptions):
+
+    prompt = build_adaptive_prompt(context_chunks, question, misconceptions)
+
+    return await astream_prompt(prompt)
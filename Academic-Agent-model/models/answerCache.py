@@ -0,0 +1,123 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 2000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+
+SHARED_SCOPE = "shared"
+
+
+def answer_scope(student_id, misconceptions):
+    """Cache partition for an answer.
+
+    Answers that were personalized with a student's misconceptions are only
+    reusable by that same student with that same misconception list; plain
+    answers are shared across the class.
+    """
+
+    if not misconceptions:
+        return SHARED_SCOPE
+    digest = hashlib.sha1("\n".join(misconceptions).encode("utf-8")).hexdigest()[:16]
+    return f"student:{student_id}:{digest}"
+
+
+class AnswerCache:
+    """Semantic cache of generated answers.
+
+    An entry is reused when a new question retrieves exactly the same
+    context chunks, falls in the same personalization scope, and its
+    embedding is within ``threshold`` cosine similarity of the cached
+    question. Entries expire after ``ttl`` seconds, the least recently used
+    are evicted past ``max_entries``. Callers put the course and its
+    vector DB version in the scope, so answers never cross corpora and
+    those of a replaced corpus simply age out.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+
+    def _remove(self, entry_id):
+        bucket_key, _, _, _ = self._entries.pop(entry_id)
+        bucket = self._buckets[bucket_key]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self._buckets[bucket_key]
+
+    def lookup(self, query_vector, context_ids, scope):
+        if not self.enabled:
+            return None
+
+        bucket_key = (scope, tuple(context_ids))
+        now = time.time()
+
+        with self._lock:
+            entry_ids = []
+            for entry_id in list(self._buckets.get(bucket_key, ())):
+                if now - self._entries[entry_id][3] > self.ttl:
+                    self._remove(entry_id)
+                else:
+                    entry_ids.append(entry_id)
+
+            if entry_ids:
+                vectors = np.stack([self._entries[entry_id][1] for entry_id in entry_ids])
+                scores = vectors @ np.asarray(query_vector, dtype="float32").reshape(-1)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = entry_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id][2]
+
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, context_ids, scope, answer):
+        if not self.enabled or not answer:
+            return
+
+        bucket_key = (scope, tuple(context_ids))
+        vector = np.asarray(query_vector, dtype="float32").reshape(-1)
+
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (bucket_key, vector, answer, time.time())
+            self._buckets.setdefault(bucket_key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
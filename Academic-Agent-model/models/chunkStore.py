@@ -0,0 +1,268 @@
+import json
+import mmap
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+# On-disk layout of a chunk store directory, all rows sorted by chunk id:
+#   ids.npy      int64[n]    chunk ids (the ids vectors are stored under)
+#   offsets.npy  int64[n+1]  byte offsets of each chunk in text.bin
+#   text.bin                 concatenated UTF-8 chunk texts
+#   source.npy   int32[n]    index into sources.json
+#   page.npy     int32[n]    1-based PDF page (0 if unknown)
+#   sources.json             source names
+#   vectors.npy  float32[n, dim]  normalized embeddings (optional; present
+#                             when every row has one)
+FORMAT_VERSION = 1
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of chunk texts and metadata.
+
+    Every array is opened with mmap, so worker processes share the same
+    page-cache pages instead of each unpickling a private copy, and a lookup
+    touches only the bytes of the requested chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, "sources.json"), "r") as f:
+            meta = json.load(f)
+        self.sources = meta["sources"]
+
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.source_idx = np.load(os.path.join(path, "source.npy"), mmap_mode="r")
+        self.pages = np.load(os.path.join(path, "page.npy"), mmap_mode="r")
+
+        vectors_path = os.path.join(path, "vectors.npy")
+        self.vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+
+        self._text_file = open(os.path.join(path, "text.bin"), "rb")
+        if os.fstat(self._text_file.fileno()).st_size:
+            self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, chunk_id):
+        pos = int(np.searchsorted(self.ids, chunk_id))
+        if pos < len(self.ids) and self.ids[pos] == chunk_id:
+            return pos
+        return -1
+
+    def __contains__(self, chunk_id):
+        return self.position(chunk_id) >= 0
+
+    def _position_or_raise(self, chunk_id):
+        pos = self.position(chunk_id)
+        if pos < 0:
+            raise KeyError(chunk_id)
+        return pos
+
+    def text_bytes(self, chunk_id):
+        pos = self._position_or_raise(chunk_id)
+        return memoryview(self._text)[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def text(self, chunk_id):
+        return str(self.text_bytes(chunk_id), "utf-8")
+
+    def source(self, chunk_id):
+        return self.sources[self.source_idx[self._position_or_raise(chunk_id)]]
+
+    def page(self, chunk_id):
+        return int(self.pages[self._position_or_raise(chunk_id)])
+
+    def vectors_for(self, chunk_ids):
+        """Stored float vectors for ``chunk_ids`` (used to rescore quantized
+        search results), or None if this store has no vector column."""
+
+        if self.vectors is None:
+            return None
+        chunk_ids = np.asarray(chunk_ids, dtype="int64")
+        positions = np.searchsorted(self.ids, chunk_ids)
+        positions = np.minimum(positions, len(self.ids) - 1)
+        if not np.array_equal(self.ids[positions], chunk_ids):
+            raise KeyError(chunk_ids[self.ids[positions] != chunk_ids][0])
+        return self.vectors[positions]
+
+    def __getitem__(self, chunk_id):
+        pos = self._position_or_raise(chunk_id)
+        return {
+            "text": str(memoryview(self._text)[self.offsets[pos]:self.offsets[pos + 1]], "utf-8"),
+            "source": self.sources[self.source_idx[pos]],
+            "page": int(self.pages[pos]),
+        }
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text_file.close()
+
+
+class StoreRows(Mapping):
+    """Rows of a chunk store as the id -> chunk dict mapping that
+    write_chunk_store takes as upserts, with each row's vector when the
+    store has them. Rows are read on access, never all held at once."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return (int(chunk_id) for chunk_id in self.store.ids)
+
+    def __getitem__(self, chunk_id):
+        doc = self.store[chunk_id]
+        if self.store.vectors is not None:
+            doc["vector"] = self.store.vectors[self.store.position(chunk_id)]
+        return doc
+
+
+class StoreTexts(Mapping):
+    """id -> text of ``ids`` (default: every chunk) in a chunk store, read on access."""
+
+    def __init__(self, store, ids=None):
+        self.store = store
+        self.ids = store.ids if ids is None else ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (int(chunk_id) for chunk_id in self.ids)
+
+    def __getitem__(self, chunk_id):
+        return self.store.text(chunk_id)
+
+
+def open_chunk_store(path):
+    if not os.path.exists(os.path.join(path, "sources.json")):
+        return None
+    return ChunkStore(path)
+
+
+def write_chunk_store(path, base=None, upserts=None, removed=()):
+    """Write ``base`` minus ``removed``, plus ``upserts`` (id -> chunk dict).
+
+    A chunk dict may carry its embedding under "vector"; an upsert without
+    one keeps the vector already stored for that id. The vector column is
+    only written when every row ends up with a vector of the same width.
+
+    Existing rows are copied as raw bytes, so rewriting after a one-file
+    change needs memory proportional to that file, not to the corpus. The
+    new directory is swapped in with renames; readers holding the old
+    mmaps keep a valid view until they close it.
+    """
+
+    upserts = upserts or {}
+    removed = set(removed) | set(upserts)
+    base_vectors = base.vectors if base is not None and len(base) else None
+
+    sources = list(base.sources) if base is not None else []
+    source_lookup = {name: i for i, name in enumerate(sources)}
+
+    if base is not None and len(base):
+        base_ids = np.asarray(base.ids)
+        kept = np.flatnonzero(~np.isin(base_ids, np.fromiter(removed, dtype="int64", count=len(removed))))
+    else:
+        base_ids = np.empty(0, dtype="int64")
+        kept = np.empty(0, dtype="int64")
+
+    new_ids = np.array(sorted(upserts), dtype="int64")
+    all_ids = np.concatenate([base_ids[kept], new_ids])
+    order = np.argsort(all_ids, kind="stable")
+    n_kept = len(kept)
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    vector_source = _vector_source(base, base_vectors, upserts, new_ids)
+    if vector_source is not None:
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "vectors.npy"),
+            mode="w+",
+            dtype="float32",
+            shape=(len(all_ids), vector_source[1]),
+        )
+
+    offsets = np.zeros(len(all_ids) + 1, dtype="int64")
+    source_col = np.zeros(len(all_ids), dtype="int32")
+    page_col = np.zeros(len(all_ids), dtype="int32")
+
+    with open(os.path.join(tmp_path, "text.bin"), "wb") as f:
+        written = 0
+        for row, i in enumerate(order):
+            if i < n_kept:
+                pos = kept[i]
+                data = base._text[base.offsets[pos]:base.offsets[pos + 1]]
+                source_col[row] = base.source_idx[pos]
+                page_col[row] = base.pages[pos]
+                if vector_source is not None:
+                    vectors[row] = base_vectors[pos]
+            else:
+                doc = upserts[int(new_ids[i - n_kept])]
+                data = doc["text"].encode("utf-8")
+                if doc["source"] not in source_lookup:
+                    source_lookup[doc["source"]] = len(sources)
+                    sources.append(doc["source"])
+                source_col[row] = source_lookup[doc["source"]]
+                page_col[row] = doc.get("page", 0)
+                if vector_source is not None:
+                    vectors[row] = vector_source[0](int(new_ids[i - n_kept]), doc)
+            f.write(data)
+            written += len(data)
+            offsets[row + 1] = written
+
+    if vector_source is not None:
+        vectors.flush()
+        del vectors
+
+    np.save(os.path.join(tmp_path, "ids.npy"), all_ids[order])
+    np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp_path, "source.npy"), source_col)
+    np.save(os.path.join(tmp_path, "page.npy"), page_col)
+
+    with open(os.path.join(tmp_path, "sources.json"), "w") as f:
+        json.dump({"version": FORMAT_VERSION, "sources": sources}, f)
+
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return ChunkStore(path)
+
+
+def _vector_source(base, base_vectors, upserts, new_ids):
+    """(lookup, dim) for the vectors of upserted rows, or None if any row
+    would be missing one."""
+
+    dims = set()
+    if base_vectors is not None:
+        dims.add(base_vectors.shape[1])
+    for chunk_id in new_ids:
+        doc = upserts[int(chunk_id)]
+        if "vector" in doc:
+            dims.add(len(doc["vector"]))
+        elif base_vectors is None or base is None or int(chunk_id) not in base:
+            return None
+    if len(dims) != 1:
+        return None
+
+    def lookup(chunk_id, doc):
+        if "vector" in doc:
+            return doc["vector"]
+        return base_vectors[base.position(chunk_id)]
+
+    return lookup, dims.pop()
@@ -0,0 +1,167 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Embedding and FAISS search are CPU bound; a small dedicated pool keeps them
+# from starving the event loop without oversubscribing the (single) CPU.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", min(4, os.cpu_count() or 1)))
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+    return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+class Slot:
+
+    def __init__(self, limiter):
+        self._limiter = limiter
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release()
+
+
+class InflightLimiter:
+    """Caps concurrent work and tells callers to back off once saturated.
+
+    acquire() waits at most ``queue_timeout`` seconds for a free slot and
+    returns None when none frees up, so the caller can answer 503 instead of
+    piling more requests onto a saturated upstream.
+    """
+
+    def __init__(self, max_inflight, queue_timeout=0.0):
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            if self.queue_timeout > 0:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            elif self._semaphore.locked():
+                raise asyncio.TimeoutError
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return None
+        finally:
+            self.waiting -= 1
+
+        self.inflight += 1
+        return Slot(self)
+
+    def _release(self):
+        self.inflight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-item calls into one batched call.
+
+    Items submitted within ``max_wait`` seconds of the first one (or until
+    ``max_batch`` have arrived) are handed to ``fn(items)`` together on the
+    CPU pool; ``fn`` returns one result per item, which is fanned back out
+    to the waiting callers. One encode and one index search over a matrix
+    cost far less than the same number of single-row calls.
+
+    The wait only applies while a batch is already running: an item that
+    finds the batcher idle goes straight through, so a lone request pays
+    no added latency, and whatever queued up behind a running batch is
+    flushed as soon as it finishes.
+    """
+
+    def __init__(self, fn, max_batch=32, max_wait=0.002):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch or not self._running:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        self.largest = max(self.largest, len(batch))
+
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        if self._pending and not self._running:
+            self._flush()
+
+    async def _run(self, batch):
+        try:
+            results = await run_blocking(self.fn, [item for item, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        # A caller that went away has a cancelled future; skip it
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest,
+            "pending": len(self._pending),
+        }
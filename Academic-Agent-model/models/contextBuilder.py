@@ -0,0 +1,173 @@
+import os
+
+from models.llm import CHARS_PER_TOKEN, estimate_tokens
+
+# Estimated tokens (see llm.estimate_tokens) allowed for retrieved context
+# and for the student's past misconceptions in one prompt.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1200))
+MISCONCEPTION_TOKEN_BUDGET = int(os.getenv("MISCONCEPTION_TOKEN_BUDGET", 200))
+MAX_MISCONCEPTIONS = int(os.getenv("MAX_MISCONCEPTIONS", 5))
+
+# A passage that doesn't fit is cut down to the remaining budget, unless
+# fewer than this many tokens are left.
+MIN_PASSAGE_TOKENS = 48
+
+# Adjacent chunks share up to chunk_overlap (50) characters; shorter common
+# runs are treated as coincidence rather than overlap.
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 8
+
+
+class AssembledContext:
+    """Prompt inputs after merging, deduplication and budgeting."""
+
+    def __init__(self, passages, chunk_ids, misconceptions, context_tokens, misconception_tokens, dropped):
+        self.passages = passages
+        self.chunk_ids = chunk_ids
+        self.misconceptions = misconceptions
+        self.context_tokens = context_tokens
+        self.misconception_tokens = misconception_tokens
+        self.dropped = dropped
+
+    def stats(self):
+        return {
+            "passages": len(self.passages),
+            "chunks": len(self.chunk_ids),
+            "dropped_chunks": self.dropped,
+            "context_tokens": self.context_tokens,
+            "misconceptions": len(self.misconceptions),
+            "misconception_tokens": self.misconception_tokens,
+        }
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+def overlap_length(left, right, max_chars=MAX_OVERLAP_CHARS):
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+
+    for size in range(min(len(left), len(right), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def join_adjacent(left, right):
+    size = overlap_length(left, right)
+    if size:
+        return left + right[size:]
+    return left + "\n" + right
+
+
+def merge_chunks(chunks, documents=None):
+    """[(rank, ids, text)] passages from ranked (id, text) chunks.
+
+    Repeated chunks are dropped. Chunks with consecutive ids from the same
+    source are neighbours in the document (ingestion numbers a file's
+    chunks in order) and are joined into one passage without their shared
+    overlap; each passage ranks as its best chunk.
+    """
+
+    seen_ids, seen_texts, unique = set(), set(), []
+    for rank, (chunk_id, text) in enumerate(chunks):
+        key = _normalize(text)
+        if chunk_id in seen_ids or key in seen_texts or not key:
+            continue
+        seen_ids.add(chunk_id)
+        seen_texts.add(key)
+        unique.append((rank, chunk_id, text))
+
+    if documents is None:
+        return [(rank, [chunk_id], text) for rank, chunk_id, text in unique]
+
+    def source(chunk_id):
+        return documents.source(chunk_id) if chunk_id in documents else None
+
+    passages = []
+    for rank, chunk_id, text in sorted(unique, key=lambda c: (str(source(c[1])), c[1])):
+        previous = passages[-1] if passages else None
+        if (
+            previous is not None
+            and source(chunk_id) is not None
+            and source(previous[1][-1]) == source(chunk_id)
+            and previous[1][-1] + 1 == chunk_id
+        ):
+            previous[0] = min(previous[0], rank)
+            previous[1].append(chunk_id)
+            previous[2] = join_adjacent(previous[2], text)
+        else:
+            passages.append([rank, [chunk_id], text])
+
+    # A short chunk can be wholly repeated inside another passage
+    merged, kept = [], []
+    for passage in sorted(passages, key=lambda p: -len(p[2])):
+        key = _normalize(passage[2])
+        if any(key in other for other in kept):
+            continue
+        kept.append(key)
+        merged.append(tuple(passage))
+
+    return sorted(merged)
+
+
+def truncate_to_tokens(text, tokens):
+    if estimate_tokens(text) <= tokens:
+        return text
+    # One token's worth is left for the ellipsis
+    limit = (tokens - 1) * CHARS_PER_TOKEN
+    cut = text[:limit].rstrip()
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut + " ..."
+
+
+def select_misconceptions(misconceptions, budget=MISCONCEPTION_TOKEN_BUDGET, limit=MAX_MISCONCEPTIONS):
+    """The most recent distinct misconceptions that fit, oldest first.
+
+    The store returns them oldest first and they accumulate without bound;
+    repeats of the same wording count once.
+    """
+
+    chosen, seen, used = [], set(), 0
+    for text in reversed(misconceptions or []):
+        key = _normalize(text)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        tokens = estimate_tokens(text)
+        if len(chosen) >= limit or used + tokens > budget:
+            break
+        chosen.append(text)
+        used += tokens
+
+    return chosen[::-1], used
+
+
+def build_context(chunks, documents=None, misconceptions=None, budget=CONTEXT_TOKEN_BUDGET):
+    """Fit ranked (id, text) chunks and misconceptions into the token budgets.
+
+    Passages are taken best first until the context budget is spent; the
+    first one that doesn't fit is truncated when enough budget is left.
+    """
+
+    passages, chunk_ids, used = [], [], 0
+    for _, ids, text in merge_chunks(chunks, documents):
+        remaining = budget - used
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                continue
+            text = truncate_to_tokens(text, remaining)
+            tokens = estimate_tokens(text)
+        passages.append(text)
+        chunk_ids.extend(ids)
+        used += tokens
+
+    selected, misconception_tokens = select_misconceptions(misconceptions)
+
+    # Duplicates, contained chunks and whatever didn't fit
+    dropped = len(chunks) - len(chunk_ids)
+
+    return AssembledContext(passages, chunk_ids, selected, used, misconception_tokens, dropped)
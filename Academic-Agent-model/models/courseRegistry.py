@@ -0,0 +1,399 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from models.chunkStore import open_chunk_store
+from models.concurrency import run_blocking
+from models.keywordIndex import open_keyword_index
+from models.topicMapper import load_topic_classifier
+from models.vectorIndex import configure_search, read_index
+from models.vectorSnapshot import current_version, snapshot_path
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VECTOR_DB_PATH = os.path.join(BASE_DIR, "vector_db")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+# The default course keeps the original single-corpus layout (data/raw_pdfs
+# -> vector_db/); every other course has its PDFs in data/courses/<id> and
+# its vector DB in vector_db/courses/<id>.
+DEFAULT_COURSE = os.getenv("DEFAULT_COURSE", "default")
+
+# Loaded courses are evicted least recently used first once their combined
+# footprint passes COURSE_CACHE_MB, or there are more than COURSE_CACHE_SIZE.
+COURSE_CACHE_MB = float(os.getenv("COURSE_CACHE_MB", 1024))
+COURSE_CACHE_SIZE = int(os.getenv("COURSE_CACHE_SIZE", 32))
+
+# Seconds between checks for a newly published snapshot of a loaded course;
+# 0 disables hot reload.
+VECTOR_DB_RELOAD_INTERVAL = float(os.getenv("VECTOR_DB_RELOAD_INTERVAL", 5))
+
+COURSE_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# Files and directories of a vector DB that a loaded course holds open
+COURSE_PARTS = ("index.faiss", "chunks", "bm25", "topics")
+
+
+def check_course_id(course_id):
+    if not COURSE_ID_RE.match(course_id or "") or ".." in course_id:
+        raise ValueError(f"Invalid course id {course_id!r}")
+    return course_id
+
+
+def course_paths(course_id, vector_db=VECTOR_DB_PATH, data=DATA_DIR):
+    """(vector DB directory, PDF directory) of a course."""
+
+    if course_id == DEFAULT_COURSE:
+        return vector_db, os.path.join(data, "raw_pdfs")
+    check_course_id(course_id)
+    return os.path.join(vector_db, "courses", course_id), os.path.join(data, "courses", course_id)
+
+
+def course_topic(course_id, topic):
+    # Mastery and misconceptions are keyed by (student, topic); other
+    # courses' topics are prefixed so they never share rows.
+    if course_id == DEFAULT_COURSE or topic is None:
+        return topic
+    return f"{course_id}:{topic}"
+
+
+def footprint(path):
+    total = 0
+    for part in COURSE_PARTS:
+        part_path = os.path.join(path, part)
+        if os.path.isdir(part_path):
+            total += sum(entry.stat().st_size for entry in os.scandir(part_path) if entry.is_file())
+        elif os.path.exists(part_path):
+            total += os.path.getsize(part_path)
+    return total
+
+
+class Course:
+    """One snapshot of a course's vector DB: index, chunk store, BM25 index and topics.
+
+    Requests hold a reference (acquire/release) while they use it. Once the
+    registry has let go of it (evicted, or replaced by a newer snapshot) it
+    is retired, and its files are closed when the last reader releases it.
+    """
+
+    def __init__(self, course_id, path, index, documents, keywords, topics, version, nbytes):
+        self.course_id = course_id
+        self.path = path
+        self.index = index
+        self.documents = documents
+        self.keywords = keywords
+        self.topics = topics
+        # Cached answers are only valid for the corpus they were generated from
+        self.version = version
+        self.nbytes = nbytes
+        self.loaded_at = time.time()
+        self.readers = 0
+        self.retired = False
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def topic(self, topic_id):
+        return course_topic(self.course_id, topic_id)
+
+    def acquire(self):
+        with self._lock:
+            self.readers += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self.readers -= 1
+            close = self.retired and not self.readers and not self.closed
+            self.closed = self.closed or close
+        if close:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self.retired = True
+            close = not self.readers and not self.closed
+            self.closed = self.closed or close
+        if close:
+            self._close()
+
+    def _close(self):
+        self.documents.close()
+        self.index = self.keywords = None
+
+    def stats(self):
+        return {
+            "version": self.version if isinstance(self.version, str) else None,
+            "chunks": len(self.documents),
+            "mb": round(self.nbytes / 2**20, 2),
+            "loaded_at": self.loaded_at,
+            "readers": self.readers,
+            "topics": self.topics.stats(),
+        }
+
+
+def load_course(course_id):
+    """The course's current snapshot, or None when it hasn't been ingested."""
+
+    start = time.perf_counter()
+    root, _ = course_paths(course_id)
+    # Read the pointer once, so every part comes from the same snapshot
+    version = current_version(root)
+    path = snapshot_path(root, version)
+    index_path = os.path.join(path, "index.faiss")
+    documents = open_chunk_store(os.path.join(path, "chunks"))
+    if not os.path.exists(index_path) or documents is None:
+        return None
+
+    index = configure_search(read_index(index_path))
+    # Optional: a DB ingested before the keyword index existed is dense-only
+    keywords = open_keyword_index(os.path.join(path, "bm25"))
+    topics = load_topic_classifier(os.path.join(path, "topics"))
+
+    if version is None:
+        # Flat layout from before snapshots
+        stat = os.stat(index_path)
+        version = (stat.st_mtime_ns, stat.st_size, len(documents))
+    course = Course(course_id, path, index, documents, keywords, topics, version, footprint(path))
+    print(f"Loaded course {course_id!r} ({course.stats()['version'] or 'flat layout'}): {len(documents)} chunks, "
+          f"{course.nbytes / 2**20:.1f} MB ({time.perf_counter() - start:.2f}s)")
+    return course
+
+
+class CourseRegistry:
+    """Loaded courses, least recently used first, bounded by their footprint.
+
+    A course loads on first use; concurrent first requests for it share
+    that one load instead of each reading the index. Courses past the
+    budget are evicted, least recently used first; the most recently used
+    one is never evicted, whatever its size.
+
+    A watcher thread polls the CURRENT pointer of every loaded course and
+    loads a newly published snapshot in the background. The swap itself
+    is one dict assignment under the lock: requests that already hold the
+    old snapshot finish on it, new ones get the new one, and the old one
+    is closed when its last reader releases it.
+    """
+
+    def __init__(self, loader=load_course, max_mb=COURSE_CACHE_MB, max_courses=COURSE_CACHE_SIZE):
+        self.loader = loader
+        self.max_bytes = int(max_mb * 2**20)
+        self.max_courses = max(1, max_courses)
+        self._courses = OrderedDict()
+        self._loading = {}
+        self._draining = []
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.missing = 0
+        self.failures = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.reload_failures = 0
+
+    def peek(self, course_id):
+        """The course if it is loaded; never loads it or changes the LRU order."""
+
+        with self._lock:
+            return self._courses.get(course_id)
+
+    def _begin(self, course_id):
+        # (course, None, False) on a hit, with a reference taken; otherwise
+        # the load future and whether this caller has to run the load
+        with self._lock:
+            course = self._courses.get(course_id)
+            if course is not None:
+                self._courses.move_to_end(course_id)
+                self.hits += 1
+                return course.acquire(), None, False
+
+            future = self._loading.get(course_id)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+
+            future = self._loading[course_id] = Future()
+            self.loads += 1
+            return None, future, True
+
+    def _load(self, course_id, future):
+        try:
+            course = self.loader(course_id)
+        except BaseException as exc:
+            with self._lock:
+                del self._loading[course_id]
+                self.failures += 1
+            future.set_exception(exc)
+            return
+
+        evicted = []
+        with self._lock:
+            del self._loading[course_id]
+            if course is None:
+                # Not cached, so a course ingested later is picked up
+                self.missing += 1
+            else:
+                self._courses[course_id] = course
+                evicted = self._evict()
+        self._retire(evicted)
+        future.set_result(course)
+
+    def _evict(self):
+        evicted = []
+        while len(self._courses) > 1 and (
+            len(self._courses) > self.max_courses or self.loaded_bytes() > self.max_bytes
+        ):
+            course_id, course = self._courses.popitem(last=False)
+            self.evictions += 1
+            evicted.append(course)
+            print(f"Evicted course {course_id!r} ({course.nbytes / 2**20:.1f} MB)")
+        return evicted
+
+    def _retire(self, courses):
+        for course in courses:
+            course.retire()
+        with self._lock:
+            self._draining = [course for course in self._draining + courses if not course.closed]
+
+    def loaded_bytes(self):
+        return sum(course.nbytes for course in self._courses.values())
+
+    def acquire(self, course_id):
+        """Loaded course with a reference held, or None when it has no vector DB.
+
+        The caller must release() it. Raises ValueError for a bad id.
+        """
+
+        check_course_id(course_id)
+        while True:
+            course, future, owner = self._begin(course_id)
+            if course is not None:
+                return course
+            if owner:
+                self._load(course_id, future)
+            if future.result() is None:
+                return None
+            # Loaded; take the reference through the registry (it could
+            # already have been evicted again, then it is loaded again)
+
+    async def acquire_async(self, course_id):
+        # Waiters for a load in progress await it rather than holding a
+        # thread of the CPU pool
+        check_course_id(course_id)
+        while True:
+            course, future, owner = self._begin(course_id)
+            if course is not None:
+                return course
+            if owner:
+                await run_blocking(self._load, course_id, future)
+            if await asyncio.wrap_future(future) is None:
+                return None
+
+    def get(self, course_id):
+        """Loaded course without holding a reference, for scripts and warmup."""
+
+        course = self.acquire(course_id)
+        if course is not None:
+            course.release()
+        return course
+
+    def reload(self, course_id):
+        """Load the course's current snapshot and swap it in; False if nothing was swapped."""
+
+        try:
+            course = self.loader(course_id)
+        except Exception as exc:
+            with self._lock:
+                self.reload_failures += 1
+            print(f"Reloading course {course_id!r} failed; still serving the loaded snapshot: {exc}")
+            return False
+        if course is None:
+            return False
+
+        with self._lock:
+            old = self._courses.get(course_id)
+            if old is None:
+                # Evicted while loading
+                retired = [course]
+            else:
+                self._courses[course_id] = course
+                self.reloads += 1
+                retired = [old] + self._evict()
+        self._retire(retired)
+        if old is not None:
+            print(f"Swapped course {course_id!r} to snapshot {course.version}")
+        return old is not None
+
+    def check_for_updates(self):
+        """Reload every loaded course whose CURRENT pointer moved; the ids swapped."""
+
+        with self._lock:
+            loaded = [(course_id, course.version) for course_id, course in self._courses.items()]
+
+        swapped = []
+        for course_id, version in loaded:
+            latest = current_version(course_paths(course_id)[0])
+            if latest is not None and latest != version and self.reload(course_id):
+                swapped.append(course_id)
+        return swapped
+
+    def start_watching(self, interval=VECTOR_DB_RELOAD_INTERVAL):
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="course-reload", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self, timeout=5.0):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+            self._watcher = None
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check_for_updates()
+            except Exception as exc:
+                print(f"Vector DB reload check failed: {exc}")
+
+    def stats(self):
+        with self._lock:
+            courses = {course_id: course.stats() for course_id, course in self._courses.items()}
+            self._draining = [course for course in self._draining if not course.closed]
+            return {
+                "loaded": len(courses),
+                "loading": len(self._loading),
+                # Retired snapshots still held by in-flight requests
+                "draining": len(self._draining),
+                "mb": round(self.loaded_bytes() / 2**20, 2),
+                "max_mb": round(self.max_bytes / 2**20, 2),
+                "max_courses": self.max_courses,
+                "hits": self.hits,
+                "loads": self.loads,
+                "coalesced": self.coalesced,
+                "missing": self.missing,
+                "failures": self.failures,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "reload_failures": self.reload_failures,
+                "courses": courses,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_course_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CourseRegistry()
+    return _registry
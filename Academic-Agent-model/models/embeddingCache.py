@@ -0,0 +1,99 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    # The embedding tokenizer is uncased and whitespace-insensitive, so these
+    # variants embed identically and can share one cache entry.
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """Bounded LRU of query embeddings keyed by normalized text.
+
+    Optionally persisted to an .npz file so a restarted worker starts warm.
+    ``tag`` names the embedding settings; a file saved under another tag
+    (e.g. a different EMBED_DIM or EMBED_BACKEND) is ignored on load.
+    """
+
+    def __init__(self, max_entries=10_000, path=None, tag=""):
+        self.max_entries = max_entries
+        self.path = path
+        self.tag = tag
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        vector.flags.writeable = False
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return vector
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._entries)
+            vectors = np.stack(list(self._entries.values())) if keys else np.empty((0, 0), dtype="float32")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # A temp file per writer: workers sharing the path may save at once
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # Keys as a fixed-width unicode array, so loading never unpickles
+                np.savez(f, keys=np.array(keys, dtype=str), vectors=vectors, tag=np.array(self.tag))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            # A file from before keys were stored as unicode needs pickle; it
+            # is ignored and rebuilt
+            data = np.load(self.path, allow_pickle=False)
+            keys, vectors = data["keys"], data["vectors"]
+            tag = str(data["tag"]) if "tag" in data else ""
+        except (OSError, ValueError, KeyError):
+            print(f"Ignoring unreadable embedding cache at {self.path}")
+            return
+        if tag != self.tag:
+            print(f"Ignoring embedding cache at {self.path} saved with different embedding settings")
+            return
+        for key, vector in zip(keys[-self.max_entries:], vectors[-self.max_entries:]):
+            self.put(str(key), vector)
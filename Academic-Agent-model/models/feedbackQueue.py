@@ -0,0 +1,415 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from models.llmProvider import LatencyHistogram
+from models.misconceptionDetector import detect_misconceptions
+from models.studentModel import apply_feedback
+from models.studentStore import STUDENT_DB_PATH, connect, transaction
+
+# Jobs live next to the student store by default, so a restart picks up
+# whatever was still queued.
+FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH", STUDENT_DB_PATH)
+
+FEEDBACK_WORKERS = int(os.getenv("FEEDBACK_WORKERS", 2))
+# Misconception detections sent to the LLM in one call
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", 8))
+FEEDBACK_POLL_INTERVAL = float(os.getenv("FEEDBACK_POLL_INTERVAL", 1.0))
+# Detection attempts before the mastery update is applied without one; the
+# wait after a failed attempt doubles from FEEDBACK_RETRY_DELAY seconds. A
+# job whose resolve or apply fails is retried the same way, then given up.
+FEEDBACK_MAX_ATTEMPTS = int(os.getenv("FEEDBACK_MAX_ATTEMPTS", 3))
+FEEDBACK_RETRY_DELAY = float(os.getenv("FEEDBACK_RETRY_DELAY", 10))
+# A running job whose worker died is handed out again after this many seconds
+FEEDBACK_LEASE = float(os.getenv("FEEDBACK_LEASE", 300))
+# Finished jobs are kept this long for status lookups and duplicate checks
+FEEDBACK_RETENTION = float(os.getenv("FEEDBACK_RETENTION", 7 * 24 * 3600))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    student_id TEXT NOT NULL,
+    course_id TEXT,
+    topic TEXT,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    context TEXT,
+    understood INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    finished_at REAL,
+    misconception TEXT,
+    mastery REAL,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS feedback_jobs_ready ON feedback_jobs (status, available_at, id);
+CREATE INDEX IF NOT EXISTS feedback_jobs_student ON feedback_jobs (student_id, id);
+"""
+
+JOB_COLUMNS = (
+    "id", "key", "student_id", "course_id", "topic", "question", "answer", "context", "understood",
+    "status", "attempts", "enqueued_at", "finished_at", "misconception", "mastery", "error",
+)
+
+
+def feedback_key(student_id, question, answer, understood, course_id=None):
+    # Default idempotency key: the same verdict on the same answer counts once
+    payload = json.dumps([student_id, question, answer, bool(understood)] + ([course_id] if course_id else []))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class FeedbackJob:
+
+    def __init__(self, row):
+        for column, value in zip(JOB_COLUMNS, row):
+            setattr(self, column, value)
+        self.understood = bool(self.understood)
+        self.context = json.loads(self.context) if self.context is not None else None
+
+    def to_dict(self):
+        return {
+            "id": self.key,
+            "status": self.status,
+            "student_id": self.student_id,
+            "course_id": self.course_id,
+            "topic": self.topic,
+            "understood": self.understood,
+            "attempts": self.attempts,
+            "misconception": self.misconception,
+            "mastery": self.mastery,
+            "error": self.error,
+            "enqueued_at": self.enqueued_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class FeedbackQueue:
+    """Durable job queue in SQLite (WAL), shared by every worker process.
+
+    Jobs are claimed in id order under a lease. A student's jobs are never
+    handed out while an earlier one of theirs is running or backing off, so
+    mastery updates are applied in the order the feedback was given.
+    """
+
+    def __init__(self, path=FEEDBACK_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # Queues created before jobs carried a course
+        if "course_id" not in {row[1] for row in conn.execute("PRAGMA table_info(feedback_jobs)")}:
+            conn.execute("ALTER TABLE feedback_jobs ADD COLUMN course_id TEXT")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def enqueue(self, student_id, question, answer, understood, topic=None, context=None, key=None, course_id=None):
+        """(key, created); a key that is already queued or done isn't added again."""
+
+        key = key or feedback_key(student_id, question, answer, understood, course_id)
+        now = time.time()
+        created = self._connect().execute(
+            "INSERT OR IGNORE INTO feedback_jobs "
+            "(key, student_id, course_id, topic, question, answer, context, understood, enqueued_at, available_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, student_id, course_id, topic, question, answer,
+             json.dumps(context) if context is not None else None, int(bool(understood)), now, now),
+        ).rowcount
+        return key, bool(created)
+
+    def get(self, key):
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM feedback_jobs WHERE key = ?", (key,)
+        ).fetchone()
+        return FeedbackJob(row) if row else None
+
+    def claim(self, limit, lease=FEEDBACK_LEASE):
+        now = time.time()
+        with transaction(self._connect()) as conn:
+            # Jobs of a worker that died mid-batch
+            conn.execute(
+                "UPDATE feedback_jobs SET status = 'pending' WHERE status = 'running' AND lease_until < ?",
+                (now,),
+            )
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM feedback_jobs AS j "
+                "WHERE status = 'pending' AND available_at <= ? AND NOT EXISTS ("
+                "  SELECT 1 FROM feedback_jobs AS e WHERE e.student_id = j.student_id AND e.id < j.id"
+                "  AND (e.status = 'running' OR (e.status = 'pending' AND e.available_at > ?))"
+                ") ORDER BY id LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE feedback_jobs SET status = 'running', lease_until = ? WHERE id = ?",
+                [(now + lease, row[0]) for row in rows],
+            )
+        return [FeedbackJob(row) for row in rows]
+
+    def complete(self, job, misconception, mastery, error=None):
+        self._connect().execute(
+            "UPDATE feedback_jobs SET status = 'done', finished_at = ?, topic = ?, misconception = ?, "
+            "mastery = ?, error = ?, lease_until = NULL WHERE id = ?",
+            (time.time(), job.topic, misconception, mastery, error, job.id),
+        )
+
+    def retry(self, jobs, delay, error=None, count_attempt=True):
+        self._connect().executemany(
+            "UPDATE feedback_jobs SET status = 'pending', available_at = ?, attempts = attempts + ?, "
+            "error = ?, lease_until = NULL WHERE id = ?",
+            [(time.time() + delay, int(count_attempt), error, job.id) for job in jobs],
+        )
+
+    def prune(self, older_than=FEEDBACK_RETENTION):
+        return self._connect().execute(
+            "DELETE FROM feedback_jobs WHERE status = 'done' AND finished_at < ?",
+            (time.time() - older_than,),
+        ).rowcount
+
+    def stats(self):
+        conn = self._connect()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM feedback_jobs GROUP BY status").fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(enqueued_at) FROM feedback_jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()[0]
+        return {
+            "depth": counts.get(PENDING, 0) + counts.get(RUNNING, 0),
+            "pending": counts.get(PENDING, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            # Age of the oldest unfinished job: how far behind the workers are
+            "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        }
+
+
+class FeedbackWorkers:
+    """Threads that drain a FeedbackQueue.
+
+    Each batch is resolved (topic and context for jobs that arrived without
+    them), has its misconceptions detected in one LLM call, and is applied
+    to the student store once per job key, so a job redelivered after a
+    crash never counts twice. A job whose resolve or apply raises backs off
+    like a failed detection and, out of attempts, finishes with the error.
+
+    ``resolve(items)`` takes (course_id, question) pairs and returns one
+    (topic, context_chunks) per pair.
+    """
+
+    def __init__(
+        self,
+        queue,
+        resolve=None,
+        workers=FEEDBACK_WORKERS,
+        batch_size=FEEDBACK_BATCH_SIZE,
+        poll_interval=FEEDBACK_POLL_INTERVAL,
+        max_attempts=FEEDBACK_MAX_ATTEMPTS,
+        retry_delay=FEEDBACK_RETRY_DELAY,
+    ):
+        self.queue = queue
+        self.resolve = resolve
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Condition()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+        self.llm_calls = 0
+        self.detections = 0
+        self.detection_failures = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.lag = LatencyHistogram()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.queue.prune()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"feedback-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self.notify()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def notify(self):
+        with self._wake:
+            self._wake.notify_all()
+
+    def drain(self, timeout=30.0):
+        """Wait until nothing is queued or running; False on timeout."""
+
+        deadline = time.monotonic() + timeout
+        while self.queue.stats()["depth"]:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as exc:
+                with self._lock:
+                    self.errors += 1
+                print(f"Feedback worker error: {exc}")
+                processed = 0
+            if not processed:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+
+    def run_once(self):
+        jobs = self.queue.claim(self.batch_size)
+        if jobs:
+            self.process(jobs)
+        return len(jobs)
+
+    def fail(self, jobs, error):
+        """Back off jobs that raised; out of attempts, they finish with the error.
+
+        Returns the students whose jobs are backing off, so their later jobs
+        in the batch wait behind them.
+        """
+
+        retried = [job for job in jobs if job.attempts + 1 < self.max_attempts]
+        if retried:
+            self.queue.retry(retried, self.retry_delay * 2 ** max(job.attempts for job in retried), error)
+        for job in jobs:
+            if job.attempts + 1 >= self.max_attempts:
+                self.queue.complete(job, None, None, error)
+        with self._lock:
+            self.errors += len(jobs)
+        return {job.student_id for job in retried}
+
+    def process(self, jobs):
+        unresolved = [job for job in jobs if job.topic is None or (job.context is None and not job.understood)]
+        if unresolved:
+            error = "No topic for the question"
+            try:
+                resolved = self.resolve([(job.course_id, job.question) for job in unresolved])
+                for job, (topic, context) in zip(unresolved, resolved):
+                    job.topic = job.topic or topic
+                    job.context = job.context if job.context is not None else context
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                print(f"Feedback resolve failed for {len(unresolved)} jobs: {error}")
+            failed = [job for job in jobs if job.topic is None]
+            if failed:
+                blocked = self.fail(failed, error)
+                self.queue.retry(
+                    [job for job in jobs if job.student_id in blocked and job.topic is not None],
+                    0.0,
+                    count_attempt=False,
+                )
+                jobs = [job for job in jobs if job.topic is not None and job.student_id not in blocked]
+
+        misconceptions, deferred, calls, error = {}, set(), 0, None
+        confused = [job for job in jobs if not job.understood]
+        if confused:
+            try:
+                found, calls = detect_misconceptions([(job.context or [], job.question, job.answer) for job in confused])
+                misconceptions = {job.id: text for job, text in zip(confused, found)}
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                print(f"Misconception detection failed for {len(confused)} jobs: {error}")
+                # Retried later, unless out of attempts; then the mastery
+                # update goes ahead without a misconception
+                deferred = {job.student_id for job in confused if job.attempts + 1 < self.max_attempts}
+
+        if deferred:
+            # Keep each deferred student's later jobs behind the failed one
+            held = [job for job in jobs if job.student_id in deferred]
+            failed = [job for job in held if not job.understood]
+            delay = self.retry_delay * 2 ** max(job.attempts for job in failed)
+            self.queue.retry(failed, delay, error)
+            self.queue.retry([job for job in held if job.understood], 0.0, count_attempt=False)
+
+        applied = duplicates = 0
+        # Students with a job backing off after a failed apply
+        blocked, waiting = set(), []
+        for job in jobs:
+            if job.student_id in deferred:
+                continue
+            if job.student_id in blocked:
+                waiting.append(job)
+                continue
+            misconception = None if job.understood else misconceptions.get(job.id) or None
+            try:
+                mastery = apply_feedback(
+                    job.key, job.student_id, job.topic, 1 if job.understood else -1, misconception
+                )
+                self.queue.complete(job, misconception, mastery, None if job.understood or misconception else error)
+            except Exception as exc:
+                failure = f"{type(exc).__name__}: {exc}"
+                print(f"Feedback job {job.key} failed: {failure}")
+                blocked |= self.fail([job], failure)
+                continue
+            if mastery is None:
+                duplicates += 1
+            self.lag.observe(time.time() - job.enqueued_at)
+            applied += 1
+        if waiting:
+            self.queue.retry(waiting, 0.0, count_attempt=False)
+
+        with self._lock:
+            self.batches += 1
+            self.jobs += applied
+            self.llm_calls += calls
+            self.detections += sum(1 for text in misconceptions.values() if text)
+            self.detection_failures += len(confused) if error else 0
+            self.duplicates += duplicates
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "workers": len(self._threads),
+                "batch_size": self.batch_size,
+                "batches": self.batches,
+                "jobs": self.jobs,
+                "llm_calls": self.llm_calls,
+                "detections": self.detections,
+                "detection_failures": self.detection_failures,
+                "duplicates": self.duplicates,
+                "errors": self.errors,
+            }
+        stats["lag"] = self.lag.snapshot()
+        return stats
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_feedback_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = FeedbackQueue(FEEDBACK_DB_PATH)
+    return _queue
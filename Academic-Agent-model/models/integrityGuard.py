@@ -1,3 +1,33 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from models.concurrency import run_blocking
+from models.courseRegistry import COURSE_CACHE_SIZE, DATA_DIR, DEFAULT_COURSE, course_paths
+from models.llm_model import encode_texts
+
+# A course's policy is the built-in phrases and examples below plus its own
+# integrity.json: data/courses/<id>/integrity.json, or INTEGRITY_POLICY_PATH
+# for the default course. Edits are picked up within
+# INTEGRITY_RELOAD_INTERVAL seconds.
+INTEGRITY_POLICY_PATH = os.getenv("INTEGRITY_POLICY_PATH", os.path.join(DATA_DIR, "integrity.json"))
+INTEGRITY_POLICY_FILE = "integrity.json"
+INTEGRITY_RELOAD_INTERVAL = float(os.getenv("INTEGRITY_RELOAD_INTERVAL", 5))
+
+# With INTEGRITY_INTENT=1, a question is also refused for its intent when
+# its embedding scores at least INTEGRITY_INTENT_MIN_SCORE against a
+# cheating example and beats the best study example by
+# INTEGRITY_INTENT_MARGIN. Off by default: the thresholds depend on the
+# embedding model, so check them with benchmarks/bench_integrity.py first.
+INTEGRITY_INTENT = os.getenv("INTEGRITY_INTENT", "0") != "0"
+INTEGRITY_INTENT_MIN_SCORE = float(os.getenv("INTEGRITY_INTENT_MIN_SCORE", 0.6))
+INTEGRITY_INTENT_MARGIN = float(os.getenv("INTEGRITY_INTENT_MARGIN", 0.1))
+
 CHEAT_KEYWORDS = [
     "give answer",
     "exact answer",
@@ -8,19 +38,326 @@ CHEAT_KEYWORDS = [
     "exam answer",
     "assignment answer",
     "copy paste",
-    "direct answer"
+    "direct answer",
+    "give me the answer",
+    "just the answer",
+    "answer only",
+    "answer key",
+    "please solve",
+    "solve it for me",
+    "solve for me",
+    "do my homework",
+    "do my assignment",
+    "write my assignment",
+    "write my essay",
+    "do it for me",
+]
+
+CHEAT_INTENT_EXAMPLES = [
+    "give me the answer to this question",
+    "just tell me the final answer",
+    "solve this problem for me",
+    "do my homework for me",
+    "write my assignment for me",
+    "what should I write for this exam question",
+    "answer all of these questions for me",
+    "complete this worksheet for me",
+    "I need the answers to my quiz",
+    "send me the answer key",
+    "write the code for my project",
+    "which option is correct, just the letter",
 ]
 
+# Questions a tutor should answer; the cheating score has to beat these
+STUDY_INTENT_EXAMPLES = [
+    "explain how this works",
+    "what does this term mean",
+    "help me understand the concept",
+    "why does this happen",
+    "how do I approach this kind of problem",
+    "can you give me an example",
+    "what is the difference between these two",
+    "walk me through the steps of the method",
+    "where did I go wrong in my working",
+    "summarize this chapter",
+]
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Shorthand spelled out before matching, so "pls gimme the answr" reads as
+# "please give me the answer". Only spellings that aren't words of their own
+# in a study question: no "u", "sol" or "ans".
+VARIANTS = {
+    "pls": "please",
+    "plz": "please",
+    "plez": "please",
+    "hw": "homework",
+    "gimme": "give me",
+    "answr": "answer",
+    "soln": "solution",
+    "assgn": "assignment",
+    "assignmnt": "assignment",
+    "copypaste": "copy paste",
+}
+
+
+def normalize(text):
+    """Lowercased word tokens, plurals folded and shorthand spelled out."""
+
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower().replace("'", "")):
+        if len(token) > 3 and token[-1] == "s" and token[-2:] not in ("ss", "us", "is"):
+            token = token[:-1]
+        tokens.extend(VARIANTS.get(token, token).split())
+    return tokens
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over word tokens.
+
+    One pass over the question finds any of the phrases, whatever their
+    number: each token is one transition, with failure links taking the
+    place of restarting the match. Phrases match whole words, after the
+    same normalization as the question.
+    """
+
+    def __init__(self, phrases):
+        self.goto = [{}]
+        self.fail = [0]
+        # The phrase ending at each state, directly or through its failure link
+        self.output = [None]
+        self.phrases = []
+
+        for phrase in phrases:
+            tokens = normalize(phrase)
+            if not tokens:
+                continue
+            state = 0
+            for token in tokens:
+                following = self.goto[state].get(token)
+                if following is None:
+                    following = self.goto[state][token] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                state = following
+            if self.output[state] is None:
+                self.output[state] = phrase
+                self.phrases.append(phrase)
+
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for token, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[following] = self.goto[fallback].get(token, 0)
+                if self.output[following] is None:
+                    self.output[following] = self.output[self.fail[following]]
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def find(self, text):
+        """The first phrase found in ``text``, or None."""
+
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for token in normalize(text):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+class IntentClassifier:
+    """Scores query embeddings against cheating and study examples in one matmul.
+
+    Example rows are stacked cheating first, so each query's best score per
+    side is a reduceat over the similarity matrix, as in TopicClassifier.
+    """
+
+    def __init__(self, cheat_vectors, study_vectors, min_score=INTEGRITY_INTENT_MIN_SCORE,
+                 margin=INTEGRITY_INTENT_MARGIN):
+        self.prototypes = np.ascontiguousarray(np.vstack([cheat_vectors, study_vectors]), dtype="float32")
+        self.starts = np.asarray([0, len(cheat_vectors)], dtype="int64")
+        self.min_score = min_score
+        self.margin = margin
+
+    def __len__(self):
+        return len(self.prototypes)
+
+    def scores(self, query_embeddings):
+        """(n_queries, 2): best cheating and best study similarity."""
+
+        similarity = np.atleast_2d(query_embeddings) @ self.prototypes.T
+        return np.maximum.reduceat(similarity, self.starts, axis=1)
+
+    def flags(self, query_embeddings):
+        """(flagged, cheating score) per query."""
+
+        scores = self.scores(query_embeddings)
+        flagged = (scores[:, 0] >= self.min_score) & (scores[:, 0] - scores[:, 1] >= self.margin)
+        return flagged, scores[:, 0]
+
+
+class IntegrityPolicy:
+
+    def __init__(self, course_id, matcher, intent, signature):
+        self.course_id = course_id
+        self.matcher = matcher
+        self.intent = intent
+        # Files the policy was built from, as (path, mtime, size) or None
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def match(self, text):
+        return self.matcher.find(text)
+
+    def intent_score(self, query_embedding):
+        """The cheating score when the question reads as asking for answers, else None."""
+
+        if self.intent is None:
+            return None
+        flagged, score = self.intent.flags(query_embedding)
+        return float(score[0]) if flagged[0] else None
+
+    def stats(self):
+        return {
+            "phrases": len(self.matcher),
+            "intent_examples": len(self.intent) if self.intent is not None else 0,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def policy_path(course_id):
+    if course_id == DEFAULT_COURSE:
+        return INTEGRITY_POLICY_PATH
+    return os.path.join(course_paths(course_id)[1], INTEGRITY_POLICY_FILE)
+
+
+def policy_signature(course_id):
+    path = policy_path(course_id)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def read_policy(path):
+    """The course's integrity.json, or {} when there is none or it is invalid.
+
+    {"inherit": true, "patterns": [...], "intent_examples": [...], "study_examples": [...]};
+    "inherit": false drops the built-in phrases and examples.
+    """
+
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as exc:
+        print(f"Ignoring invalid integrity policy {path}: {exc}")
+        return {}
+    return config
+
+
+def load_policy(course_id, intent=INTEGRITY_INTENT):
+    signature = policy_signature(course_id)
+    config = read_policy(policy_path(course_id))
+    inherit = config.get("inherit", True)
+
+    phrases = (CHEAT_KEYWORDS if inherit else []) + list(config.get("patterns", []))
+    classifier = None
+    if intent:
+        cheat = (CHEAT_INTENT_EXAMPLES if inherit else []) + list(config.get("intent_examples", []))
+        study = (STUDY_INTENT_EXAMPLES if inherit else []) + list(config.get("study_examples", []))
+        if cheat and study:
+            classifier = IntentClassifier(encode_texts(cheat), encode_texts(study))
+    return IntegrityPolicy(course_id, PhraseMatcher(phrases), classifier, signature)
+
+
+class IntegrityGuard:
+    """Integrity policies per course, rebuilt when their integrity.json changes.
+
+    The file is checked at most every ``reload_interval`` seconds; between
+    checks a request gets the policy without leaving the event loop.
+    """
+
+    def __init__(self, loader=load_policy, reload_interval=INTEGRITY_RELOAD_INTERVAL, max_courses=COURSE_CACHE_SIZE):
+        self.loader = loader
+        self.reload_interval = reload_interval
+        self.max_courses = max(1, max_courses)
+        self._policies = OrderedDict()
+        self._checked = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.loads = 0
+        self.flagged = {"pattern": 0, "intent": 0}
+
+    def policy(self, course_id=DEFAULT_COURSE):
+        signature = policy_signature(course_id)
+        with self._lock:
+            policy = self._policies.get(course_id)
+        if policy is None or policy.signature != signature:
+            with self._load_lock:
+                policy = self._policies.get(course_id)
+                if policy is None or policy.signature != signature:
+                    policy = self.loader(course_id)
+                    self.loads += 1
+        with self._lock:
+            self._policies[course_id] = policy
+            self._policies.move_to_end(course_id)
+            self._checked[course_id] = time.monotonic()
+            while len(self._policies) > self.max_courses:
+                evicted, _ = self._policies.popitem(last=False)
+                self._checked.pop(evicted, None)
+        return policy
+
+    async def policy_async(self, course_id=DEFAULT_COURSE):
+        policy = self._policies.get(course_id)
+        if policy is not None and time.monotonic() - self._checked.get(course_id, 0) < self.reload_interval:
+            return policy
+        return await run_blocking(self.policy, course_id)
+
+    def record(self, check):
+        with self._lock:
+            self.flagged[check] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "flagged": dict(self.flagged),
+                "courses": {course_id: policy.stats() for course_id, policy in self._policies.items()},
+            }
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
 
-def violates_integrity(query: str) -> bool:
+def get_integrity_guard():
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = IntegrityGuard()
+    return _guard
 
-    q = query.lower()
 
-    for k in CHEAT_KEYWORDS:
-        if k in q:
-            return True
+def violates_integrity(query: str, course_id=DEFAULT_COURSE, query_embedding=None) -> bool:
 
-    return False
+    policy = get_integrity_guard().policy(course_id)
+    if policy.match(query) is not None:
+        return True
+    return query_embedding is not None and policy.intent_score(query_embedding) is not None
 
 
 def integrity_response():
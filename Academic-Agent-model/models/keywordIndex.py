@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# On-disk layout of a keyword index directory (CSR postings, one row per term):
+#   terms.json            sorted vocabulary
+#   term_offsets.npy      int64[n_terms+1]  postings range of each term
+#   postings_doc.npy      int32[n_postings] document position (into doc_ids)
+#   postings_tf.npy       uint16[n_postings] term frequency
+#   postings_weight.npy   float32[n_postings] BM25 tf saturation, precomputed
+#   doc_ids.npy           int64[n_docs]     chunk ids, sorted
+#   doc_len.npy           int32[n_docs]     tokens per chunk
+#   meta.json             k1, b, avgdl
+FORMAT_VERSION = 1
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+# Only the most common function words; course terms like "disk" or "raid"
+# must stay searchable, and BM25's idf already discounts frequent words.
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were will with what which who how why when does do can".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class KeywordIndex:
+    """Read-only BM25 index over chunk texts.
+
+    Postings are flat, memory-mapped arrays; a query reads one contiguous
+    slice per query term and the per-posting weights were precomputed at
+    write time, so scoring is a few vectorized ops.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "terms.json"), "r") as f:
+            terms = json.load(f)
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"), mmap_mode="r")
+        self.postings_doc = np.load(os.path.join(path, "postings_doc.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(path, "postings_tf.npy"), mmap_mode="r")
+        self.postings_weight = np.load(os.path.join(path, "postings_weight.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(path, "doc_len.npy"), mmap_mode="r")
+
+        n_docs = len(self.doc_ids)
+        df = np.diff(self.term_offsets)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype("float32")
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query, top_k):
+        """(scores, chunk_ids) of the top_k BM25 matches, best first."""
+
+        term_ids = sorted({self.term_ids[t] for t in tokenize(query) if t in self.term_ids})
+        if not term_ids:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+
+        docs, weights = [], []
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs.append(self.postings_doc[start:end])
+            weights.append(self.postings_weight[start:end] * self.idf[term_id])
+
+        docs = np.concatenate(docs)
+        weights = np.concatenate(weights)
+        if len(term_ids) > 1:
+            docs, inverse = np.unique(docs, return_inverse=True)
+            weights = np.bincount(inverse, weights=weights).astype("float32")
+
+        if len(docs) > top_k:
+            best = np.argpartition(-weights, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(docs))
+        best = best[np.argsort(-weights[best], kind="stable")]
+        return weights[best], np.asarray(self.doc_ids)[docs[best]]
+
+
+def open_keyword_index(path):
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    return KeywordIndex(path)
+
+
+def write_keyword_index(path, base=None, added=None, removed=()):
+    """Write ``base`` minus ``removed`` chunks, plus ``added`` (id -> text).
+
+    Only the added texts are tokenized; surviving postings are carried over
+    as arrays and re-merged, then BM25 weights are recomputed against the
+    new average chunk length. Swapped in with renames like the chunk store.
+    """
+
+    added = added or {}
+    drop = np.fromiter(set(removed) | set(added), dtype="int64")
+
+    # Surviving postings from the base, as (term, chunk id, tf) triplets
+    if base is not None and len(base):
+        base_terms = np.repeat(np.arange(len(base.terms)), np.diff(base.term_offsets))
+        base_docs = np.asarray(base.doc_ids)[base.postings_doc]
+        keep = ~np.isin(base_docs, drop)
+        terms = list(base.terms)
+        triplets = [(base_terms[keep], base_docs[keep], np.asarray(base.postings_tf)[keep])]
+        keep_docs = ~np.isin(base.doc_ids, drop)
+        doc_ids = [np.asarray(base.doc_ids)[keep_docs]]
+        doc_len = [np.asarray(base.doc_len)[keep_docs]]
+    else:
+        terms, triplets, doc_ids, doc_len = [], [], [], []
+
+    term_lookup = {term: i for i, term in enumerate(terms)}
+    new_terms, new_docs, new_tf, new_ids, new_len = [], [], [], [], []
+    for chunk_id, text in added.items():
+        tokens = tokenize(text)
+        new_ids.append(chunk_id)
+        new_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            if term not in term_lookup:
+                term_lookup[term] = len(terms)
+                terms.append(term)
+            new_terms.append(term_lookup[term])
+            new_docs.append(chunk_id)
+            new_tf.append(min(tf, np.iinfo("uint16").max))
+
+    triplets.append((
+        np.asarray(new_terms, dtype="int64"),
+        np.asarray(new_docs, dtype="int64"),
+        np.asarray(new_tf, dtype="uint16"),
+    ))
+    doc_ids.append(np.asarray(new_ids, dtype="int64"))
+    doc_len.append(np.asarray(new_len, dtype="int32"))
+
+    post_terms = np.concatenate([t for t, _, _ in triplets]).astype("int64")
+    post_docs = np.concatenate([d for _, d, _ in triplets]).astype("int64")
+    post_tf = np.concatenate([tf for _, _, tf in triplets]).astype("uint16")
+    doc_ids = np.concatenate(doc_ids)
+    doc_len = np.concatenate(doc_len)
+
+    order = np.argsort(doc_ids)
+    doc_ids, doc_len = doc_ids[order], doc_len[order]
+
+    # Re-number terms alphabetically, dropping ones left without postings
+    term_order = np.argsort(np.array(terms, dtype=object)).astype("int64")
+    rank = np.empty(len(terms), dtype="int64")
+    rank[term_order] = np.arange(len(terms))
+    post_terms = rank[post_terms]
+    used = np.zeros(len(terms), dtype=bool)
+    used[post_terms] = True
+    post_terms = (np.cumsum(used) - 1)[post_terms]
+    sorted_terms = [terms[term_order[r]] for r in np.flatnonzero(used)]
+
+    post_pos = np.searchsorted(doc_ids, post_docs)
+    order = np.lexsort((post_pos, post_terms))
+    post_terms, post_pos, post_tf = post_terms[order], post_pos[order], post_tf[order]
+
+    term_offsets = np.zeros(len(sorted_terms) + 1, dtype="int64")
+    np.cumsum(np.bincount(post_terms, minlength=len(sorted_terms)), out=term_offsets[1:])
+
+    avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+    tf = post_tf.astype("float32")
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[post_pos] / max(avgdl, 1e-9))
+    weights = (tf * (BM25_K1 + 1) / (tf + norm)).astype("float32")
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    with open(os.path.join(tmp_path, "terms.json"), "w") as f:
+        json.dump(sorted_terms, f)
+    np.save(os.path.join(tmp_path, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(tmp_path, "postings_doc.npy"), post_pos.astype("int32"))
+    np.save(os.path.join(tmp_path, "postings_tf.npy"), post_tf)
+    np.save(os.path.join(tmp_path, "postings_weight.npy"), weights)
+    np.save(os.path.join(tmp_path, "doc_ids.npy"), doc_ids)
+    np.save(os.path.join(tmp_path, "doc_len.npy"), doc_len)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"version": FORMAT_VERSION, "k1": BM25_K1, "b": BM25_B, "avgdl": avgdl}, f)
+
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    return KeywordIndex(path)
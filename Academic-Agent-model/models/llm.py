@@ -1,34 +1,149 @@
 import os
-from openai import OpenAI
+import threading
+
 from dotenv import load_dotenv
 
+from models.llmProvider import LLM_TIMEOUT, LLMProvider, LLMUnavailable
+
 # Load .env file from the project root (one level up from Academic-Agent-model)
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 load_dotenv(os.path.join(project_root, ".env"))
 
-print("Using OpenRouter Trinity LLM")
-
-api_key = os.environ.get("OPENROUTER_API_KEY")
-if not api_key:
-    raise ValueError("OPENROUTER_API_KEY not found in environment variables. Please check your .env file.")
-
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=api_key,
-    default_headers={
-        "HTTP-Referer": "http://localhost",
-        "X-Title": "Academic-Agent"
-    }
-)
-
-MODEL_NAME = "arcee-ai/trinity-large-preview:free"
-
-
-def generate_answer(context_chunks, question):
+# Overridable so a local OpenAI-compatible server (tools/fake_openai_server.py) can stand in
+BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "http://localhost",
+    "X-Title": "Academic-Agent"
+}
+
+# One pooled async client per process, shared by every /chat request
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 100))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+
+# The openai package and both clients are created on first use, so importing
+# this module is cheap and a missing key fails the request, not the import.
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_api_key():
+    api_key = os.environ.get("OPENROUTER_API_KEY")
+    if not api_key:
+        raise ValueError("OPENROUTER_API_KEY not found in environment variables. Please check your .env file.")
+    return api_key
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                print("Using OpenRouter Trinity LLM")
+                _client = OpenAI(
+                    base_url=BASE_URL,
+                    api_key=get_api_key(),
+                    default_headers=DEFAULT_HEADERS,
+                    timeout=client_timeout(),
+                    # Retries are the provider's job (with fallback models)
+                    max_retries=0
+                )
+    return _client
+
+
+def client_timeout():
+    import httpx
+
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                import httpx
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+                _async_client = AsyncOpenAI(
+                    base_url=BASE_URL,
+                    api_key=get_api_key(),
+                    default_headers=DEFAULT_HEADERS,
+                    timeout=client_timeout(),
+                    max_retries=0,
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=LLM_MAX_CONNECTIONS
+                        )
+                    )
+                )
+    return _async_client
+
+MODEL_NAME = os.environ.get("LLM_MODEL", "arcee-ai/trinity-large-preview:free")
+
+# Tried in order after MODEL_NAME (and hedged to when it is slow)
+FALLBACK_MODELS = [m.strip() for m in os.environ.get("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+
+# There is no local tokenizer for the hosted model; ~4 characters per token
+# is the usual estimate for English text.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class TokenStats:
+    """Prompt size per request: our estimate when the prompt is sent, and
+    the provider's own count when it reports usage."""
+
+    def __init__(self):
+        self.requests = 0
+        self.estimated_prompt_tokens = 0
+        self.largest_prompt = 0
+        self.reported = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record_prompt(self, prompt):
+        tokens = estimate_tokens(prompt)
+        with self._lock:
+            self.requests += 1
+            self.estimated_prompt_tokens += tokens
+            self.largest_prompt = max(self.largest_prompt, tokens)
+        return tokens
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        with self._lock:
+            self.reported += 1
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "mean_prompt_tokens_estimated": round(self.estimated_prompt_tokens / self.requests, 1) if self.requests else 0.0,
+            "largest_prompt_tokens_estimated": self.largest_prompt,
+            "mean_prompt_tokens_reported": round(self.prompt_tokens / self.reported, 1) if self.reported else None,
+            "mean_completion_tokens_reported": round(self.completion_tokens / self.reported, 1) if self.reported else None,
+        }
+
+
+token_stats = TokenStats()
+
+
+def build_prompt(context_chunks, question):
 
     context = "\n\n".join(context_chunks)
 
-    prompt = f"""
+    return f"""
 You are an academic assistant.
 
 Answer ONLY using the provided context.
@@ -45,13 +160,51 @@ If answer not found in context, say:
 Answer:
 """
 
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
-    )
 
-    msg = response.choices[0].message
+provider = LLMProvider(
+    [MODEL_NAME] + FALLBACK_MODELS,
+    get_client,
+    get_async_client,
+    on_usage=token_stats.record_usage,
+)
+
+
+def complete(prompt):
+    """Send a ready-made prompt and return the whole answer."""
+
+    token_stats.record_prompt(prompt)
+
+    return provider.complete(prompt)
+
+
+def generate_answer(context_chunks, question):
+
+    return complete(build_prompt(context_chunks, question))
+
+
+def stream_prompt(prompt):
+
+    prompt_tokens = token_stats.record_prompt(prompt)
+
+    stream = provider.stream(prompt)
+    stream.prompt_tokens = prompt_tokens
+    return stream
+
+
+def stream_answer(context_chunks, question):
+
+    return stream_prompt(build_prompt(context_chunks, question))
+
+
+async def astream_prompt(prompt):
+
+    prompt_tokens = token_stats.record_prompt(prompt)
+
+    stream = await provider.astream(prompt)
+    stream.prompt_tokens = prompt_tokens
+    return stream
+
+
+async def astream_answer(context_chunks, question):
 
-    return msg.content.strip()
+    return await astream_prompt(build_prompt(context_chunks, question))
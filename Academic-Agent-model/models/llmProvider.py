@@ -0,0 +1,588 @@
+import asyncio
+import bisect
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Deadlines (seconds): for a whole call, for the first streamed token of one
+# attempt, and between two streamed chunks once the answer is flowing.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", 20))
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", 15))
+
+# Retries per model, with exponential backoff and full jitter
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.25))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 4))
+
+# A model is skipped for LLM_BREAKER_COOLDOWN seconds after this many
+# consecutive failures, then a single probe request decides whether it's back.
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+# When a model's first token takes longer than its recent p95 (or
+# LLM_HEDGE_DELAY until enough samples exist), the same prompt is also sent
+# to the next model in the list and the first to answer wins.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 3))
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+
+# Upper bounds (seconds) of the exported latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+LATENCY_WINDOW = 200
+
+RETRY = "retry"
+NEXT_MODEL = "next_model"
+FATAL = "fatal"
+
+
+class LLMUnavailable(Exception):
+    """Every model and retry failed, or the call's deadline ran out."""
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def classify(exc):
+    """RETRY the same model, move to the NEXT_MODEL, or give up (FATAL)."""
+
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return RETRY
+    if isinstance(exc, CircuitOpen):
+        return NEXT_MODEL
+
+    import openai
+
+    if isinstance(exc, openai.APIConnectionError):
+        return RETRY
+    if isinstance(exc, openai.APIStatusError):
+        status = exc.status_code
+        if status in (401, 403):
+            # Same key for every model; falling back can't help
+            return FATAL
+        if status in (408, 409, 429) or status >= 500:
+            return RETRY
+        # e.g. 400 context too long or 404 unknown model: another model may work
+        return NEXT_MODEL
+    return FATAL
+
+
+def retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, exc=None, base=LLM_RETRY_BASE_DELAY, cap=LLM_RETRY_MAX_DELAY):
+    # Full jitter, so clients that failed together don't retry together
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    hinted = retry_after(exc) if exc is not None else None
+    if hinted is not None:
+        delay = max(delay, min(hinted, cap))
+    return delay
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts for export, plus a window of recent samples
+    for quantiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=LATENCY_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def quantile(self, q, min_samples=1):
+        with self._lock:
+            if len(self.recent) < min_samples:
+                return None
+            ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def totals(self):
+        # (cumulative count per upper bound, count, sum), as Prometheus exports them
+        with self._lock:
+            cumulative, total = {}, 0
+            for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+                total += count
+                cumulative[str(bound)] = total
+            return cumulative, self.count, self.sum
+
+    def snapshot(self):
+        cumulative, count, total = self.totals()
+        snapshot = {"count": count, "sum": round(total, 4), "buckets": cumulative}
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        snapshot["p50"] = round(p50, 4) if p50 is not None else None
+        snapshot["p95"] = round(p95, 4) if p95 is not None else None
+        return snapshot
+
+
+class CircuitBreaker:
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            self._probing = False
+
+    def available(self):
+        """Whether allow() would currently let a request through."""
+
+        with self._lock:
+            self._refresh()
+            return self.state == "closed" or (self.state == "half_open" and not self._probing)
+
+    def allow(self):
+        with self._lock:
+            self._refresh()
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def record_abandoned(self):
+        # A cancelled attempt (e.g. a lost hedge) says nothing about health
+        with self._lock:
+            self._probing = False
+
+
+class ModelStats:
+
+    def __init__(self):
+        self.first_token = LatencyHistogram()
+        self.duration = LatencyHistogram()
+        self.attempts = 0
+        self.successes = 0
+        self.failures = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record_failure(self, kind):
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def snapshot(self):
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "failures": dict(self.failures),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "first_token_seconds": self.first_token.snapshot(),
+            "duration_seconds": self.duration.snapshot(),
+        }
+
+
+def _failure_kind(exc):
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return str(status)
+    return type(exc).__name__
+
+
+class AnswerStream:
+    """Iterates text deltas of a streaming completion.
+
+    close() tears down the upstream HTTP response, so a consumer that goes
+    away (e.g. a disconnected browser) stops generation instead of letting
+    it run to completion.
+    """
+
+    def __init__(self, provider, model, response, deltas, first, started):
+        self.model = model
+        self.prompt_tokens = None
+        self._provider = provider
+        self._response = response
+        self._deltas = deltas
+        self._first = first
+        self._started = started
+
+    def __iter__(self):
+        try:
+            if self._first is not None:
+                yield self._first
+            yield from self._deltas
+        except Exception as exc:
+            self._provider._record_failure(self.model, exc)
+            raise
+        else:
+            self._provider._stats(self.model).duration.observe(time.perf_counter() - self._started)
+        finally:
+            self.close()
+
+    def close(self):
+        self._response.close()
+
+
+class AsyncAnswerStream:
+    """Async counterpart of AnswerStream for the asyncio request path.
+
+    The first token has already arrived when this is handed out; after it,
+    each chunk must arrive within LLM_STREAM_IDLE_TIMEOUT.
+    """
+
+    def __init__(self, provider, model, response, deltas, first, started, deadline):
+        self.model = model
+        self.prompt_tokens = None
+        self._provider = provider
+        self._response = response
+        self._deltas = deltas
+        self._first = first
+        self._started = started
+        self._deadline = deadline
+
+    async def _iterate(self):
+        try:
+            if self._first is not None:
+                yield self._first
+            while True:
+                timeout = min(self._provider.idle_timeout, max(0.0, self._deadline - time.monotonic()))
+                try:
+                    delta = await asyncio.wait_for(self._deltas.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                yield delta
+        except Exception as exc:
+            self._provider._record_failure(self.model, exc)
+            raise
+        else:
+            self._provider._stats(self.model).duration.observe(time.perf_counter() - self._started)
+        finally:
+            await self.aclose()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def aclose(self):
+        await self._response.close()
+
+
+def _iter_deltas(response, on_usage):
+    for chunk in response:
+        # The final chunk carries usage and no choices
+        on_usage(getattr(chunk, "usage", None))
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+async def _aiter_deltas(response, on_usage):
+    async for chunk in response:
+        on_usage(getattr(chunk, "usage", None))
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+class LLMProvider:
+    """Chat completions over an ordered list of models.
+
+    Each call has a deadline; retryable errors (timeouts, connection
+    errors, 429, 5xx) are retried with jittered backoff, other request
+    errors move on to the next model, and a per-model circuit breaker skips
+    models that keep failing. Streaming calls are hedged to the next model
+    when the first token is slow. Retries and fallbacks only happen before
+    the first token: once text has been handed out, the answer can't be
+    switched to another model.
+    """
+
+    def __init__(
+        self,
+        models,
+        client,
+        async_client,
+        on_usage=None,
+        timeout=LLM_TIMEOUT,
+        first_token_timeout=LLM_FIRST_TOKEN_TIMEOUT,
+        idle_timeout=LLM_STREAM_IDLE_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        hedge=LLM_HEDGE,
+        hedge_delay=LLM_HEDGE_DELAY,
+    ):
+        self.models = list(dict.fromkeys(model for model in models if model))
+        self._client = client
+        self._async_client = async_client
+        self._on_usage = on_usage or (lambda usage: None)
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.breakers = {model: CircuitBreaker() for model in self.models}
+        self.model_stats = {model: ModelStats() for model in self.models}
+        self.unavailable = 0
+
+    def _stats(self, model):
+        return self.model_stats[model]
+
+    def _record_failure(self, model, exc):
+        self._stats(model).record_failure(_failure_kind(exc))
+        if classify(exc) == RETRY:
+            # Only upstream trouble counts against the breaker, not e.g. a
+            # prompt one model rejects
+            self.breakers[model].record_failure()
+
+    def _messages(self, prompt):
+        return [{"role": "user", "content": prompt}]
+
+    def _hedge_target(self, model):
+        if not self.hedge:
+            return None
+        for other in self.models[self.models.index(model) + 1:]:
+            if self.breakers[other].available():
+                return other
+        return None
+
+    def _hedge_after(self, model):
+        p95 = self._stats(model).first_token.quantile(HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+        return self.hedge_delay if p95 is None else p95
+
+    # -- asyncio path ---------------------------------------------------
+
+    async def _open_stream(self, model, prompt, deadline):
+        if not self.breakers[model].allow():
+            raise CircuitOpen(model)
+
+        stats = self._stats(model)
+        stats.attempts += 1
+        started = time.perf_counter()
+        timeout = max(0.0, min(self.first_token_timeout, deadline - time.monotonic()))
+        opened = {}
+
+        async def first_token():
+            response = await self._async_client().chat.completions.create(
+                model=model,
+                messages=self._messages(prompt),
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=max(0.1, deadline - time.monotonic()),
+            )
+            opened["response"] = response
+            deltas = _aiter_deltas(response, self._on_usage)
+            try:
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return deltas, first
+
+        try:
+            deltas, first = await asyncio.wait_for(first_token(), timeout)
+        except asyncio.CancelledError:
+            self.breakers[model].record_abandoned()
+            if "response" in opened:
+                await opened["response"].close()
+            raise
+        except Exception as exc:
+            self._record_failure(model, exc)
+            if "response" in opened:
+                await opened["response"].close()
+            raise
+
+        stats.first_token.observe(time.perf_counter() - started)
+        stats.successes += 1
+        self.breakers[model].record_success()
+        return AsyncAnswerStream(self, model, opened["response"], deltas, first, started, deadline)
+
+    async def _open_hedged(self, model, prompt, deadline):
+        hedge_model = self._hedge_target(model)
+        primary = asyncio.ensure_future(self._open_stream(model, prompt, deadline))
+        if hedge_model is None:
+            return await primary
+
+        tasks = {primary}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_after(model))
+            if done:
+                winner = primary
+                return primary.result()
+
+            self._stats(model).hedged += 1
+            hedge = asyncio.ensure_future(self._open_stream(hedge_model, prompt, deadline))
+            tasks.add(hedge)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                answered = [task for task in done if task.exception() is None]
+                if answered:
+                    winner = primary if primary in answered else answered[0]
+                    if winner is hedge:
+                        self._stats(hedge_model).hedge_wins += 1
+                    return winner.result()
+
+            # Both failed: report the primary's error so it drives the retry
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # The loser may have started streaming too; don't leave it open
+            for task in tasks:
+                if task is not winner and not task.cancelled() and task.exception() is None:
+                    await task.result().aclose()
+
+    async def astream(self, prompt):
+        """AsyncAnswerStream of the first model that starts answering."""
+
+        deadline = time.monotonic() + self.timeout
+        errors = []
+
+        for model in self.models:
+            for attempt in range(self.max_retries + 1):
+                if time.monotonic() >= deadline:
+                    break
+                try:
+                    return await self._open_hedged(model, prompt, deadline)
+                except Exception as exc:
+                    kind = classify(exc)
+                    errors.append(f"{model}: {_failure_kind(exc)}")
+                    if kind == FATAL:
+                        raise
+                    if kind == NEXT_MODEL or attempt == self.max_retries:
+                        break
+                    await asyncio.sleep(min(backoff(attempt, exc), max(0.0, deadline - time.monotonic())))
+
+        self.unavailable += 1
+        raise LLMUnavailable("No model answered: " + "; ".join(errors) if errors else "LLM deadline exceeded", errors)
+
+    # -- blocking path (CLI and background jobs) ------------------------
+
+    def _call(self, attempt_fn):
+        deadline = time.monotonic() + self.timeout
+        errors = []
+
+        for model in self.models:
+            for attempt in range(self.max_retries + 1):
+                if time.monotonic() >= deadline:
+                    break
+                if not self.breakers[model].allow():
+                    errors.append(f"{model}: circuit open")
+                    break
+                stats = self._stats(model)
+                stats.attempts += 1
+                started = time.perf_counter()
+                try:
+                    result = attempt_fn(model, deadline)
+                except Exception as exc:
+                    self._record_failure(model, exc)
+                    kind = classify(exc)
+                    errors.append(f"{model}: {_failure_kind(exc)}")
+                    if kind == FATAL:
+                        raise
+                    if kind == NEXT_MODEL or attempt == self.max_retries:
+                        break
+                    time.sleep(min(backoff(attempt, exc), max(0.0, deadline - time.monotonic())))
+                    continue
+
+                stats.first_token.observe(time.perf_counter() - started)
+                stats.successes += 1
+                self.breakers[model].record_success()
+                return model, started, result
+
+        self.unavailable += 1
+        raise LLMUnavailable("No model answered: " + "; ".join(errors) if errors else "LLM deadline exceeded", errors)
+
+    def complete(self, prompt):
+        """Whole answer text (no hedging on the blocking path)."""
+
+        def attempt(model, deadline):
+            response = self._client().chat.completions.create(
+                model=model,
+                messages=self._messages(prompt),
+                timeout=max(0.1, deadline - time.monotonic()),
+            )
+            self._on_usage(getattr(response, "usage", None))
+            return response.choices[0].message.content or ""
+
+        model, started, text = self._call(attempt)
+        self._stats(model).duration.observe(time.perf_counter() - started)
+        return text.strip()
+
+    def stream(self, prompt):
+
+        def attempt(model, deadline):
+            # The read timeout bounds both the wait for the first token and
+            # the gaps between later chunks.
+            response = self._client().chat.completions.create(
+                model=model,
+                messages=self._messages(prompt),
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=max(0.1, min(self.first_token_timeout, deadline - time.monotonic())),
+            )
+            deltas = _iter_deltas(response, self._on_usage)
+            try:
+                return response, deltas, next(deltas, None)
+            except BaseException:
+                response.close()
+                raise
+
+        model, started, (response, deltas, first) = self._call(attempt)
+        return AnswerStream(self, model, response, deltas, first, started)
+
+    def stats(self):
+        return {
+            "models": self.models,
+            "unavailable": self.unavailable,
+            "breakers": {
+                model: {"state": breaker.state, "failures": breaker.failures, "trips": breaker.trips}
+                for model, breaker in self.breakers.items()
+            },
+            "latency": {model: stats.snapshot() for model, stats in self.model_stats.items()},
+        }
@@ -1,17 +1,136 @@
-from sentence_transformers import SentenceTransformer
-import torch
+import atexit
+import os
+import threading
 
-torch.set_num_threads(1)
+import numpy as np
+
+from models.embeddingCache import EmbeddingCache, normalize_query
+from models.metrics import span
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 10000))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH") or None
+
+EMBED_MODEL_NAME = "sentence-transformers/static-retrieval-mrl-en-v1"
+
+# The model is Matryoshka-trained: its leading dimensions form a usable
+# embedding on their own. EMBED_DIM=256 keeps the first 256 of 1024 and
+# re-normalizes; 0 keeps full width. Changing it re-ingests the corpus.
+EMBED_DIM = int(os.getenv("EMBED_DIM", 0))
+
+# "static" encodes with models/staticEncoder.py (NumPy, no torch) from an
+# export of the same model; "sentence-transformers" runs the full library.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "sentence-transformers")
+EMBED_BACKENDS = ("sentence-transformers", "static")
+STATIC_ENCODER_PATH = os.getenv(
+    "STATIC_ENCODER_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static_encoder"),
+)
 
 _model = None
+_model_lock = threading.Lock()
+
+query_cache = EmbeddingCache(EMBED_CACHE_SIZE, EMBED_CACHE_PATH, tag=f"{EMBED_BACKEND}:{EMBED_MODEL_NAME}:{EMBED_DIM}")
+atexit.register(query_cache.save)
+
+def load_sentence_transformer():
+    # torch and sentence_transformers take seconds to import, so they are
+    # deferred until the model is actually needed.
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(1)
+    print("Initializing SentenceTransformer model...")
+    model = SentenceTransformer(EMBED_MODEL_NAME, device="cpu")
+    print("SentenceTransformer model initialized")
+    return model
+
+
+def load_static_encoder():
+    from models.staticEncoder import StaticEncoder, export_static_encoder, has_static_export
+
+    if not has_static_export(STATIC_ENCODER_PATH):
+        print(f"Exporting {EMBED_MODEL_NAME} to {STATIC_ENCODER_PATH} (one-time)...")
+        export_static_encoder(load_sentence_transformer(), STATIC_ENCODER_PATH, EMBED_MODEL_NAME)
+    print("Static NumPy encoder initialized")
+    return StaticEncoder(STATIC_ENCODER_PATH)
+
 
 def get_model():
     global _model
     if _model is None:
-        print("Initializing SentenceTransformer model...")
-        _model = SentenceTransformer(
-            "sentence-transformers/static-retrieval-mrl-en-v1",
-            device="cpu"
-        )
-        print("SentenceTransformer model initialized")
+        with _model_lock:
+            if _model is None:
+                if EMBED_BACKEND not in EMBED_BACKENDS:
+                    raise ValueError(f"EMBED_BACKEND must be one of {EMBED_BACKENDS}, got {EMBED_BACKEND!r}")
+                if EMBED_BACKEND == "static":
+                    _model = load_static_encoder()
+                else:
+                    _model = load_sentence_transformer()
     return _model
+
+
+def is_model_loaded():
+    return _model is not None
+
+
+def truncate_embeddings(vectors, dim=EMBED_DIM):
+    """Keep the first ``dim`` Matryoshka dimensions and re-normalize."""
+
+    vectors = np.asarray(vectors, dtype="float32")
+    if not dim or dim >= vectors.shape[1]:
+        return vectors
+    vectors = vectors[:, :dim]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def encode_texts(texts, batch_size=64):
+    """Normalized float32 embeddings at EMBED_DIM.
+
+    Every corpus, query and topic vector goes through here, so they all
+    share one width and live in the same space.
+    """
+
+    vectors = get_model().encode(
+        texts,
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+    return truncate_embeddings(vectors)
+
+
+def embedding_config():
+    """What the stored vectors depend on; recorded in the ingestion manifest."""
+
+    return {"model": EMBED_MODEL_NAME, "dim": EMBED_DIM or None}
+
+
+def embed_queries(texts):
+    """Normalized (n, dim) float32 embeddings of queries.
+
+    Cached ones come from the LRU; the misses are encoded together in a
+    single call (duplicates once).
+    """
+
+    keys = [normalize_query(text) for text in texts]
+    vectors = [query_cache.get(key) for key in keys]
+
+    missing = {}
+    for key, text, vector in zip(keys, texts, vectors):
+        if vector is None:
+            missing.setdefault(key, text)
+
+    if missing:
+        with span("embed"):
+            encoded = encode_texts(list(missing.values()))
+        fresh = {key: query_cache.put(key, vector) for key, vector in zip(missing, encoded)}
+        vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+    return np.vstack(vectors)
+
+
+def embed_query(text):
+    """Normalized (1, dim) float32 embedding of a query, served from the LRU when possible."""
+
+    return embed_queries([text])
@@ -0,0 +1,242 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from models.llmProvider import LatencyHistogram
+
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "academic_agent")
+
+# Upper bounds (seconds) of the stage histograms; stages range from cache
+# lookups well under a millisecond to LLM calls of tens of seconds.
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Write every request's spans as one JSON line to stdout (or TRACE_LOG_PATH).
+# Health checks and metrics scrapes are never logged.
+TRACE_LOG = os.getenv("TRACE_LOG", "0") != "0"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH") or None
+UNLOGGED_ROUTES = ("/health", "/ready", "/metrics")
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """Counters and latency histograms, rendered in the Prometheus text format.
+
+    A series is created on first use, keyed by its name and label values.
+    Numbers other components already keep (cache hits, breaker state, queue
+    depth) are not counted a second time on the hot path: collectors read
+    them when /metrics is scraped.
+    """
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._kinds = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._kinds[name] = kind
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, buckets=STAGE_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(buckets))
+        histogram.observe(seconds)
+
+    def add_collector(self, collect):
+        """``collect()`` yields (name, labels dict, value) samples at scrape
+        time; a value is a number or a LatencyHistogram."""
+
+        self._collectors.append(collect)
+
+    def samples(self):
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = list(self._histograms.items())
+        for (name, labels), value in counters:
+            yield name, labels, value
+        for (name, labels), histogram in histograms:
+            yield name, labels, histogram
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    yield name, tuple(labels.items()), value
+            except Exception as exc:
+                print(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {exc}")
+
+    def render(self):
+        families = {}
+        for name, labels, value in self.samples():
+            if value is not None:
+                families.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, series in families.items():
+            full_name = f"{self.prefix}_{name}" if self.prefix else name
+            kind = self._kinds.get(name) or ("histogram" if isinstance(series[0][1], LatencyHistogram) else "untyped")
+            if name in self._help:
+                lines.append(f"# HELP {full_name} {self._help[name]}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in series:
+                if isinstance(value, LatencyHistogram):
+                    cumulative, count, total = value.totals()
+                    for bound, bucket_count in cumulative.items():
+                        lines.append(f"{full_name}_bucket{format_labels(labels, le=bound)} {bucket_count}")
+                    lines.append(f"{full_name}_sum{format_labels(labels)} {total!r}")
+                    lines.append(f"{full_name}_count{format_labels(labels)} {count}")
+                else:
+                    # Counts stay exact; ":g" would round them past six digits
+                    number = value if isinstance(value, int) else float(value)
+                    lines.append(f"{full_name}{format_labels(labels)} {number!r}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("stage_seconds", "histogram", "Time spent in each stage of request handling.")
+metrics.describe("errors_total", "counter", "Exceptions raised inside a timed stage.")
+metrics.describe("http_requests_total", "counter", "HTTP requests by route, method and status.")
+metrics.describe("http_request_seconds", "histogram", "Time to the last byte of each HTTP response.")
+
+
+class Trace:
+    """Spans of one request: (stage, offset, seconds, error) in completion order."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans = []
+        self.fields = {}
+
+    def to_dict(self, route, status, seconds):
+        return {
+            "ts": round(time.time(), 3),
+            "method": self.method,
+            "route": route,
+            "path": self.path,
+            "status": status,
+            "ms": round(seconds * 1000, 3),
+            **self.fields,
+            "spans": [
+                {
+                    "stage": stage,
+                    "at_ms": round((start - self.started) * 1000, 3),
+                    "ms": round(elapsed * 1000, 3),
+                    **({"error": error} if error else {}),
+                }
+                for stage, start, elapsed, error in self.spans
+            ],
+        }
+
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def span(stage):
+    """Time a block into ``stage_seconds{stage=...}``, and into the current
+    request's trace when there is one.
+
+    Work on the CPU pool has no request context (run_in_executor doesn't
+    copy it), and batched work isn't one request's anyway, so it only feeds
+    the histogram.
+    """
+
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as exc:
+        error = type(exc).__name__
+        metrics.inc("errors_total", stage=stage, error=error)
+        raise
+    except BaseException:
+        # Cancelled, e.g. the client disconnected mid-stream
+        error = "cancelled"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_seconds", elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.spans.append((stage, start, elapsed, error))
+
+
+def annotate(**fields):
+    """Attach fields (outcome, course, ...) to the current request's log line."""
+
+    trace = _trace.get()
+    if trace is not None:
+        trace.fields.update(fields)
+
+
+def write_trace(record):
+    line = json.dumps(record)
+    if TRACE_LOG_PATH is None:
+        print(line)
+        return
+    with open(TRACE_LOG_PATH, "a") as f:
+        f.write(line + "\n")
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request counts and latency per route, and the trace
+    that spans inside the request record into.
+
+    Latency runs to the last body chunk, so a streamed answer counts in
+    full. Routes are labelled by their template (/feedback/{feedback_id}),
+    unmatched paths as "unmatched", to keep the series bounded.
+    """
+
+    def __init__(self, app, trace_log=TRACE_LOG):
+        self.app = app
+        self.trace_log = trace_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _trace.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _trace.reset(token)
+            seconds = time.perf_counter() - trace.started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.inc("http_requests_total", route=route, method=trace.method, status=status)
+            metrics.observe("http_request_seconds", seconds, route=route)
+            if self.trace_log and route not in UNLOGGED_ROUTES:
+                write_trace(trace.to_dict(route, status, seconds))
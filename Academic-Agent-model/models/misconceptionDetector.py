@@ -1,19 +1,92 @@
-from models.llm import generate_answer
+import json
 
-def detect_misconception(context_chunks, question, answer):
+from models.contextBuilder import truncate_to_tokens
+from models.llm import complete
+
+# Context shown per exchange; the first two passages, cut to this many tokens
+DETECTION_CONTEXT_TOKENS = 300
+
+
+def _exchange(context_chunks, question, answer):
 
-    context = "\n".join(context_chunks[:2])
+    context = truncate_to_tokens("\n".join(context_chunks[:2]), DETECTION_CONTEXT_TOKENS)
+
+    return f"""Context:
+{context}
 
-    prompt = f"""
 Student question:
 {question}
 
 Answer:
 {answer}
+"""
+
 
+def build_misconception_prompt(exchanges):
+    """One prompt for [(context_chunks, question, answer)] exchanges."""
+
+    if len(exchanges) == 1:
+        return f"""
+{_exchange(*exchanges[0])}
 Student still did not understand.
 
 In ONE sentence identify the conceptual misunderstanding.
 """
 
-    return generate_answer(context_chunks, prompt).strip()
+    numbered = "\n".join(
+        f"### Exchange {n}\n{_exchange(*exchange)}" for n, exchange in enumerate(exchanges, 1)
+    )
+
+    return f"""
+In each exchange below a student asked a question, got the answer shown,
+and still did not understand.
+
+{numbered}
+For each exchange, identify the conceptual misunderstanding in ONE sentence.
+Reply with a JSON array of exactly {len(exchanges)} strings, one per exchange, in order, and nothing else.
+"""
+
+
+def parse_misconceptions(text, count):
+    """The ``count`` sentences of a reply, or None when it can't be trusted."""
+
+    if count == 1:
+        text = text.strip()
+        return [text] if text else None
+
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    if not all(isinstance(item, str) and item.strip() for item in items):
+        return None
+    return [item.strip() for item in items]
+
+
+def detect_misconceptions(exchanges):
+    """(misconceptions, llm_calls) for [(context_chunks, question, answer)].
+
+    All exchanges go in one call; if the reply doesn't have one sentence per
+    exchange, each is asked about on its own.
+    """
+
+    results = parse_misconceptions(complete(build_misconception_prompt(exchanges)), len(exchanges))
+    if results is not None:
+        return results, 1
+
+    if len(exchanges) == 1:
+        return [""], 1
+
+    results = [detect_misconception(*exchange) for exchange in exchanges]
+    return results, 1 + len(exchanges)
+
+
+def detect_misconception(context_chunks, question, answer):
+
+    return complete(build_misconception_prompt([(context_chunks, question, answer)])).strip()
@@ -0,0 +1,304 @@
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from models.concurrency import run_blocking
+from models.metrics import annotate
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A request is profiled when it carries X-Profile-Token equal to
+# PROFILE_TOKEN, or at random with probability PROFILE_SAMPLE_RATE. With
+# neither set the middleware isn't installed at all.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_HEADER = "x-profile-token"
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50))
+PROFILE_TOP = 15
+
+PROFILE_ID_RE = re.compile(r"^[0-9T]+-[0-9a-f]+$")
+
+# Routes never sampled at random; the header still works on them
+UNSAMPLED_ROUTES = ("/health", "/ready", "/metrics")
+
+# Leaf frames of a thread that is only waiting (an idle event loop or pool
+# worker, a lock); their samples say nothing about where time goes
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    # ThreadPoolExecutor workers block in the C-level SimpleQueue.get
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+}
+
+
+def profiling_enabled():
+    return PROFILE_TOKEN is not None or PROFILE_SAMPLE_RATE > 0
+
+
+def check_token(token):
+    return PROFILE_TOKEN is not None and token is not None and secrets.compare_digest(token, PROFILE_TOKEN)
+
+
+_labels = {}
+
+
+def frame_label(code):
+    # "function (path:line)" with paths relative to the backend or to
+    # site-packages; cached per code object
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        if path.startswith(BASE_DIR):
+            path = os.path.relpath(path, BASE_DIR)
+        elif "site-packages" in path:
+            path = path.split("site-packages" + os.sep, 1)[1]
+        else:
+            path = os.path.basename(path)
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+    return label
+
+
+def collapse(frame):
+    """Root-first frame labels of a thread's stack, or None while it is idle."""
+
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+        return None
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class Profile:
+
+    def __init__(self, method, path, trigger):
+        self.started_at = time.time()
+        # Sortable by start time, to the millisecond
+        self.id = (
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started_at))
+            + f"{int(self.started_at * 1000) % 1000:03d}-{secrets.token_hex(4)}"
+        )
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+
+    def summary(self, route, status, seconds, interval):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            # stack[0] is the thread name
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                total[label] += count
+
+        def top(counter):
+            return [
+                {"function": label, "samples": count, "pct": round(100 * count / self.samples, 1)}
+                for label, count in counter.most_common(PROFILE_TOP)
+            ]
+
+        return {
+            "id": self.id,
+            "method": self.method,
+            "route": route,
+            "path": self.path,
+            "status": status,
+            "trigger": self.trigger,
+            "started_at": round(self.started_at, 3),
+            "ms": round(seconds * 1000, 3),
+            "interval_ms": interval * 1000,
+            "samples": self.samples,
+            "top_self": top(own),
+            "top_total": top(total),
+        }
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread while at least one profile is open.
+
+    One sampler thread serves all open profiles; each gets the samples
+    taken while it was open. That covers the event loop and the CPU pool
+    (embedding, FAISS, prompt assembly), so work batched with concurrent
+    requests shows up in every profile open at the time. Idle threads are
+    skipped.
+
+    A stopped profile is saved by write() to ``directory`` as <id>.folded
+    (collapsed stacks, one "thread;frame;...;frame count" line each, for
+    flamegraph.pl, speedscope or inferno) and <id>.json (the summary).
+    """
+
+    def __init__(self, directory=PROFILE_DIR, interval=PROFILE_INTERVAL_MS / 1000, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._open = set()
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def start(self, method, path, trigger):
+        profile = Profile(method, path, trigger)
+        with self._lock:
+            self._open.add(profile)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+        return profile
+
+    def stop(self, profile, route, status):
+        seconds = time.perf_counter() - profile.started
+        with self._lock:
+            self._open.discard(profile)
+        return profile.summary(route, status, seconds, self.interval)
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._open:
+                    self._sampler = None
+                    return
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            stacks = []
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = collapse(frame)
+                if stack is not None:
+                    stacks.append((names.get(ident, str(ident)),) + stack)
+            # Holding frames keeps their locals alive
+            del frames, frame
+
+            # Under the lock, so a profile is never updated after stop()
+            with self._lock:
+                for profile in self._open:
+                    profile.samples += 1
+                    profile.stacks.update(stacks)
+            time.sleep(self.interval)
+
+    def write(self, profile, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile.id)
+        with open(base + ".folded", "w") as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(";".join(stack) + f" {count}\n")
+        with open(base + ".json.tmp", "w") as f:
+            json.dump(summary, f)
+        # The summary lands last, so a listed profile always has its stacks
+        os.replace(base + ".json.tmp", base + ".json")
+        self.prune()
+
+    def prune(self):
+        ids = sorted(self.ids(), reverse=True)
+        for profile_id in ids[self.keep:]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [name[:-5] for name in names if name.endswith(".json")]
+
+    def recent(self, limit=20):
+        """Summaries of the newest profiles, newest first."""
+
+        summaries = []
+        for profile_id in sorted(self.ids(), reverse=True)[:limit]:
+            try:
+                with open(os.path.join(self.directory, profile_id + ".json"), "r") as f:
+                    summaries.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue
+        return summaries
+
+    def path(self, profile_id, suffix=".folded"):
+        """File of a profile, or None for an unknown or malformed id."""
+
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + suffix)
+        return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that opens a profile for requests that ask for one
+    (or are sampled) and closes it after the last byte of the response.
+
+    The profile id is returned in an X-Profile-Id header and added to the
+    request's trace log line.
+    """
+
+    def __init__(self, app, profiler=None, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.profiler = profiler or get_profiler()
+        self.sample_rate = sample_rate
+
+    def trigger(self, scope):
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode():
+                return "header" if check_token(value.decode("latin-1")) else None
+        if self.sample_rate > 0 and scope["path"] not in UNSAMPLED_ROUTES and not scope["path"].startswith("/admin/"):
+            if random.random() < self.sample_rate:
+                return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self.trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(scope["method"], scope["path"], trigger)
+        annotate(profile_id=profile.id)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            summary = self.profiler.stop(profile, route, status)
+            # Written off the event loop; listed once both files are there
+            await run_blocking(self.profiler.write, profile, summary)
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = SamplingProfiler()
+    return _profiler
@@ -0,0 +1,88 @@
+import os
+
+from models.metrics import span
+from models.vectorIndex import search
+
+# "hybrid" fuses BM25 and vector results; "dense" and "keyword" use one side.
+# Hybrid and keyword fall back to dense when no keyword index was built.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_MODES = ("hybrid", "dense", "keyword")
+
+# Candidates taken from each retriever before fusion, and the RRF constant
+# (60 in the original paper; larger flattens the rank discount).
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked id lists by summing 1 / (k + rank) per id, best first."""
+
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])
+
+
+def dense_ids_batch(index, documents, query_embeddings, top_k, nprobe=None, ef_search=None):
+    # One index search over the whole query matrix
+    with span("dense_search"):
+        _, ids = search(index, query_embeddings, top_k, nprobe, ef_search, rescore=documents.vectors_for)
+    # Approximate indexes pad with -1 when the probed lists run short
+    return [[int(chunk_id) for chunk_id in row if chunk_id >= 0] for row in ids]
+
+
+def dense_ids(index, documents, query_embedding, top_k, nprobe=None, ef_search=None):
+    return dense_ids_batch(index, documents, query_embedding, top_k, nprobe, ef_search)[0]
+
+
+def keyword_ids(keywords, query, top_k):
+    with span("keyword_search"):
+        _, ids = keywords.search(query, top_k)
+    return [int(chunk_id) for chunk_id in ids]
+
+
+def retrieve_ids_batch(
+    index,
+    documents,
+    keywords,
+    queries,
+    query_embeddings,
+    top_k,
+    nprobe=None,
+    ef_search=None,
+    mode=None,
+):
+    """Chunk ids for each query, best first; ``query_embeddings`` is (n, dim)."""
+
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"RETRIEVAL_MODE must be one of {RETRIEVAL_MODES}, got {mode!r}")
+
+    if keywords is None or mode == "dense":
+        return dense_ids_batch(index, documents, query_embeddings, top_k, nprobe, ef_search)
+    if mode == "keyword":
+        return [keyword_ids(keywords, query, top_k) for query in queries]
+
+    candidates = max(top_k, HYBRID_CANDIDATES)
+    dense = dense_ids_batch(index, documents, query_embeddings, candidates, nprobe, ef_search)
+    return [
+        reciprocal_rank_fusion([ranking, keyword_ids(keywords, query, candidates)])[:top_k]
+        for query, ranking in zip(queries, dense)
+    ]
+
+
+def retrieve_ids(
+    index,
+    documents,
+    keywords,
+    query,
+    query_embedding,
+    top_k,
+    nprobe=None,
+    ef_search=None,
+    mode=None,
+):
+    return retrieve_ids_batch(
+        index, documents, keywords, [query], query_embedding, top_k, nprobe, ef_search, mode
+    )[0]
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import time
+
+from models.concurrency import run_blocking
+
+# Set WARMUP=0 to skip preloading (e.g. for quick local restarts); the first
+# request then loads everything lazily, as before.
+WARMUP_ENABLED = os.getenv("WARMUP", "1") != "0"
+
+
+class Warmup:
+    """Runs named startup steps in order, off the event loop, and records
+    how long each took.
+
+    The server starts answering /health immediately; ``ready`` only turns
+    true once every step has finished, which is what /ready reports.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.status = {name: "pending" for name, _ in self.steps}
+        self.timings = {}
+        self.errors = {}
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+
+    @property
+    def ready(self):
+        return self.finished_at is not None and not self.errors
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def run(self):
+        self.started_at = time.perf_counter()
+        for name, fn in self.steps:
+            self.status[name] = "running"
+            step_start = time.perf_counter()
+            try:
+                await run_blocking(fn)
+            except Exception as e:
+                self.status[name] = "failed"
+                self.errors[name] = repr(e)
+                print(f"Warmup step {name} failed: {e!r}")
+            else:
+                self.status[name] = "done"
+            self.timings[name] = round(time.perf_counter() - step_start, 3)
+        self.finished_at = time.perf_counter()
+        print(f"Warmup finished in {self.finished_at - self.started_at:.2f}s: {self.timings}")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "steps": self.status,
+            "seconds": self.timings,
+            "errors": self.errors,
+        }
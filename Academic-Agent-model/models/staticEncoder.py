@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+
+import numpy as np
+from tokenizers import Tokenizer
+
+# Export layout (a directory):
+#   embeddings.npy   float32[vocab, dim]  token embedding matrix
+#   tokenizer.json                        the model's own tokenizer
+#   meta.json                             source model name and shape
+FORMAT_VERSION = 1
+
+
+class StaticEncoder:
+    """NumPy re-implementation of a SentenceTransformer whose only module is
+    StaticEmbedding: tokenize, look the ids up in the embedding matrix and
+    mean-pool, as torch's EmbeddingBag(mode="mean") does.
+
+    The matrix is memory-mapped, so only rows for tokens actually seen are
+    paged in and every worker process shares them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.no_padding()
+
+    def get_sentence_embedding_dimension(self):
+        return self.embeddings.shape[1]
+
+    def encode(self, sentences, batch_size=None, normalize_embeddings=False, show_progress_bar=None, **kwargs):
+        # Signature-compatible with SentenceTransformer.encode for the
+        # arguments this repo passes; batch_size is moot without padding.
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        encodings = self.tokenizer.encode_batch(list(sentences), add_special_tokens=False)
+
+        out = np.zeros((len(encodings), self.embeddings.shape[1]), dtype="float32")
+        for row, encoding in enumerate(encodings):
+            if not encoding.ids:
+                continue
+            # Bag of tokens: each distinct row is read once and weighted by
+            # its count, so repeated tokens cost nothing extra.
+            token_ids, counts = np.unique(np.asarray(encoding.ids, dtype="int64"), return_counts=True)
+            out[row] = counts.astype("float32") @ self.embeddings[token_ids]
+            out[row] /= len(encoding.ids)
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.maximum(norms, 1e-12)
+
+        return out[0] if single else out
+
+
+def export_static_encoder(model, path, model_name=None):
+    """Write ``model``'s tokenizer and embedding matrix to ``path``.
+
+    Needs torch and sentence-transformers, but only once; StaticEncoder
+    then loads the export without either.
+    """
+
+    from sentence_transformers.models import StaticEmbedding
+
+    modules = list(model)
+    if len(modules) != 1 or not isinstance(modules[0], StaticEmbedding):
+        raise ValueError(
+            "Only models made of a single StaticEmbedding module can be exported, got "
+            + ", ".join(type(m).__name__ for m in modules)
+        )
+    static = modules[0]
+
+    weights = static.embedding.weight.detach().cpu().numpy().astype("float32")
+
+    # Per-process temp dir: several workers may export on first start
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, "embeddings.npy"), weights)
+    static.tokenizer.save(os.path.join(tmp_path, "tokenizer.json"))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "model_name": model_name,
+            "vocab_size": int(weights.shape[0]),
+            "dim": int(weights.shape[1]),
+        }, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process finished an identical export first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def has_static_export(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
@@ -1,73 +1,62 @@
-import json
-import os
+from models.concurrency import run_blocking
+from models.metrics import span
+from models.studentStore import get_store
 
-DB_FILE = "data/student_db.json"
+DEFAULT_MASTERY = 0.5
+LEARNING_RATE = 0.15
 
 
-def load_students():
-    if not os.path.exists(DB_FILE):
-        return {}
+def next_mastery(score, interaction_quality):
 
-    with open(DB_FILE, "r") as f:
-        return json.load(f)
+    score = score * 0.9 + LEARNING_RATE * interaction_quality
 
-
-def save_students(data):
-    with open(DB_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    return max(0.0, min(1.0, score))
 
 
 def update_mastery(student_id, topic, interaction_quality):
 
-    students = load_students()
-
-    if student_id not in students:
-        students[student_id] = {
-            "topics": {},
-            "misconceptions": {}
-        }
-
-    if "misconceptions" not in students[student_id]:
-        students[student_id]["misconceptions"] = {}
-
-    topics = students[student_id]["topics"]
+    with span("student_store.write"):
+        return get_store().update_mastery(
+            student_id,
+            topic,
+            lambda score: next_mastery(score, interaction_quality),
+            default=DEFAULT_MASTERY
+        )
 
-    if topic not in topics:
-        topics[topic] = 0.5
 
-    learning_rate = 0.15
+def apply_feedback(key, student_id, topic, interaction_quality, misconception=None):
 
-    topics[topic] = topics.get(topic, 0.5) * 0.9 + learning_rate * interaction_quality
-    topics[topic] = max(0.0, min(1.0, topics[topic]))
-
-    save_students(students)
-
-    return topics[topic]
+    # None when this feedback was applied before
+    with span("student_store.write"):
+        return get_store().apply_feedback(
+            key,
+            student_id,
+            topic,
+            lambda score: next_mastery(score, interaction_quality),
+            misconception,
+            default=DEFAULT_MASTERY
+        )
 
 
 def add_misconception(student_id, topic, misconception):
 
-    students = load_students()
+    with span("student_store.write"):
+        get_store().add_misconception(student_id, topic, misconception)
 
-    if student_id not in students:
-        students[student_id] = {
-            "topics": {},
-            "misconceptions": {}
-        }
 
-    if topic not in students[student_id]["misconceptions"]:
-        students[student_id]["misconceptions"][topic] = []
+def get_misconceptions(student_id, topic):
 
-    students[student_id]["misconceptions"][topic].append(misconception)
+    with span("student_store.read"):
+        return get_store().get_misconceptions(student_id, topic)
 
-    save_students(students)
 
+async def get_misconceptions_async(student_id, topic):
+    return await run_blocking(get_misconceptions, student_id, topic)
 
-def get_misconceptions(student_id, topic):
 
-    students = load_students()
+async def update_mastery_async(student_id, topic, interaction_quality):
+    return await run_blocking(update_mastery, student_id, topic, interaction_quality)
 
-    if student_id not in students:
-        return []
 
-    return students[student_id].get("misconceptions", {}).get(topic, [])
+async def add_misconception_async(student_id, topic, misconception):
+    return await run_blocking(add_misconception, student_id, topic, misconception)
@@ -0,0 +1,363 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_JSON_PATH = os.path.join(BASE_DIR, "data", "student_db.json")
+
+STUDENT_STORE = os.getenv("STUDENT_STORE", "sqlite")
+STUDENT_DB_PATH = os.getenv("STUDENT_DB_PATH", os.path.join(BASE_DIR, "data", "student_db.sqlite3"))
+
+# Risk bands shared with models/teacherAnalytics.py. Aggregates are
+# maintained against these at write time, so changing them requires
+# bumping ANALYTICS_VERSION to trigger a one-off rebuild.
+AT_RISK_THRESHOLD = 0.5
+CRITICAL_THRESHOLD = 0.2
+SEVERITY_BUCKETS = 10
+ANALYTICS_VERSION = "1"
+
+
+def severity(score):
+    return (AT_RISK_THRESHOLD - score) / AT_RISK_THRESHOLD
+
+
+def severity_bucket(score):
+    return min(int(severity(score) * SEVERITY_BUCKETS), SEVERITY_BUCKETS - 1)
+
+
+class StudentStore:
+    """Storage interface behind models/studentModel.py.
+
+    Backends read and write single (student, topic) rows; update_mastery
+    applies ``fn(old_score)`` atomically so concurrent writers from any
+    worker never lose updates.
+    """
+
+    def get_mastery(self, student_id, topic):
+        raise NotImplementedError
+
+    def update_mastery(self, student_id, topic, fn, default=0.5):
+        raise NotImplementedError
+
+    def add_misconception(self, student_id, topic, misconception):
+        raise NotImplementedError
+
+    def get_misconceptions(self, student_id, topic):
+        raise NotImplementedError
+
+    def apply_feedback(self, key, student_id, topic, fn, misconception=None, default=0.5):
+        raise NotImplementedError
+
+    def at_risk(self, topic=None, min_score=None, max_score=AT_RISK_THRESHOLD, after=None, limit=50):
+        raise NotImplementedError
+
+    def topic_stats(self):
+        raise NotImplementedError
+
+    def import_students(self, students):
+        raise NotImplementedError
+
+    def get_meta(self, key):
+        raise NotImplementedError
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mastery (
+    student_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    score REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (student_id, topic)
+) WITHOUT ROWID;
+
+-- Sorted at-risk index: only rows under the threshold are indexed, ordered by
+-- score (i.e. descending severity), so dashboard pages are range scans.
+CREATE INDEX IF NOT EXISTS mastery_at_risk ON mastery (score, student_id, topic) WHERE score < {at_risk};
+CREATE INDEX IF NOT EXISTS mastery_topic_at_risk ON mastery (topic, score, student_id) WHERE score < {at_risk};
+
+CREATE TABLE IF NOT EXISTS misconceptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS misconceptions_student_topic ON misconceptions (student_id, topic, id);
+
+-- Feedback already applied, by job key, so a redelivered job is a no-op
+CREATE TABLE IF NOT EXISTS applied_feedback (
+    key TEXT PRIMARY KEY,
+    applied_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS topic_stats (
+    topic TEXT PRIMARY KEY,
+    at_risk INTEGER NOT NULL DEFAULT 0,
+    critical INTEGER NOT NULL DEFAULT 0,
+    misconceptions INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS severity_histogram (
+    topic TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (topic, bucket)
+) WITHOUT ROWID;
+""".format(at_risk=AT_RISK_THRESHOLD)
+
+
+def connect(path):
+    # Transactions are managed explicitly (see transaction below)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    # IMMEDIATE takes the write lock up front so read-modify-write is atomic
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SQLiteStudentStore(StudentStore):
+    """SQLite in WAL mode: readers never block the writer and every
+    (student, topic) access is a primary-key or index lookup."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().executescript(SCHEMA)
+        if self.get_meta("analytics_version") != ANALYTICS_VERSION:
+            with self.transaction() as conn:
+                self._rebuild_analytics(conn)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # One connection per thread
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def transaction(self):
+        return transaction(self._connect())
+
+    def get_mastery(self, student_id, topic):
+        row = self._connect().execute(
+            "SELECT score FROM mastery WHERE student_id = ? AND topic = ?",
+            (student_id, topic),
+        ).fetchone()
+        return row[0] if row else None
+
+    def update_mastery(self, student_id, topic, fn, default=0.5):
+        with self.transaction() as conn:
+            return self._update_mastery(conn, student_id, topic, fn, default)
+
+    def _update_mastery(self, conn, student_id, topic, fn, default):
+        row = conn.execute(
+            "SELECT score FROM mastery WHERE student_id = ? AND topic = ?",
+            (student_id, topic),
+        ).fetchone()
+        score = fn(row[0] if row else default)
+        conn.execute(
+            "INSERT INTO mastery (student_id, topic, score, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (student_id, topic) DO UPDATE SET score = excluded.score, updated_at = excluded.updated_at",
+            (student_id, topic, score, time.time()),
+        )
+        if row is not None:
+            self._count_risk(conn, topic, row[0], -1)
+        self._count_risk(conn, topic, score, 1)
+        return score
+
+    def add_misconception(self, student_id, topic, misconception):
+        with self.transaction() as conn:
+            self._add_misconception(conn, student_id, topic, misconception)
+
+    def _add_misconception(self, conn, student_id, topic, misconception):
+        conn.execute(
+            "INSERT INTO misconceptions (student_id, topic, text, created_at) VALUES (?, ?, ?, ?)",
+            (student_id, topic, misconception, time.time()),
+        )
+        conn.execute(
+            "INSERT INTO topic_stats (topic, misconceptions) VALUES (?, 1) "
+            "ON CONFLICT (topic) DO UPDATE SET misconceptions = misconceptions + 1",
+            (topic,),
+        )
+
+    def apply_feedback(self, key, student_id, topic, fn, misconception=None, default=0.5):
+        """Mastery update plus optional misconception, applied once per key.
+
+        Returns the new score, or None when ``key`` was applied before.
+        """
+
+        with self.transaction() as conn:
+            applied = conn.execute(
+                "INSERT OR IGNORE INTO applied_feedback (key, applied_at) VALUES (?, ?)",
+                (key, time.time()),
+            ).rowcount
+            if not applied:
+                return None
+            if misconception:
+                self._add_misconception(conn, student_id, topic, misconception)
+            return self._update_mastery(conn, student_id, topic, fn, default)
+
+    def _count_risk(self, conn, topic, score, delta):
+        if score >= AT_RISK_THRESHOLD:
+            return
+        critical = delta if score < CRITICAL_THRESHOLD else 0
+        conn.execute(
+            "INSERT INTO topic_stats (topic, at_risk, critical) VALUES (?, ?, ?) "
+            "ON CONFLICT (topic) DO UPDATE SET at_risk = at_risk + excluded.at_risk, critical = critical + excluded.critical",
+            (topic, delta, critical),
+        )
+        conn.execute(
+            "INSERT INTO severity_histogram (topic, bucket, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (topic, bucket) DO UPDATE SET count = count + excluded.count",
+            (topic, severity_bucket(score), delta),
+        )
+
+    def _rebuild_analytics(self, conn):
+        conn.execute("DELETE FROM topic_stats")
+        conn.execute("DELETE FROM severity_histogram")
+        rows = conn.execute(
+            f"SELECT topic, score FROM mastery WHERE score < {AT_RISK_THRESHOLD}"
+        ).fetchall()
+        for topic, score in rows:
+            self._count_risk(conn, topic, score, 1)
+        conn.execute(
+            "INSERT INTO topic_stats (topic, misconceptions) "
+            "SELECT topic, COUNT(*) FROM misconceptions WHERE true GROUP BY topic "
+            "ON CONFLICT (topic) DO UPDATE SET misconceptions = excluded.misconceptions"
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('analytics_version', ?)",
+            (ANALYTICS_VERSION,),
+        )
+
+    def get_misconceptions(self, student_id, topic):
+        rows = self._connect().execute(
+            "SELECT text FROM misconceptions WHERE student_id = ? AND topic = ? ORDER BY id",
+            (student_id, topic),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def at_risk(self, topic=None, min_score=None, max_score=AT_RISK_THRESHOLD, after=None, limit=50):
+        # The literal threshold lets SQLite match the partial indexes; the
+        # (score, student, topic) keyset keeps deep pages as cheap as the first.
+        sql = f"SELECT student_id, topic, score FROM mastery WHERE score < {AT_RISK_THRESHOLD} AND score < ?"
+        params = [max_score]
+        if min_score is not None:
+            sql += " AND score >= ?"
+            params.append(min_score)
+        if topic is not None:
+            sql += " AND topic = ?"
+            params.append(topic)
+        if after is not None:
+            sql += " AND (score, student_id, topic) > (?, ?, ?)"
+            params.extend(after)
+        sql += " ORDER BY score, student_id, topic LIMIT ?"
+        params.append(limit)
+        return self._connect().execute(sql, params).fetchall()
+
+    def topic_stats(self):
+        conn = self._connect()
+        stats = {
+            topic: {"topic": topic, "at_risk": at_risk, "critical": critical, "misconceptions": misconceptions,
+                    "severity_histogram": [0] * SEVERITY_BUCKETS}
+            for topic, at_risk, critical, misconceptions in conn.execute(
+                "SELECT topic, at_risk, critical, misconceptions FROM topic_stats"
+            )
+        }
+        for topic, bucket, count in conn.execute("SELECT topic, bucket, count FROM severity_histogram"):
+            if topic in stats:
+                stats[topic]["severity_histogram"][bucket] = count
+        return list(stats.values())
+
+    def get_meta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def import_students(self, students):
+        # The marker is checked under the write lock, so of several
+        # processes starting together only the first imports
+        now = time.time()
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone() is not None:
+                return False
+            for student_id, info in students.items():
+                for topic, score in info.get("topics", {}).items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO mastery (student_id, topic, score, updated_at) VALUES (?, ?, ?, ?)",
+                        (student_id, topic, score, now),
+                    )
+                for topic, items in info.get("misconceptions", {}).items():
+                    conn.executemany(
+                        "INSERT INTO misconceptions (student_id, topic, text, created_at) VALUES (?, ?, ?, ?)",
+                        [(student_id, topic, text, now) for text in items],
+                    )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (json.dumps({"students": len(students), "at": now}),),
+            )
+            self._rebuild_analytics(conn)
+        return True
+
+
+STORE_BACKENDS = {
+    "sqlite": SQLiteStudentStore,
+}
+
+
+def migrate_from_json(store, json_path=LEGACY_JSON_PATH):
+    """One-shot import of the legacy data/student_db.json; later calls are no-ops."""
+
+    if store.get_meta("migrated_json") is not None or not os.path.exists(json_path):
+        return False
+
+    with open(json_path, "r") as f:
+        students = json.load(f)
+
+    if not store.import_students(students):
+        return False
+    print(f"Migrated {len(students)} students from {json_path} to {store.path}")
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = STORE_BACKENDS[STUDENT_STORE](STUDENT_DB_PATH)
+                migrate_from_json(store)
+                _store = store
+    return _store
+
+
+if __name__ == "__main__":
+    # python -m models.studentStore [legacy_json_path]
+    store = STORE_BACKENDS[STUDENT_STORE](STUDENT_DB_PATH)
+    if not migrate_from_json(store, sys.argv[1] if len(sys.argv) > 1 else LEGACY_JSON_PATH):
+        print("Nothing to migrate.")
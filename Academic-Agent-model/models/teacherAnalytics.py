@@ -1,46 +1,122 @@
+import base64
 import json
+import math
 
-DB_PATH = "data/student_db.json"
+from models.studentStore import (
+    AT_RISK_THRESHOLD,
+    CRITICAL_THRESHOLD,
+    get_store,
+    severity,
+)
 
+TOPIC_ALERT_MIN_STUDENTS = 2
 
-def get_students_at_risk():
+STATUSES = {
+    "CRITICAL": (None, CRITICAL_THRESHOLD),
+    "AT RISK": (CRITICAL_THRESHOLD, AT_RISK_THRESHOLD),
+}
 
-    with open(DB_PATH, "r") as f:
-        students = json.load(f)
 
-    results = []
-    topic_counter = {}
+def describe_risk(store, student, topic, score):
+
+    if score < CRITICAL_THRESHOLD:
+        status = "CRITICAL"
+        recommendation = "Immediate mentoring required"
+    else:
+        status = "AT RISK"
+        recommendation = "Extra practice recommended"
+
+    return {
+        "student": student,
+        "topic": topic,
+        "score": round(score, 2),
+        "status": status,
+        "severity": round(severity(score), 2),
+        "recommendation": recommendation,
+        "misconceptions": store.get_misconceptions(student, topic)
+    }
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps(row).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(score, student, topic) from a cursor; ValueError for anything a client
+    could send that encode_cursor didn't produce."""
+
+    try:
+        row = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        # binascii.Error and UnicodeDecodeError are ValueErrors too
+        raise ValueError("Invalid cursor")
+    if (
+        not isinstance(row, list)
+        or len(row) != 3
+        or not isinstance(row[0], str)
+        or not isinstance(row[1], str)
+        or isinstance(row[2], bool)
+        or not isinstance(row[2], (int, float))
+        or not math.isfinite(row[2])
+    ):
+        raise ValueError("Invalid cursor")
+    student, topic, score = row
+    return score, student, topic
+
 
-    for student, info in students.items():
+def query_at_risk(topic=None, status=None, min_severity=None, limit=50, cursor=None):
+    """One page of at-risk students, most severe first.
 
-        mastery = info.get("topics", {})
-        misconceptions = info.get("misconceptions", {})
+    Served from the store's sorted at-risk index, so the cost is
+    proportional to ``limit`` rather than to the number of students.
+    """
 
-        for topic, score in mastery.items():
+    store = get_store()
 
-            if score < 0.5:
+    min_score, max_score = STATUSES.get(status, (None, AT_RISK_THRESHOLD))
+    if min_severity is not None:
+        # severity = (threshold - score) / threshold, so a severity floor is a score ceiling
+        max_score = min(max_score, AT_RISK_THRESHOLD * (1 - min_severity) + 1e-9)
 
-                if score < 0.2:
-                    status = "CRITICAL"
-                    recommendation = "Immediate mentoring required"
-                else:
-                    status = "AT RISK"
-                    recommendation = "Extra practice recommended"
+    rows = store.at_risk(
+        topic=topic,
+        min_score=min_score,
+        max_score=max_score,
+        after=decode_cursor(cursor) if cursor else None,
+        limit=limit,
+    )
 
-                severity = round((0.5 - score) * 2, 2)
+    return {
+        "items": [describe_risk(store, *row) for row in rows],
+        "next_cursor": encode_cursor(list(rows[-1])) if len(rows) == limit else None,
+    }
 
-                topic_counter[topic] = topic_counter.get(topic, 0) + 1
 
-                results.append({
-                    "student": student,
-                    "topic": topic,
-                    "score": round(score, 2),
-                    "status": status,
-                    "severity": severity,
-                    "recommendation": recommendation,
-                    "misconceptions": misconceptions.get(topic, [])
-                })
+def get_topic_summary():
+
+    stats = sorted(get_store().topic_stats(), key=lambda t: t["at_risk"], reverse=True)
+
+    return {
+        "topics": stats,
+        "topic_alerts": [t["topic"] for t in stats if t["at_risk"] >= TOPIC_ALERT_MIN_STUDENTS],
+    }
+
+
+def get_students_at_risk():
+
+    store = get_store()
+
+    results = []
+    after = None
+
+    while True:
+        rows = store.at_risk(after=after, limit=500)
+        results.extend(describe_risk(store, *row) for row in rows)
+        if len(rows) < 500:
+            break
+        student, topic, score = rows[-1]
+        after = (score, student, topic)
 
-    topic_alerts = [t for t, c in topic_counter.items() if c >= 2]
+    topic_alerts = get_topic_summary()["topic_alerts"]
 
     return results, topic_alerts
@@ -1,23 +1,151 @@
-from sentence_transformers import SentenceTransformer
+import os
+import threading
+
 import numpy as np
 
-from models.llm_model import get_model
-# model = get_model()
+from models.llm_model import embed_query
+from models.topicTaxonomy import BASE_DIR, TopicTaxonomy, open_taxonomy
+from models.vectorSnapshot import snapshot_path
+
+VECTOR_DB_PATH = os.path.join(BASE_DIR, "vector_db")
+
+# A question is filed under its best-matching topic when the cosine score is
+# at least TOPIC_MIN_SCORE and beats the best topic elsewhere in the tree by
+# TOPIC_MIN_MARGIN; otherwise under the closest ancestor that does, and
+# under TOPIC_FALLBACK when nothing scores high enough.
+TOPIC_MIN_SCORE = float(os.getenv("TOPIC_MIN_SCORE", 0.2))
+TOPIC_MIN_MARGIN = float(os.getenv("TOPIC_MIN_MARGIN", 0.02))
+TOPIC_FALLBACK = os.getenv("TOPIC_FALLBACK", "general")
+
+
+class TopicMatch:
+
+    def __init__(self, topic, score, level, alternatives):
+        self.topic = topic
+        self.score = score
+        self.level = level
+        self.alternatives = alternatives
+
+    def to_dict(self):
+        return {
+            "topic": self.topic,
+            "score": round(self.score, 4),
+            "level": self.level,
+            "alternatives": [{"topic": topic, "score": round(score, 4)} for topic, score in self.alternatives],
+        }
+
+
+class TopicClassifier:
+    """Scores queries against every topic's prototypes in one matmul.
+
+    Queries and prototypes are centred on the corpus mean (see
+    topicTaxonomy). Prototype rows are grouped by topic, so a topic's score
+    (the best of its prototypes) is a reduceat over the similarity matrix. Only topics with
+    prototypes are scored; a parent stands for its whole subtree.
+    """
+
+    def __init__(self, taxonomy):
+        self.taxonomy = taxonomy
+        scored = [topic for topic in taxonomy.topics if topic["prototypes"][1] > topic["prototypes"][0]]
+        self.topic_ids = [topic["id"] for topic in scored]
+        self.starts = np.asarray([topic["prototypes"][0] for topic in scored], dtype="int64")
+        self.prototypes = np.ascontiguousarray(taxonomy.centered_prototypes(), dtype="float32")
+
+        # outside[a] masks the scored topics that aren't in a's subtree, for
+        # the margin check when falling back to ancestor a
+        position = {topic_id: n for n, topic_id in enumerate(self.topic_ids)}
+        self.lineage = {topic_id: [topic_id] + list(taxonomy.ancestors(topic_id)) for topic_id in self.topic_ids}
+        self.outside = {}
+        for topic_id, lineage in self.lineage.items():
+            for node in lineage:
+                mask = self.outside.setdefault(node, np.ones(len(self.topic_ids), dtype=bool))
+                mask[position[topic_id]] = False
+
+        self._lock = threading.Lock()
+        self.counts = {"topic": 0, "ancestor": 0, "fallback": 0}
+
+    def __len__(self):
+        return len(self.topic_ids)
+
+    def scores(self, query_embeddings):
+        """(n_queries, n_topics) best prototype similarity per topic."""
+
+        similarity = self.taxonomy.center(query_embeddings) @ self.prototypes.T
+        return np.maximum.reduceat(similarity, self.starts, axis=1)
+
+    def classify(self, query_embeddings, top_k=3):
+        query_embeddings = np.atleast_2d(query_embeddings)
+        if not len(self.topic_ids):
+            return [TopicMatch(TOPIC_FALLBACK, 0.0, "fallback", []) for _ in query_embeddings]
+
+        scores = self.scores(query_embeddings)
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        matches = []
+        for row, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-row[candidates])]
+            alternatives = [(self.topic_ids[c], float(row[c])) for c in candidates]
+            matches.append(self._decide(row, candidates[0], alternatives))
+
+        with self._lock:
+            for match in matches:
+                self.counts[match.level] += 1
+        return matches
+
+    def _decide(self, row, best, alternatives):
+        score = float(row[best])
+        if score < TOPIC_MIN_SCORE:
+            return TopicMatch(TOPIC_FALLBACK, score, "fallback", alternatives)
+
+        # The most specific node that clearly beats everything outside it
+        for depth, node in enumerate(self.lineage[self.topic_ids[best]]):
+            outside = self.outside[node]
+            rival = float(row[outside].max()) if outside.any() else -1.0
+            if score - rival >= TOPIC_MIN_MARGIN:
+                return TopicMatch(node, score, "topic" if depth == 0 else "ancestor", alternatives)
+        return TopicMatch(TOPIC_FALLBACK, score, "fallback", alternatives)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            "origin": self.taxonomy.meta.get("origin"),
+            "topics": len(self.taxonomy),
+            "scored_topics": len(self.topic_ids),
+            "prototypes": len(self.prototypes),
+            "classified": counts,
+        }
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def load_topic_classifier(path=None):
+    # Defaults to the default course's current snapshot
+    path = path or os.path.join(snapshot_path(VECTOR_DB_PATH), "topics")
+    taxonomy = open_taxonomy(path)
+    if taxonomy is None:
+        print(f"No topic taxonomy at {path}; run ingestion.py. Every question is filed under {TOPIC_FALLBACK!r}.")
+        taxonomy = TopicTaxonomy([], np.zeros((0, 0), dtype="float32"), {"origin": None})
+    return TopicClassifier(taxonomy)
+
+
+def get_topic_classifier():
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = load_topic_classifier()
+    return _classifier
 
-TOPICS = ["maths", "coding", "general", "sports"]
 
-_topic_embeddings = None
+def classify_topics(query_embeddings, top_k=3):
+    return get_topic_classifier().classify(query_embeddings, top_k)
 
-def get_topic_embeddings():
-    global _topic_embeddings
-    if _topic_embeddings is None:
-        model = get_model()
-        _topic_embeddings = model.encode(TOPICS, normalize_embeddings=True)
-    return _topic_embeddings
 
-def extract_topic(question):
-    model = get_model()
-    topic_embeddings = get_topic_embeddings()
-    q_embed = model.encode([question], normalize_embeddings=True)
-    scores = np.dot(q_embed, topic_embeddings.T)
-    return TOPICS[np.argmax(scores)]
+def extract_topic(question, q_embed=None):
+    if q_embed is None:
+        q_embed = embed_query(question)
+    return classify_topics(q_embed, top_k=1)[0].topic
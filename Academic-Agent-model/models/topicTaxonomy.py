@@ -0,0 +1,452 @@
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+from models.keywordIndex import tokenize
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A hand-written taxonomy replaces the derived one when this file exists:
+#   {"topics": [{"id": "storage", "name": "Storage"},
+#               {"id": "storage/disk-scheduling", "parent": "storage", "name": "Disk scheduling",
+#                "description": "...", "examples": ["Why is SSTF unfair?", ...]}]}
+TOPIC_TAXONOMY_PATH = os.getenv("TOPIC_TAXONOMY_PATH", os.path.join(BASE_DIR, "data", "topics.json"))
+
+# Derived topics: each PDF is a topic whose chunk vectors are clustered into
+# about sqrt(chunks / 2) subtopics, at most TOPIC_MAX_PER_SOURCE, none
+# smaller than TOPIC_MIN_CLUSTER chunks.
+TOPIC_MAX_PER_SOURCE = int(os.getenv("TOPIC_MAX_PER_SOURCE", 16))
+TOPIC_MIN_CLUSTER = int(os.getenv("TOPIC_MIN_CLUSTER", 3))
+# Prototype vectors kept per topic: the centroid plus the members that
+# cover the cluster best
+TOPIC_PROTOTYPES = int(os.getenv("TOPIC_PROTOTYPES", 3))
+
+# A re-clustered source keeps an old subtopic id when the new centroid is at
+# least this similar to the old one, so mastery history stays attached.
+TOPIC_REUSE_SIMILARITY = 0.8
+KMEANS_ITERATIONS = 25
+TOPIC_KEYWORDS = 3
+
+# Static embeddings share a large common component (chunks of one course
+# are all > 0.9 cosine apart), so clustering and topic scores work on
+# vectors centred on the corpus mean. Prototypes are stored uncentred and
+# centred when loaded, so topics carried over from an earlier build follow
+# the mean as PDFs are added.
+#
+# On-disk layout of a topics directory:
+#   topics.json      taxonomy (id, name, parent, source, keywords, size,
+#                    pages, prototype row range) plus build metadata
+#   prototypes.npy   float32[n_prototypes, dim], grouped by topic
+#   mean.npy         float32[dim] mean chunk vector
+FORMAT_VERSION = 1
+
+
+class TopicTaxonomy:
+    """Topics in parent-before-child order and their prototype vectors."""
+
+    def __init__(self, topics, prototypes, meta, mean=None):
+        self.topics = topics
+        self.prototypes = prototypes
+        self.meta = meta
+        self.mean = mean
+        self.by_id = {topic["id"]: topic for topic in topics}
+
+    def __len__(self):
+        return len(self.topics)
+
+    def prototypes_of(self, topic):
+        start, end = topic["prototypes"]
+        return self.prototypes[start:end]
+
+    def center(self, vectors):
+        vectors = np.asarray(vectors, dtype="float32")
+        return normalize(vectors - self.mean) if self.mean is not None else normalize(vectors)
+
+    def centered_prototypes(self):
+        return self.center(self.prototypes)
+
+    def children(self, topic_id):
+        return [topic for topic in self.topics if topic.get("parent") == topic_id]
+
+    def ancestors(self, topic_id):
+        parent = self.by_id[topic_id].get("parent")
+        while parent is not None:
+            yield parent
+            parent = self.by_id[parent].get("parent")
+
+
+def open_taxonomy(path):
+    if not os.path.exists(os.path.join(path, "topics.json")):
+        return None
+    with open(os.path.join(path, "topics.json"), "r") as f:
+        meta = json.load(f)
+    prototypes = np.load(os.path.join(path, "prototypes.npy"))
+    mean_path = os.path.join(path, "mean.npy")
+    mean = np.load(mean_path) if os.path.exists(mean_path) else None
+    topics = meta.pop("topics")
+    return TopicTaxonomy(topics, prototypes, meta, mean)
+
+
+def slugify(text):
+    return re.sub(r"[^a-z0-9.]+", "-", text.lower()).strip("-") or "topic"
+
+
+def source_topic_ids(source):
+    """Ids of the directories and the file itself: a/b.pdf -> [a, a/b]."""
+
+    parts = [slugify(part) for part in os.path.splitext(source)[0].replace("\\", "/").split("/")]
+    return ["/".join(parts[:n]) for n in range(1, len(parts) + 1)]
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def corpus_mean(store, block=65536):
+    total = np.zeros(store.vectors.shape[1], dtype="float64")
+    for start in range(0, len(store), block):
+        total += normalize(store.vectors[start:start + block]).sum(axis=0)
+    return (total / max(len(store), 1)).astype("float32")
+
+
+def spherical_kmeans(vectors, k, seed=0, iterations=KMEANS_ITERATIONS):
+    """(labels, unit centroids) of cosine k-means with k-means++ seeding."""
+
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centers = [int(rng.integers(n))]
+    distance = 1.0 - vectors @ vectors[centers[0]]
+    for _ in range(1, k):
+        weights = np.maximum(distance, 0.0)
+        total = weights.sum()
+        pick = int(rng.choice(n, p=weights / total)) if total > 0 else int(rng.integers(n))
+        centers.append(pick)
+        distance = np.minimum(distance, 1.0 - vectors @ vectors[pick])
+    centroids = vectors[centers].copy()
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        filled = np.bincount(labels, minlength=k) > 0
+        centroids[filled] = normalize(sums[filled])
+
+    return labels, centroids
+
+
+def cluster_source(vectors, seed=0):
+    """Cluster labels (0..k-1) for one source's chunk vectors."""
+
+    n = len(vectors)
+    k = max(1, min(TOPIC_MAX_PER_SOURCE, round(math.sqrt(n / 2)), n // max(TOPIC_MIN_CLUSTER, 1)))
+    if k == 1:
+        return np.zeros(n, dtype="int64")
+
+    labels, centroids = spherical_kmeans(vectors, k, seed)
+
+    # Fold clusters that are too small into their nearest neighbour
+    while True:
+        sizes = np.bincount(labels, minlength=len(centroids))
+        small = [c for c in np.argsort(sizes) if 0 < sizes[c] < TOPIC_MIN_CLUSTER]
+        alive = np.flatnonzero(sizes)
+        if not small or len(alive) == 1:
+            break
+        cluster = small[0]
+        others = [c for c in alive if c != cluster]
+        members = labels == cluster
+        labels[members] = np.asarray(others)[np.argmax(vectors[members] @ centroids[others].T, axis=1)]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        centroids = normalize(sums)
+
+    # Dense labels in order of first appearance (document order)
+    _, first = np.unique(labels, return_index=True)
+    order = np.argsort(first)
+    remap = np.empty(labels.max() + 1, dtype="int64")
+    remap[np.unique(labels)[order]] = np.arange(len(order))
+    return remap[labels]
+
+
+def select_prototypes(vectors, mean, count=TOPIC_PROTOTYPES):
+    """The centroid, then members farthest from every prototype so far.
+
+    Chosen on centred vectors, returned uncentred.
+    """
+
+    centroid = vectors.mean(axis=0)
+    centered = normalize(vectors - mean)
+    chosen = [centroid]
+    closest = centered @ normalize(centroid - mean)
+    for _ in range(min(count, len(vectors) + 1) - 1):
+        pick = int(np.argmin(closest))
+        if closest[pick] > 0.95:
+            break
+        chosen.append(vectors[pick])
+        closest = np.maximum(closest, centered @ centered[pick])
+    return np.vstack(chosen).astype("float32")
+
+
+def cluster_keywords(cluster_texts, count=TOPIC_KEYWORDS):
+    """Most distinctive terms of each cluster (class-based TF-IDF)."""
+
+    counts = [
+        Counter(t for t in tokenize(" ".join(texts)) if len(t) > 2 and not t.replace(".", "").isdigit())
+        for texts in cluster_texts
+    ]
+    totals = Counter()
+    for counter in counts:
+        totals.update(counter)
+    average = sum(totals.values()) / max(len(counts), 1)
+
+    keywords = []
+    for counter in counts:
+        size = max(sum(counter.values()), 1)
+        scored = sorted(
+            counter,
+            key=lambda term: (-(counter[term] / size) * math.log(1 + average / totals[term]), term),
+        )
+        chosen = []
+        for term in scored:
+            # "disk" and "disks" make one keyword
+            if not any(term.rstrip("s") == other.rstrip("s") for other in chosen):
+                chosen.append(term)
+            if len(chosen) == count:
+                break
+        keywords.append(chosen)
+    return keywords
+
+
+def _unique(topic_id, taken):
+    candidate, n = topic_id, 2
+    while candidate in taken:
+        candidate = f"{topic_id}-{n}"
+        n += 1
+    taken.add(candidate)
+    return candidate
+
+
+def derive_source_topics(source, chunk_ids, store, mean, previous=(), taken=None):
+    """[(topic, prototypes)] subtopics of one source, clustered from its chunks.
+
+    ``previous`` holds the source's topics from the last build as (topic,
+    centroid); a new cluster close enough to one of them keeps its id.
+    """
+
+    taken = set() if taken is None else taken
+    chunk_ids = sorted(chunk_ids)
+    vectors = normalize(store.vectors_for(chunk_ids))
+    seed = int(hashlib.sha1(source.encode("utf-8")).hexdigest()[:8], 16)
+    labels = cluster_source(normalize(vectors - mean), seed)
+    if labels.max() == 0:
+        return []
+
+    clusters = [np.flatnonzero(labels == c) for c in range(labels.max() + 1)]
+    keywords = cluster_keywords([[store.text(chunk_ids[i]) for i in members] for members in clusters])
+    prototypes = [select_prototypes(vectors[members], mean) for members in clusters]
+
+    # Greedy id reuse, most similar pairs first
+    reuse = {}
+    if previous:
+        new_centroids = normalize(np.vstack([p[0] for p in prototypes]) - mean)
+        old_centroids = normalize(np.vstack([centroid for _, centroid in previous]) - mean)
+        similarity = new_centroids @ old_centroids.T
+        for flat in np.argsort(-similarity, axis=None):
+            new, old = np.unravel_index(flat, similarity.shape)
+            if similarity[new, old] < TOPIC_REUSE_SIMILARITY:
+                break
+            if new not in reuse and old not in reuse.values():
+                reuse[new] = old
+
+    parent = source_topic_ids(source)[-1]
+    topics = []
+    for c, members in enumerate(clusters):
+        if c in reuse and previous[reuse[c]][0]["id"] not in taken:
+            topic_id = previous[reuse[c]][0]["id"]
+            taken.add(topic_id)
+        else:
+            topic_id = _unique(f"{parent}/{slugify('-'.join(keywords[c][:2]))}", taken)
+        pages = [store.page(chunk_ids[i]) for i in members]
+        topics.append(({
+            "id": topic_id,
+            "name": " ".join(keywords[c]) or topic_id,
+            "parent": parent,
+            "source": source,
+            "keywords": keywords[c],
+            "size": int(len(members)),
+            "pages": [min(pages), max(pages)],
+        }, prototypes[c]))
+    return topics
+
+
+def load_config(path=TOPIC_TAXONOMY_PATH):
+    if not path or not os.path.exists(path):
+        return None, None
+    with open(path, "rb") as f:
+        raw = f.read()
+    return json.loads(raw)["topics"], hashlib.sha256(raw).hexdigest()
+
+
+def config_topics(entries, encode):
+    """[(topic, prototypes)] of a hand-written taxonomy, parents first."""
+
+    by_id = {entry["id"]: entry for entry in entries}
+    for entry in entries:
+        if entry.get("parent") is not None and entry["parent"] not in by_id:
+            raise ValueError(f"Topic {entry['id']!r} has unknown parent {entry['parent']!r}")
+
+    def depth(entry):
+        level = 0
+        while entry.get("parent") is not None:
+            entry = by_id[entry["parent"]]
+            level += 1
+            if level > len(entries):
+                raise ValueError(f"Topic {entry['id']!r} is part of a parent cycle")
+        return level
+
+    ordered = sorted(entries, key=depth)
+    texts, owners = [], []
+    for n, entry in enumerate(ordered):
+        name = entry.get("name", entry["id"])
+        texts.append(f"{name}. {entry['description']}" if entry.get("description") else name)
+        owners.append(n)
+        for example in entry.get("examples", []):
+            texts.append(example)
+            owners.append(n)
+
+    vectors = normalize(encode(texts))
+    owners = np.asarray(owners)
+    return [
+        ({
+            "id": entry["id"],
+            "name": entry.get("name", entry["id"]),
+            "parent": entry.get("parent"),
+            "source": None,
+            "keywords": [],
+            "size": 0,
+            "pages": None,
+        }, vectors[owners == n])
+        for n, entry in enumerate(ordered)
+    ]
+
+
+def build_taxonomy(store, manifest, base=None, encode=None, config_path=TOPIC_TAXONOMY_PATH):
+    """TopicTaxonomy for the chunks in ``store``.
+
+    With a config file its topics are used as given (re-encoded only when
+    the file changed). Otherwise topics are derived per source; only
+    sources whose sha256 differs from ``base`` are re-clustered, the rest
+    are carried over with their prototypes.
+    """
+
+    entries, config_sha = load_config(config_path)
+    meta = {
+        "version": FORMAT_VERSION,
+        "embedding": manifest.get("embedding"),
+        "origin": "config" if entries is not None else "derived",
+        "config_sha256": config_sha,
+        "sources": {},
+    }
+
+    if base is not None and any(base.meta.get(key) != meta[key] for key in ("version", "embedding", "origin")):
+        base = None
+
+    mean = corpus_mean(store) if len(store) else None
+
+    if entries is not None:
+        if base is not None and base.meta.get("config_sha256") == config_sha:
+            return TopicTaxonomy(base.topics, base.prototypes, meta, mean), 0
+        if encode is None:
+            raise ValueError("Encoding a configured taxonomy needs the embedding model")
+        built = config_topics(entries, encode)
+        return _assemble(built, meta, mean), len(built)
+
+    built, taken, rebuilt = [], set(), 0
+    for source in sorted(manifest["sources"]):
+        entry = manifest["sources"][source]
+        chunk_ids = [chunk_id for chunk_id, _ in entry["chunks"]]
+        if not chunk_ids:
+            continue
+        meta["sources"][source] = entry["sha256"]
+
+        for topic_id in source_topic_ids(source):
+            if topic_id not in taken:
+                taken.add(topic_id)
+                built.append(({
+                    "id": topic_id,
+                    "name": topic_id.rpartition("/")[2],
+                    "parent": topic_id.rpartition("/")[0] or None,
+                    "source": source if topic_id == source_topic_ids(source)[-1] else None,
+                    "keywords": [],
+                    "size": 0,
+                    "pages": None,
+                }, None))
+            # Directories count the chunks of every file below them
+            built[next(n for n, (t, _) in enumerate(built) if t["id"] == topic_id)][0]["size"] += len(chunk_ids)
+
+        previous = [
+            (topic, base.prototypes_of(topic)[0])
+            for topic in (base.topics if base is not None else [])
+            if topic.get("source") == source and topic.get("parent") == source_topic_ids(source)[-1]
+        ]
+        if base is not None and base.meta["sources"].get(source) == entry["sha256"]:
+            for topic, _ in previous:
+                taken.add(topic["id"])
+                built.append((topic, base.prototypes_of(topic)))
+            continue
+
+        rebuilt += 1
+        built.extend(derive_source_topics(source, chunk_ids, store, mean, previous, taken))
+
+    # A source's own topic scores as the best of its subtopics; one without
+    # subtopics (too few chunks) gets prototypes of its own.
+    for n, (topic, prototypes) in enumerate(built):
+        if topic.get("source") and prototypes is None and not any(t.get("parent") == topic["id"] for t, _ in built):
+            chunk_ids = [chunk_id for chunk_id, _ in manifest["sources"][topic["source"]]["chunks"]]
+            built[n] = (topic, select_prototypes(normalize(store.vectors_for(sorted(chunk_ids))), mean))
+
+    return _assemble(built, meta, mean), rebuilt
+
+
+def _assemble(built, meta, mean):
+    topics, blocks, row = [], [], 0
+    for topic, prototypes in built:
+        count = 0 if prototypes is None else len(prototypes)
+        topics.append(dict(topic, prototypes=[row, row + count]))
+        if count:
+            blocks.append(np.asarray(prototypes, dtype="float32"))
+        row += count
+
+    prototypes = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype="float32")
+    return TopicTaxonomy(topics, prototypes, meta, mean)
+
+
+def write_taxonomy(path, taxonomy):
+    """Swapped in with renames like the chunk store and keyword index."""
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, "prototypes.npy"), np.ascontiguousarray(taxonomy.prototypes, dtype="float32"))
+    if taxonomy.mean is not None:
+        np.save(os.path.join(tmp_path, "mean.npy"), taxonomy.mean)
+    with open(os.path.join(tmp_path, "topics.json"), "w") as f:
+        json.dump(dict(taxonomy.meta, topics=taxonomy.topics), f)
+
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
@@ -0,0 +1,286 @@
+import math
+import os
+
+import faiss
+import numpy as np
+
+# "auto" picks by corpus size; otherwise one of INDEX_TYPES
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+
+# Query-time recall/latency knobs (IVF lists probed, HNSW candidate list size)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))
+
+HNSW_M = 32
+
+# How flat/ivf/hnsw indexes store vectors: float32 ("none"), one byte per
+# dimension ("int8", faiss SQ8) or one bit per dimension ("binary", sign
+# bits searched by Hamming distance). PQ types are compressed already and
+# ignore this setting.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Approximate indexes fetch top_k * RESCORE_FACTOR candidates, which are
+# re-ranked by exact dot product against the stored float vectors.
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", 4))
+
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw", "hnswpq")
+
+# Flat and HNSW have no ids of their own and are wrapped in IndexIDMap2;
+# IVF lists store external ids natively.
+ID_MAPPED_TYPES = ("flat", "hnsw", "hnswpq")
+
+# HNSW graphs can't drop vectors; removing from them means a rebuild
+REMOVABLE_TYPES = ("flat", "ivf", "ivfpq")
+
+# Below FLAT_MAX_VECTORS brute force is exact and already sub-millisecond;
+# past IVFPQ_MIN_VECTORS full-width IVF lists stop fitting in Render's RAM.
+FLAT_MAX_VECTORS = 20_000
+IVFPQ_MIN_VECTORS = 1_000_000
+
+
+def choose_index_type(n_vectors):
+    if n_vectors < FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors < IVFPQ_MIN_VECTORS:
+        return "ivf"
+    return "ivfpq"
+
+
+def ivf_nlist(n_vectors):
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def pq_params(dimension, n_vectors):
+    # 8 dims per sub-quantizer; fewer centroid bits when the training set is small
+    m = max(1, dimension // 8)
+    while dimension % m:
+        m -= 1
+    nbits = max(4, min(8, int(math.log2(max(n_vectors // 39, 16)))))
+    return m, nbits
+
+
+def effective_quantization(index_type, quantization=None):
+    quantization = quantization or VECTOR_QUANTIZATION
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+    if index_type in ("ivfpq", "hnswpq"):
+        return "none"
+    return quantization
+
+
+def index_factory_string(index_type, dimension, n_vectors, quantization="none"):
+    if quantization == "binary":
+        # For faiss.index_binary_factory
+        if index_type == "flat":
+            return "BFlat"
+        if index_type == "ivf":
+            return f"BIVF{ivf_nlist(n_vectors)}"
+        if index_type == "hnsw":
+            return f"BHNSW{HNSW_M}"
+    codec = "SQ8" if quantization == "int8" else "Flat"
+    if index_type == "flat":
+        return codec
+    if index_type == "ivf":
+        return f"IVF{ivf_nlist(n_vectors)},{codec}"
+    if index_type == "ivfpq":
+        m, nbits = pq_params(dimension, n_vectors)
+        return f"IVF{ivf_nlist(n_vectors)},PQ{m}x{nbits}"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}_SQ8" if quantization == "int8" else f"HNSW{HNSW_M}"
+    if index_type == "hnswpq":
+        m, _ = pq_params(dimension, n_vectors)
+        return f"HNSW{HNSW_M}_PQ{m}"
+    raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES} or 'auto'")
+
+
+def new_index(index_type, dimension, n_vectors=0, quantization=None):
+
+    quantization = effective_quantization(index_type, quantization)
+    factory = index_factory_string(index_type, dimension, n_vectors, quantization)
+
+    if quantization == "binary":
+        index = faiss.index_binary_factory(dimension, factory)
+        if index_type in ID_MAPPED_TYPES:
+            index = faiss.IndexBinaryIDMap2(index)
+        return index
+
+    index = faiss.index_factory(dimension, factory)
+
+    if index_type in ID_MAPPED_TYPES:
+        index = faiss.IndexIDMap2(index)
+
+    return index
+
+
+def build_index(embeddings, index_type=None, ids=None, quantization=None):
+    """Create, train (IVF centroids / PQ codebooks / SQ ranges) and fill an
+    id-addressable index.
+
+    ``ids`` are the chunk ids vectors are stored under (default 0..n-1).
+    """
+
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n_vectors, dimension = embeddings.shape
+    index_type = index_type or INDEX_TYPE
+    if index_type == "auto":
+        index_type = choose_index_type(n_vectors)
+
+    index = new_index(index_type, dimension, n_vectors, quantization)
+
+    if not index.is_trained:
+        print(f"Training {index_type} index on {n_vectors} vectors...")
+        index.train(binarize(embeddings) if is_binary(index) else embeddings)
+
+    if ids is None:
+        ids = np.arange(n_vectors)
+    add_vectors(index, embeddings, ids)
+    configure_search(index)
+    return index
+
+
+def is_binary(index):
+    return isinstance(index, faiss.IndexBinary)
+
+
+def binarize(embeddings):
+    """Sign bits of each dimension, packed 8 per byte."""
+
+    return np.packbits(np.asarray(embeddings) > 0, axis=1)
+
+
+def add_vectors(index, embeddings, ids):
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    if is_binary(index):
+        embeddings = binarize(embeddings)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+
+
+def read_index(path):
+    try:
+        return faiss.read_index(path)
+    except RuntimeError:
+        return faiss.read_index_binary(path)
+
+
+def write_index(index, path):
+    if is_binary(index):
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def _unwrap(index):
+    if is_binary(index):
+        index = faiss.downcast_IndexBinary(index)
+        if isinstance(index, faiss.IndexBinaryIDMap):
+            index = faiss.downcast_IndexBinary(index.index)
+        return index
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def index_type_of(index):
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexBinaryIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexBinaryHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexBinary):
+        return "flat"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSWPQ):
+        return "hnswpq"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def quantization_of(index):
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexBinary):
+        return "binary"
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer, faiss.IndexHNSWSQ)):
+        return "int8"
+    return "none"
+
+
+def is_approximate(index):
+    """True if stored codes only approximate the vectors, so scores are too."""
+
+    return quantization_of(index) != "none" or index_type_of(index) in ("ivfpq", "hnswpq")
+
+
+def configure_search(index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+    """Apply default query-time knobs to a freshly built or loaded index."""
+
+    inner = _unwrap(index)
+    if isinstance(inner, (faiss.IndexIVF, faiss.IndexBinaryIVF)):
+        inner.nprobe = min(nprobe, inner.nlist)
+    elif isinstance(inner, (faiss.IndexHNSW, faiss.IndexBinaryHNSW)):
+        inner.hnsw.efSearch = ef_search
+    return index
+
+
+def search_params(index, nprobe=None, ef_search=None):
+    """Per-call overrides; safe under concurrent searches, unlike mutating the index."""
+
+    inner = _unwrap(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe, inner.nlist))
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def _raw_search(index, query_embeddings, top_k, nprobe=None, ef_search=None):
+    if is_binary(index):
+        # Per-call overrides aren't plumbed through faiss' binary indexes;
+        # they use the values set by configure_search.
+        return index.search(binarize(query_embeddings), top_k)
+    params = search_params(index, nprobe, ef_search)
+    if params is None:
+        return index.search(query_embeddings, top_k)
+    return index.search(query_embeddings, top_k, params=params)
+
+
+def search(index, query_embeddings, top_k, nprobe=None, ef_search=None, rescore=None):
+    """(distances, ids) of the top_k nearest stored vectors.
+
+    ``rescore(ids)`` may return the stored float vectors for ids; on an
+    approximate index top_k * RESCORE_FACTOR candidates are then re-ranked
+    by exact similarity and distances are exact squared L2 (queries and
+    vectors being normalized).
+    """
+
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+
+    if rescore is None or not is_approximate(index) or RESCORE_FACTOR <= 1:
+        distances, ids = _raw_search(index, query_embeddings, top_k, nprobe, ef_search)
+        return distances.astype("float32"), ids
+
+    raw_distances, candidates = _raw_search(index, query_embeddings, top_k * RESCORE_FACTOR, nprobe, ef_search)
+
+    distances = np.full((len(query_embeddings), top_k), np.inf, dtype="float32")
+    ids = np.full((len(query_embeddings), top_k), -1, dtype="int64")
+    for row, query in enumerate(query_embeddings):
+        valid = candidates[row] >= 0
+        found = candidates[row][valid]
+        vectors = rescore(found) if found.size else None
+        if vectors is None:
+            # No float vectors to rescore with; keep the index's own ranking
+            ids[row, :min(top_k, found.size)] = found[:top_k]
+            distances[row, :min(top_k, found.size)] = raw_distances[row][valid][:top_k]
+            continue
+        scores = np.asarray(vectors, dtype="float32") @ query
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        ids[row, :len(best)] = found[best]
+        distances[row, :len(best)] = 2 - 2 * scores[best]
+
+    return distances, ids
@@ -0,0 +1,121 @@
+import os
+import shutil
+import time
+
+# A course's vector DB directory holds immutable snapshots and a pointer to
+# the one being served:
+#   CURRENT                  name of the current snapshot
+#   snapshots/<name>/        index.faiss, chunks/, bm25/, topics/, manifest.json
+# Ingestion builds a new snapshot next to the current one and publishes it
+# by replacing CURRENT, so readers see either the old corpus or the new one
+# in full, never a mix. A directory without CURRENT is the flat layout of
+# older versions, with the same files at its top level.
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+SNAPSHOT_PARTS = ("index.faiss", "chunks", "bm25", "topics", "manifest.json")
+
+# Snapshots kept besides the current one, for servers still loading or
+# serving an older version
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", 2))
+
+
+def current_version(db_path):
+    """Name of the current snapshot, or None for a flat (or missing) DB."""
+
+    try:
+        with open(os.path.join(db_path, CURRENT_FILE), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_path(db_path, version=None):
+    """Directory to read the DB from: the given or current snapshot, or the flat layout."""
+
+    version = version or current_version(db_path)
+    if version is None:
+        return db_path
+    return os.path.join(db_path, SNAPSHOTS_DIR, version)
+
+
+def new_snapshot(db_path):
+    """(name, path) of a new, empty snapshot directory; unpublished until publish_snapshot."""
+
+    os.makedirs(os.path.join(db_path, SNAPSHOTS_DIR), exist_ok=True)
+    while True:
+        # Sortable by creation time
+        name = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + f"-{time.time_ns() % 10**9:09d}"
+        path = os.path.join(db_path, SNAPSHOTS_DIR, name)
+        try:
+            os.makedirs(path)
+            return name, path
+        except FileExistsError:
+            continue
+
+
+def link_parts(src, dst, parts):
+    """Carry unchanged parts of snapshot ``src`` into ``dst`` as hard links.
+
+    Snapshots are never modified after publishing (every writer renames a
+    new file into place), so sharing the inodes is safe; a copy is made
+    where the filesystem can't link.
+    """
+
+    def link(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    for part in parts:
+        source, target = os.path.join(src, part), os.path.join(dst, part)
+        if os.path.isdir(source):
+            shutil.copytree(source, target, copy_function=link)
+        elif os.path.exists(source):
+            link(source, target)
+
+
+def publish_snapshot(db_path, name, keep=SNAPSHOT_KEEP):
+    """Make snapshot ``name`` current with one atomic rename, then prune."""
+
+    snapshot = os.path.join(db_path, SNAPSHOTS_DIR, name)
+    for root, _, files in os.walk(snapshot):
+        for file in files:
+            with open(os.path.join(root, file), "rb") as f:
+                os.fsync(f.fileno())
+
+    tmp_path = os.path.join(db_path, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(db_path, CURRENT_FILE))
+
+    prune_snapshots(db_path, keep)
+
+
+def prune_snapshots(db_path, keep=SNAPSHOT_KEEP):
+    """Delete all but the current and ``keep`` newest other snapshots.
+
+    Also drops the flat-layout files a first snapshot replaced. A server
+    still reading a deleted snapshot is unaffected: its index is in memory
+    and the mmapped files stay valid until it closes them.
+    """
+
+    current = current_version(db_path)
+    if current is None:
+        return []
+
+    snapshots_path = os.path.join(db_path, SNAPSHOTS_DIR)
+    older = sorted((name for name in os.listdir(snapshots_path) if name != current), reverse=True)
+    removed = older[keep:]
+    for name in removed:
+        shutil.rmtree(os.path.join(snapshots_path, name), ignore_errors=True)
+
+    for part in SNAPSHOT_PARTS:
+        path = os.path.join(db_path, part)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+    return removed
@@ -1,62 +1,67 @@
-import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
-import numpy as np
-
-from models.topicMapper import extract_topic
-from models.studentModel import update_mastery, add_misconception, get_misconceptions
-from models.misconceptionDetector import detect_misconception
+import argparse
+
+from models.studentModel import get_misconceptions
+from models.feedbackQueue import FeedbackWorkers, get_feedback_queue
 from models.adaptiveAnswer import generate_adaptive_answer
 from models.teacherAnalytics import get_students_at_risk
 from models.integrityGuard import violates_integrity, integrity_response
 
-from models.llm_model import get_model
+from models.contextBuilder import build_context
+from models.courseRegistry import DEFAULT_COURSE, get_course_registry
+from models.llm_model import embed_query
+from models.retrieval import retrieve_ids
+
+
+def get_course(course_id=DEFAULT_COURSE):
+    course = get_course_registry().get(course_id)
+    if course is None:
+        raise SystemExit(f"No vector DB for course {course_id!r}; run ingestion.py --course {course_id} first.")
+    return course
 
-VECTOR_DB_PATH = "vector_db"
-_index = None
-_documents = None
+def get_vector_db(course_id=DEFAULT_COURSE):
+    course = get_course(course_id)
+    return course.index, course.documents
 
-def get_vector_db():
-    global _index, _documents
-    if _index is None or _documents is None:
-        _index = faiss.read_index(f"{VECTOR_DB_PATH}/index.faiss")
-        with open(f"{VECTOR_DB_PATH}/documents.pkl", "rb") as f:
-            _documents = pickle.load(f)
-    return _index, _documents
+def retrieve_chunks(query, top_k=3, query_embedding=None, course_id=DEFAULT_COURSE):
+    course = get_course(course_id)
 
-def retrieve_context(query, top_k=3):
-    model = get_model()
-    index, documents = get_vector_db()
-    
-    query_embedding = model.encode([query], normalize_embeddings=True)
-    query_embedding = np.array(query_embedding).astype("float32")
+    if query_embedding is None:
+        query_embedding = embed_query(query)
 
-    distances, indices = index.search(query_embedding, top_k)
+    ids = retrieve_ids(course.index, course.documents, course.keywords, query, query_embedding, top_k)
 
-    results = []
-    for idx in indices[0]:
-        results.append(documents[idx]["text"])
+    return [(chunk_id, course.documents.text(chunk_id)) for chunk_id in ids]
 
-    return results
+def retrieve_context(query, top_k=3, query_embedding=None, course_id=DEFAULT_COURSE):
+    return [text for _, text in retrieve_chunks(query, top_k, query_embedding, course_id)]
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Ask the tutor from the terminal")
+    parser.add_argument("--course", default=DEFAULT_COURSE)
+    parser.add_argument("--student", default="akash")
+    args = parser.parse_args()
+
+    course = get_course(args.course)
+    student_id = args.student
+
     print("\nAcademic Agent Ready (type exit to quit)\n")
 
+    # Topic and context are known here, so no resolver is needed
+    feedback_workers = FeedbackWorkers(get_feedback_queue())
+    feedback_workers.start()
+
     while True:
 
         query = input("Ask: ").strip()
 
         if query.lower() == "exit":
+            if not feedback_workers.drain(timeout=60):
+                print("Some feedback is still queued; it will be processed on the next run.")
+            feedback_workers.stop()
             break
 
-        if violates_integrity(query):
-            print("\n--- Integrity Notice ---\n")
-            print(integrity_response())
-            print("\n------------------------\n")
-            continue
-
         if query.lower() == "teacher":
 
             risks, topic_alerts = get_students_at_risk()
@@ -91,14 +96,22 @@ if __name__ == "__main__":
             print("\n    END OF DASHBOARD \n")
             continue
 
-        student_id = "akash"
+        query_embedding = embed_query(query)
+
+        if violates_integrity(query, course.course_id, query_embedding):
+            print("\n--- Integrity Notice ---\n")
+            print(integrity_response())
+            print("\n------------------------\n")
+            continue
 
-        topic = extract_topic(query)
+        topic = course.topic(course.topics.classify(query_embedding, top_k=1)[0].topic)
 
-        chunks = retrieve_context(query)
+        retrieved = retrieve_chunks(query, query_embedding=query_embedding, course_id=course.course_id)
 
         misconceptions = get_misconceptions(student_id, topic)
-        answer = generate_adaptive_answer(chunks, query, misconceptions)
+        assembled = build_context(retrieved, course.documents, misconceptions)
+        chunks = assembled.passages
+        answer = generate_adaptive_answer(chunks, query, assembled.misconceptions)
 
         print("\n--- Answer ---\n")
         print(answer)
@@ -106,14 +119,12 @@ if __name__ == "__main__":
 
         student_feedback = input("Did you understand? (yes/no): ").lower()
 
-        if student_feedback == "yes":
-            interaction_quality = 1
-        else:
-            interaction_quality = -1
-            misconception = detect_misconception(chunks, query, answer)
-            add_misconception(student_id, topic, misconception)
-            print(f"\nDetected Misconception: {misconception}\n")
-
-        new_score = update_mastery(student_id, topic, interaction_quality)
+        # Misconception detection and the mastery update happen in the
+        # background; the next question doesn't wait for them.
+        get_feedback_queue().enqueue(
+            student_id, query, answer, student_feedback == "yes", topic=topic, context=chunks,
+            course_id=course.course_id,
+        )
+        feedback_workers.notify()
 
-        print(f"\nUpdated mastery for {topic}: {round(new_score, 2)}\n")
+        print(f"\nFeedback recorded for {topic}.\n")
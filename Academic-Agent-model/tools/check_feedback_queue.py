@@ -0,0 +1,255 @@
+"""Exercise models/feedbackQueue.py against the fake LLM.
+
+Uses a throwaway student store and queue, starts tools/fake_openai_server.py
+in-process and runs each scenario (enqueue latency, batching, idempotency,
+retries, crash recovery, per-student ordering, jobs that fail to resolve):
+
+    python tools/check_feedback_queue.py
+    python tools/check_feedback_queue.py batching retry     # only some
+
+Prints one PASS/FAIL line per scenario and exits non-zero on any failure.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+PORT = int(os.getenv("FAKE_LLM_PORT", 9032))
+DB_DIR = tempfile.mkdtemp(prefix="feedback-check-")
+os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ.setdefault("OPENROUTER_API_KEY", "fake")
+os.environ["STUDENT_DB_PATH"] = os.path.join(DB_DIR, "students.sqlite3")
+os.environ["LLM_MAX_RETRIES"] = "0"
+os.environ["LLM_TIMEOUT"] = "5"
+
+from models.feedbackQueue import FeedbackQueue, FeedbackWorkers
+from models.studentModel import DEFAULT_MASTERY, next_mastery
+from models.studentStore import get_store
+from tools.fake_openai_server import DEFAULT_ANSWER, make_server
+
+CONTEXT = ["A cylinder is the set of tracks at one arm position.", "Seek time is arm movement."]
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def fresh(name, **options):
+    queue = FeedbackQueue(os.path.join(DB_DIR, f"{name}.sqlite3"))
+    settings = dict(workers=2, batch_size=8, poll_interval=0.05, retry_delay=0.1)
+    settings.update(options)
+    return queue, FeedbackWorkers(queue, **settings)
+
+
+def enqueue(queue, student, n, understood=False, topic="disks"):
+    return queue.enqueue(student, f"Question {n} from {student}?", DEFAULT_ANSWER, understood,
+                         topic=topic, context=CONTEXT)
+
+
+def expected_score(verdicts):
+    score = DEFAULT_MASTERY
+    for understood in verdicts:
+        score = next_mastery(score, 1 if understood else -1)
+    return score
+
+
+def enqueue_latency(faults):
+    # The request path only inserts a row
+    queue, _ = fresh("latency")
+    timings = []
+    for n in range(500):
+        start = time.perf_counter()
+        enqueue(queue, f"s{n % 50}", n)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50, p99 = timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000
+    print(f"{'':>14}enqueue p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+    check(p99 < 50, f"enqueue p99 {p99:.1f} ms")
+    check(queue.stats()["pending"] == 500, queue.stats())
+
+
+def batching(faults):
+    queue, workers = fresh("batching", workers=1)
+    for n in range(16):
+        enqueue(queue, f"batch-{n % 4}", n)
+    workers.start()
+    check(workers.drain(10), f"not drained: {queue.stats()}")
+    workers.stop()
+    stats = workers.stats()
+    check(stats["jobs"] == 16 and stats["llm_calls"] == 2, f"{stats['jobs']} jobs in {stats['llm_calls']} calls")
+    check(sum(faults.state()["requests"].values()) == 2, faults.state()["requests"])
+    for student in range(4):
+        misconceptions = get_store().get_misconceptions(f"batch-{student}", "disks")
+        check(len(misconceptions) == 4, f"batch-{student}: {misconceptions}")
+        check(all(text.startswith("Misunderstanding") for text in misconceptions), misconceptions)
+        check(abs(get_store().get_mastery(f"batch-{student}", "disks") - expected_score([False] * 4)) < 1e-9,
+              "mastery")
+
+
+def idempotency(faults):
+    queue, workers = fresh("idempotency", workers=1)
+    key, created = enqueue(queue, "idem", 1)
+    again, created_again = enqueue(queue, "idem", 1)
+    check(created and not created_again and key == again, "duplicate enqueue was accepted")
+
+    jobs = queue.claim(8)
+    workers.process(jobs)
+    # Redelivery, as after a crash between applying and marking the job done
+    queue.retry(jobs, 0.0, count_attempt=False)
+    workers.run_once()
+    check(workers.stats()["duplicates"] == 1, workers.stats())
+    check(len(get_store().get_misconceptions("idem", "disks")) == 1, "misconception applied twice")
+    check(abs(get_store().get_mastery("idem", "disks") - expected_score([False])) < 1e-9, "mastery applied twice")
+    check(queue.get(key).status == "done", queue.get(key).status)
+
+
+def retry(faults):
+    faults.update({"error_rate": 1.0, "error_status": 503})
+    queue, workers = fresh("retry", workers=1, max_attempts=5)
+    key, _ = enqueue(queue, "retry", 1)
+    yes, _ = enqueue(queue, "retry", 2, understood=True)
+    workers.run_once()
+    job = queue.get(key)
+    check(job.status == "pending" and job.attempts == 1 and job.error, job.to_dict())
+    check(queue.get(yes).status == "pending", "later job overtook the failed one")
+    check(get_store().get_mastery("retry", "disks") is None, "mastery applied before detection")
+
+    faults.update({"error_rate": 0.0})
+    time.sleep(0.15)
+    workers.run_once()
+    check(queue.get(key).misconception and queue.get(yes).status == "done", queue.get(key).to_dict())
+    check(abs(get_store().get_mastery("retry", "disks") - expected_score([False, True])) < 1e-9, "order")
+
+
+def give_up(faults):
+    faults.update({"error_rate": 1.0, "error_status": 503})
+    queue, workers = fresh("give_up", workers=1, max_attempts=1)
+    key, _ = enqueue(queue, "give-up", 1)
+    workers.run_once()
+    job = queue.get(key)
+    check(job.status == "done" and job.misconception is None and job.error, job.to_dict())
+    check(abs(get_store().get_mastery("give-up", "disks") - expected_score([False])) < 1e-9, "mastery")
+    check(workers.stats()["detection_failures"] == 1, workers.stats())
+
+
+def crash_recovery(faults):
+    queue, workers = fresh("recovery", workers=1)
+    key, _ = enqueue(queue, "crash", 1)
+    check(len(queue.claim(8, lease=0.1)) == 1, "not claimed")
+    # The claiming worker "died"; nothing is handed out until the lease runs out
+    check(queue.claim(8) == [], "claimed twice within the lease")
+    time.sleep(0.15)
+    workers.run_once()
+    check(queue.get(key).status == "done", queue.get(key).to_dict())
+
+
+def ordering(faults):
+    # Many workers, one student: updates still land in the order given
+    faults.update({"token_delay": 0.001})
+    queue, workers = fresh("ordering", workers=4, batch_size=2)
+    verdicts = [n % 3 == 0 for n in range(24)]
+    for n, understood in enumerate(verdicts):
+        enqueue(queue, "ordered", n, understood=understood)
+    workers.start()
+    check(workers.drain(20), f"not drained: {queue.stats()}")
+    workers.stop()
+    check(abs(get_store().get_mastery("ordered", "disks") - expected_score(verdicts)) < 1e-9, "out of order")
+
+
+def observability(faults):
+    faults.update({"first_token_delay": 0.3})
+    queue, workers = fresh("observe", workers=1)
+    for n in range(3):
+        enqueue(queue, "observe", n)
+    time.sleep(0.2)
+    stats = queue.stats()
+    check(stats["depth"] == 3 and stats["lag_seconds"] >= 0.2, stats)
+    workers.start()
+    check(workers.drain(10), "not drained")
+    workers.stop()
+    stats, lag = queue.stats(), workers.stats()["lag"]
+    check(stats["depth"] == 0 and stats["lag_seconds"] == 0.0 and stats["done"] == 3, stats)
+    check(lag["count"] == 3 and lag["p50"] >= 0.3, lag)
+
+
+def poison(faults):
+    # A resolve that raises or finds no topic backs off, then ends with the
+    # error, without holding up other students' jobs
+    def resolve(items):
+        if any(course_id == "broken" for course_id, _ in items):
+            raise KeyError("broken")
+        return [(None, []) for _ in items]
+
+    queue, workers = fresh("poison", workers=1, max_attempts=2)
+    workers.resolve = resolve
+    broken, _ = queue.enqueue("poison", "Question 1?", DEFAULT_ANSWER, True, course_id="broken")
+    later, _ = enqueue(queue, "poison", 2, understood=True)
+    untopical, _ = queue.enqueue("poison-2", "Question 3?", DEFAULT_ANSWER, True)
+    fine, _ = enqueue(queue, "poison-3", 4, understood=True)
+    workers.run_once()
+    job = queue.get(broken)
+    check(job.status == "pending" and job.attempts == 1 and "KeyError" in job.error, job.to_dict())
+    check(queue.get(later).status == "pending" and queue.get(later).attempts == 0, "later job overtook")
+    check(queue.get(untopical).status == "pending" and queue.get(fine).status == "done", queue.stats())
+
+    time.sleep(0.25)
+    workers.run_once()
+    for key in (broken, untopical):
+        check(queue.get(key).status == "done" and queue.get(key).mastery is None, queue.get(key).to_dict())
+    check(queue.get(later).status == "done", queue.get(later).to_dict())
+    check(abs(get_store().get_mastery("poison", "disks") - expected_score([True])) < 1e-9, "mastery")
+    check(workers.stats()["errors"] == 4 and queue.stats()["depth"] == 0, workers.stats())
+
+
+SCENARIOS = {
+    "enqueue": enqueue_latency,
+    "batching": batching,
+    "idempotency": idempotency,
+    "retry": retry,
+    "give_up": give_up,
+    "recovery": crash_recovery,
+    "ordering": ordering,
+    "observe": observability,
+    "poison": poison,
+}
+
+
+def run(names, faults):
+    failed = 0
+    for name in names:
+        faults.update({"reset": True, "first_token_delay": 0.0, "token_delay": 0.0, "error_rate": 0.0, "fail_next": 0})
+        start = time.perf_counter()
+        try:
+            SCENARIOS[name](faults)
+            status = "PASS"
+        except Exception as exc:
+            failed += 1
+            status = f"FAIL  {type(exc).__name__}: {exc}"
+        print(f"{name:>12}  {time.perf_counter() - start:5.2f}s  {status}")
+    return failed
+
+
+def main():
+    names = sys.argv[1:] or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios {unknown}; choose from {list(SCENARIOS)}")
+
+    server = make_server(port=PORT, token_delay=0.0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        failed = run(names, server.RequestHandlerClass.config.faults)
+    finally:
+        server.shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
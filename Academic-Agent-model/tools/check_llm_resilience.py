@@ -0,0 +1,230 @@
+"""Exercise models/llmProvider.py against the fake LLM with injected faults.
+
+Starts tools/fake_openai_server.py in-process and runs each scenario (retry,
+fallback, circuit breaker, hedging, deadlines, stalls) with short timeouts:
+
+    python tools/check_llm_resilience.py
+    python tools/check_llm_resilience.py hedge breaker     # only some
+
+Prints one PASS/FAIL line per scenario and exits non-zero on any failure.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+PORT = int(os.getenv("FAKE_LLM_PORT", 9031))
+os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{PORT}/v1"
+os.environ.setdefault("OPENROUTER_API_KEY", "fake")
+
+from models import llm
+from models.llmProvider import LLMProvider, LLMUnavailable
+from tools.fake_openai_server import DEFAULT_ANSWER, make_server
+
+PRIMARY, BACKUP = "primary", "backup"
+
+
+def provider(**options):
+    settings = dict(timeout=5, first_token_timeout=2, idle_timeout=1, max_retries=2, hedge=False, hedge_delay=3)
+    settings.update(options)
+    return LLMProvider([PRIMARY, BACKUP], llm.get_client, llm.get_async_client, **settings)
+
+
+async def answer(p, prompt="What is a cylinder?"):
+    stream = await p.astream(prompt)
+    return stream.model, "".join([delta async for delta in stream])
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+async def healthy(faults):
+    p = provider()
+    model, text = await answer(p)
+    check(model == PRIMARY and text == DEFAULT_ANSWER, f"got {model}: {text!r}")
+    check(p.model_stats[PRIMARY].first_token.count == 1, "first-token latency not recorded")
+    check(p.model_stats[PRIMARY].duration.count == 1, "stream duration not recorded")
+
+
+async def retry(faults):
+    faults.update({"models": {PRIMARY: {"fail_next": 2, "error_status": 503}}})
+    p = provider()
+    model, text = await answer(p)
+    check(model == PRIMARY and text == DEFAULT_ANSWER, f"answered by {model}")
+    check(faults.state()["requests"].get(PRIMARY) == 3, f"requests {faults.state()['requests']}")
+
+
+async def fallback(faults):
+    faults.update({"models": {PRIMARY: {"error_rate": 1.0, "error_status": 502}}})
+    p = provider()
+    model, text = await answer(p)
+    requests = faults.state()["requests"]
+    check(model == BACKUP and text == DEFAULT_ANSWER, f"answered by {model}")
+    check(requests.get(PRIMARY) == 3 and requests.get(BACKUP) == 1, f"requests {requests}")
+
+
+async def next_model_on_400(faults):
+    faults.update({"models": {PRIMARY: {"error_rate": 1.0, "error_status": 400}}})
+    p = provider()
+    model, _ = await answer(p)
+    requests = faults.state()["requests"]
+    check(model == BACKUP and requests.get(PRIMARY) == 1, f"{model}, requests {requests}")
+    check(p.breakers[PRIMARY].failures == 0, "a 400 must not count against the breaker")
+
+
+async def fatal_on_401(faults):
+    faults.update({"error_rate": 1.0, "error_status": 401})
+    p = provider()
+    try:
+        await answer(p)
+    except LLMUnavailable as exc:
+        raise AssertionError(f"expected the auth error itself, got {exc}")
+    except Exception as exc:
+        check(getattr(exc, "status_code", None) == 401, f"got {exc!r}")
+    else:
+        raise AssertionError("no error raised")
+    check(faults.state()["requests"].get(BACKUP) is None, "fell back despite an auth error")
+
+
+async def breaker(faults):
+    faults.update({"models": {PRIMARY: {"error_rate": 1.0, "error_status": 503}}})
+    p = provider(max_retries=0)
+    for breaker_state in p.breakers.values():
+        breaker_state.threshold, breaker_state.cooldown = 3, 0.5
+
+    for _ in range(5):
+        model, _ = await answer(p)
+        check(model == BACKUP, f"answered by {model}")
+    requests = faults.state()["requests"]
+    check(requests.get(PRIMARY) == 3, f"breaker let {requests.get(PRIMARY)} requests through, expected 3")
+    check(p.breakers[PRIMARY].state == "open", p.breakers[PRIMARY].state)
+
+    # After the cooldown one probe goes through; the primary has recovered
+    faults.update({"models": {PRIMARY: {"error_rate": 0.0}}})
+    await asyncio.sleep(0.6)
+    model, _ = await answer(p)
+    check(model == PRIMARY, f"probe answered by {model}")
+    check(p.breakers[PRIMARY].state == "closed", p.breakers[PRIMARY].state)
+
+
+async def hedge(faults):
+    faults.update({"models": {PRIMARY: {"first_token_delay": 1.5}}})
+    p = provider(hedge=True, hedge_delay=0.2)
+    start = time.perf_counter()
+    model, text = await answer(p)
+    elapsed = time.perf_counter() - start
+    check(model == BACKUP and text == DEFAULT_ANSWER, f"answered by {model}")
+    check(elapsed < 1.0, f"hedged answer took {elapsed:.2f}s")
+    check(p.model_stats[PRIMARY].hedged == 1 and p.model_stats[BACKUP].hedge_wins == 1, "hedge not counted")
+
+
+async def hedge_after_p95(faults):
+    # Once enough samples exist the hedge fires at the primary's own p95
+    faults.update({"models": {PRIMARY: {"first_token_delay": 0.05}}})
+    p = provider(hedge=True, hedge_delay=10)
+    for _ in range(20):
+        await answer(p)
+    p95 = p._hedge_after(PRIMARY)
+    check(0.04 < p95 < 0.5, f"p95 {p95}")
+    faults.update({"models": {PRIMARY: {"first_token_delay": 2.0}}})
+    start = time.perf_counter()
+    model, _ = await answer(p)
+    check(model == BACKUP and time.perf_counter() - start < 1.0, f"{model} after {time.perf_counter() - start:.2f}s")
+
+
+async def deadline(faults):
+    faults.update({"first_token_delay": 3.0})
+    p = provider(timeout=1.5, first_token_timeout=0.4)
+    start = time.perf_counter()
+    try:
+        await answer(p)
+    except LLMUnavailable:
+        pass
+    else:
+        raise AssertionError("no LLMUnavailable")
+    elapsed = time.perf_counter() - start
+    check(elapsed < 2.0, f"gave up after {elapsed:.2f}s, deadline 1.5s")
+
+
+async def stall(faults):
+    faults.update({"models": {PRIMARY: {"stall_after": 3, "stall_delay": 3.0}}})
+    p = provider(idle_timeout=0.3)
+    stream = await p.astream("q")
+    received = []
+    try:
+        async for delta in stream:
+            received.append(delta)
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("stalled stream did not time out")
+    check(len(received) == 3, f"received {len(received)} deltas before the stall")
+    check(p.model_stats[PRIMARY].failures.get("timeout") == 1, p.model_stats[PRIMARY].failures)
+
+
+async def blocking(faults):
+    faults.update({"models": {PRIMARY: {"error_rate": 1.0, "error_status": 503}}})
+    p = provider(max_retries=1)
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, p.complete, "q")
+    check(text == DEFAULT_ANSWER, text)
+    stream = await loop.run_in_executor(None, p.stream, "q")
+    check(stream.model == BACKUP, stream.model)
+    check("".join(await loop.run_in_executor(None, list, stream)) == DEFAULT_ANSWER, "sync stream text")
+
+
+SCENARIOS = {
+    "healthy": healthy,
+    "retry": retry,
+    "fallback": fallback,
+    "next_model": next_model_on_400,
+    "fatal": fatal_on_401,
+    "breaker": breaker,
+    "hedge": hedge,
+    "hedge_p95": hedge_after_p95,
+    "deadline": deadline,
+    "stall": stall,
+    "blocking": blocking,
+}
+
+
+async def run(names, faults):
+    failed = 0
+    for name in names:
+        faults.update({"reset": True, "first_token_delay": 0.0, "token_delay": 0.0, "error_rate": 0.0, "fail_next": 0})
+        start = time.perf_counter()
+        try:
+            await SCENARIOS[name](faults)
+            status = "PASS"
+        except Exception as exc:
+            failed += 1
+            status = f"FAIL  {type(exc).__name__}: {exc}"
+        print(f"{name:>12}  {time.perf_counter() - start:5.2f}s  {status}")
+    return failed
+
+
+def main():
+    names = sys.argv[1:] or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios {unknown}; choose from {list(SCENARIOS)}")
+
+    server = make_server(port=PORT, token_delay=0.0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        failed = asyncio.run(run(names, server.RequestHandlerClass.config.faults))
+    finally:
+        server.shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Export the embedding model for the NumPy backend and check parity.
+
+    python tools/export_static_encoder.py            # export, then verify
+    python tools/export_static_encoder.py --verify   # verify an existing export
+
+Verification encodes a fixed set of edge cases plus a sample of the
+ingested chunks with both SentenceTransformer and StaticEncoder and fails
+(exit status 1) if any embedding is outside --rtol/--atol of the reference
+or below --min-cosine. torch's EmbeddingBag accumulates in float32 left to
+right while NumPy sums pairwise, so very long inputs differ by ~1e-5
+relative (NumPy being the closer of the two). Run it after upgrading
+sentence-transformers or changing the model, before switching
+EMBED_BACKEND=static.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from models.llm_model import EMBED_MODEL_NAME, STATIC_ENCODER_PATH, load_sentence_transformer
+from models.staticEncoder import StaticEncoder, export_static_encoder
+
+EDGE_CASES = [
+    "What is a disk cylinder?",
+    "what   is a DISK cylinder?",
+    "",
+    "   ",
+    "?!",
+    "zzqxj unknownword qwertyuiop",
+    "Café naïve résumé — “quoted” text, emoji 🚀 and 中文",
+    "seek " * 2000,
+    "Explain logical block addressing (LBA) vs. cylinder-head-sector (CHS) mapping.\nNew line\ttab",
+]
+
+
+def sample_texts(n_chunks):
+    from models.chunkStore import open_chunk_store
+    from models.vectorSnapshot import snapshot_path
+
+    texts = list(EDGE_CASES)
+    store = open_chunk_store(os.path.join(snapshot_path(os.path.join(BASE_DIR, "vector_db")), "chunks"))
+    if store is not None and len(store):
+        rng = np.random.default_rng(0)
+        ids = rng.choice(np.asarray(store.ids), size=min(n_chunks, len(store)), replace=False)
+        texts.extend(store.text(int(chunk_id)) for chunk_id in ids)
+    return texts
+
+
+def verify(reference, encoder, texts, rtol, atol, min_cosine):
+    for normalize in (False, True):
+        expected = reference.encode(texts, normalize_embeddings=normalize, convert_to_numpy=True)
+        actual = encoder.encode(texts, normalize_embeddings=normalize)
+        if expected.shape != actual.shape:
+            print(f"Shape mismatch: {expected.shape} vs {actual.shape}")
+            return False
+
+        diff = np.abs(expected - actual).max(axis=1)
+        norms = np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+        nonzero = norms > 0
+        cosine = (expected * actual).sum(axis=1)[nonzero] / norms[nonzero]
+        print(
+            f"normalize={normalize}: {len(texts)} texts, max abs diff {diff.max():.2e} "
+            f"(worst: {texts[int(diff.argmax())][:40]!r}), min cosine {cosine.min() if cosine.size else 1.0:.7f}"
+        )
+        if not np.allclose(actual, expected, rtol=rtol, atol=atol) or (cosine.size and cosine.min() < min_cosine):
+            return False
+        # Inputs with no tokens must stay zero vectors in both backends
+        if not np.array_equal(np.linalg.norm(expected, axis=1) == 0, np.linalg.norm(actual, axis=1) == 0):
+            print("Zero-vector mismatch")
+            return False
+
+    single = encoder.encode(texts[0], normalize_embeddings=True)
+    if not np.allclose(single, encoder.encode([texts[0]], normalize_embeddings=True)[0]):
+        print("Single-string encode differs from batch encode")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the static embedding model to NumPy and verify parity")
+    parser.add_argument("--path", default=STATIC_ENCODER_PATH)
+    parser.add_argument("--verify", action="store_true", help="only verify an existing export")
+    parser.add_argument("--chunks", type=int, default=500, help="ingested chunks to include in the check")
+    parser.add_argument("--rtol", type=float, default=1e-4)
+    parser.add_argument("--atol", type=float, default=1e-5)
+    parser.add_argument("--min-cosine", type=float, default=0.99999)
+    args = parser.parse_args()
+
+    reference = load_sentence_transformer()
+    if not args.verify:
+        export_static_encoder(reference, args.path, EMBED_MODEL_NAME)
+        print(f"Exported {EMBED_MODEL_NAME} to {args.path}")
+
+    ok = verify(reference, StaticEncoder(args.path), sample_texts(args.chunks), args.rtol, args.atol, args.min_cosine)
+    print("Parity OK" if ok else "Parity FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
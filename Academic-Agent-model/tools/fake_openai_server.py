@@ -0,0 +1,297 @@
+"""Local stand-in for the OpenRouter chat completions API.
+
+Speaks enough of the OpenAI wire format (plain and ``stream=True`` SSE) for
+models/llm.py to run against it without network access:
+
+    python tools/fake_openai_server.py --port 9000 --token-delay 0.05
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1 OPENROUTER_API_KEY=fake python api_server.py
+
+Streams that the client abandons are logged as cancelled, which is how the
+disconnect handling of /chat can be checked by hand.
+
+Faults can be injected for resilience checks, globally or per model, at
+start-up (--error-rate, --first-token-delay, ...) or at runtime:
+
+    curl -X POST localhost:9000/control -d '{"models": {"primary": {"fail_next": 3, "error_status": 503}}}'
+    curl localhost:9000/control            # settings and per-model request/error counts
+
+Settings: first_token_delay, token_delay (seconds), error_rate (0-1),
+error_status, fail_next (fail the next N requests), stall_after and
+stall_delay (pause the stream after N tokens). {"reset": true} drops the
+per-model overrides and counters.
+
+A prompt asking for "a JSON array of exactly N strings" (the batched
+misconception detection) is answered with N numbered sentences.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAULT_SETTINGS = (
+    "first_token_delay",
+    "token_delay",
+    "error_rate",
+    "error_status",
+    "fail_next",
+    "stall_after",
+    "stall_delay",
+)
+
+JSON_ARRAY_REQUEST = re.compile(r"JSON array of exactly (\d+) strings")
+
+DEFAULT_ANSWER = (
+    "A disk cylinder is the set of tracks at the same arm position on every "
+    "platter. For example, track 5 on each surface forms cylinder 5, so the "
+    "drive can read all of them without moving the heads."
+)
+
+
+def split_tokens(text):
+    words = text.split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+def answer_for(body, default):
+    prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+    match = JSON_ARRAY_REQUEST.search(prompt)
+    if match is None:
+        return default
+    count = int(match.group(1))
+    return json.dumps([f"Misunderstanding {n} of {count}." for n in range(1, count + 1)])
+
+
+def usage(body, tokens):
+    # Rough count (4 characters per token), like models/llm.estimate_tokens
+    prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+    prompt_tokens = (len(prompt) + 3) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+    }
+
+
+class Faults:
+    """Fault settings (defaults plus per-model overrides) and counters."""
+
+    def __init__(self, seed=0, **defaults):
+        self.defaults = {
+            "first_token_delay": 0.0,
+            "token_delay": 0.02,
+            "error_rate": 0.0,
+            "error_status": 503,
+            "fail_next": 0,
+            "stall_after": None,
+            "stall_delay": 0.0,
+        }
+        self.defaults.update({k: v for k, v in defaults.items() if k in FAULT_SETTINGS})
+        self.models = {}
+        self.requests = {}
+        self.errors = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def update(self, changes):
+        with self._lock:
+            if changes.get("reset"):
+                self.models.clear()
+                self.requests.clear()
+                self.errors.clear()
+            self.defaults.update({k: v for k, v in changes.items() if k in FAULT_SETTINGS})
+            for model, settings in (changes.get("models") or {}).items():
+                self.models.setdefault(model, {}).update(
+                    {k: v for k, v in settings.items() if k in FAULT_SETTINGS}
+                )
+
+    def begin(self, model):
+        """(settings, error status or None) for one request to ``model``."""
+
+        with self._lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+            settings = dict(self.defaults, **self.models.get(model, {}))
+
+            scope = self.models[model] if "fail_next" in self.models.get(model, {}) else self.defaults
+            fail = False
+            if scope.get("fail_next"):
+                scope["fail_next"] -= 1
+                fail = True
+            elif settings["error_rate"] and self._rng.random() < settings["error_rate"]:
+                fail = True
+
+            if fail:
+                self.errors[model] = self.errors.get(model, 0) + 1
+                return settings, int(settings["error_status"])
+            return settings, None
+
+    def state(self):
+        with self._lock:
+            return {
+                "defaults": dict(self.defaults),
+                "models": {model: dict(settings) for model, settings in self.models.items()},
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+            }
+
+
+class FakeCompletionsHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, fmt, *args):
+        if not self.config.quiet:
+            super().log_message(fmt, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/control":
+            self.send_json(200, self.config.faults.state())
+        elif self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": self.config.model, "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.rstrip("/") == "/control":
+            self.config.faults.update(body)
+            self.send_json(200, self.config.faults.state())
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        model = body.get("model", self.config.model)
+        settings, error_status = self.config.faults.begin(model)
+
+        time.sleep(settings["first_token_delay"])
+
+        if error_status is not None:
+            self.send_json(error_status, {"error": {"message": "injected failure", "code": error_status}})
+            return
+
+        answer = answer_for(body, self.config.answer)
+        tokens = split_tokens(answer)
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self.stream_completion(model, tokens, usage(body, tokens) if include_usage else None, settings)
+        else:
+            time.sleep(settings["token_delay"] * len(tokens))
+            self.send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(body, tokens),
+            })
+
+    def stream_completion(self, model, tokens, usage=None, settings=None):
+        settings = settings or self.config.faults.defaults
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        sent = 0
+        try:
+            for token in tokens:
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                sent += 1
+                if sent == settings["stall_after"]:
+                    time.sleep(settings["stall_delay"])
+                time.sleep(settings["token_delay"])
+            if usage is not None:
+                # As OpenAI does with stream_options.include_usage: a final
+                # chunk with no choices
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"Stream cancelled by client after {sent}/{len(tokens)} tokens")
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(host="127.0.0.1", port=9000, **options):
+    config = argparse.Namespace(
+        model=options.get("model", "fake-model"),
+        answer=options.get("answer", DEFAULT_ANSWER),
+        faults=Faults(**options),
+        quiet=options.get("quiet", True),
+    )
+    handler = type("Handler", (FakeCompletionsHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--model", default="fake-model")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        model=args.model,
+        answer=args.answer,
+        token_delay=args.token_delay,
+        first_token_delay=args.first_token_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        quiet=not args.verbose,
+    )
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()